@@ -0,0 +1,287 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+from pathlib import Path
+from datetime import datetime
+
+from instrumentation import get_output_bytes
+from instrumentation import get_peak_rss_bytes
+
+
+REPO_DIR = Path(__file__).resolve().parent
+CASES = ['products', 'stores', 'transactions', 'coords']
+DEFAULT_SCALES = [1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+
+# Importing the entry point must stay within this many seconds, without
+# loading any of the heavy modules the generators import lazily.
+IMPORT_TIME_BUDGET = 1.0
+LAZY_MODULES = ['pandas', 'geopandas', 'shapely', 'faker', 'requests', 'forex_python',
+                'countryinfo', 'pycountry', 'pyarrow.dataset', 'torch', 'transformers']
+
+STUB_COUNTRY = 'Denmark'
+STUB_COUNTRY_DATA = ('DKK', 0.03, 0.15)
+STUB_REGIONS = ['Hovedstaden', 'Midtjylland', 'Nordjylland', 'Sjælland', 'Syddanmark']
+
+
+def stub_country_lookups() -> None:
+    """Replaces the country lookups of the generators with fixed values,
+       so the benchmarks never depend on the network or the reference data.
+    """
+    import products
+    import stores
+
+    os.environ['RETAIL_FAKER_OFFLINE'] = '1'
+    products.get_country_data = lambda country_name: STUB_COUNTRY_DATA
+    stores.get_regions = lambda country_name: (STUB_REGIONS, country_name)
+
+
+def run_case(case: str, numb_rows: int, value_pool_size: int, region: str) -> dict:
+    """Runs one benchmark case in the current process.
+
+    Parameters
+    ----------
+        case: one of `CASES`
+        numb_rows: the number of rows or points to generate
+        value_pool_size: the size of the Faker value pools, None to call
+                         Faker per row
+        region: the region used by the `coords` case
+
+    Returns
+    -------
+        result: the measurements of the case
+    """
+    stub_country_lookups()
+    output_path = None
+    if case == 'products':
+        from products import generate_random_product_data
+        start = time.perf_counter()
+        generate_random_product_data(STUB_COUNTRY, numb_rows, is_saved=True, seed=0,
+                                     value_pool_size=value_pool_size)
+        output_path = Path('retail_data/products.parquet')
+    elif case == 'stores':
+        from stores import generate_random_store_data
+        start = time.perf_counter()
+        generate_random_store_data(STUB_COUNTRY, numb_rows, is_saved=True, seed=0,
+                                   value_pool_size=value_pool_size)
+        output_path = Path('retail_data/stores.parquet')
+    elif case == 'transactions':
+        from products import generate_random_product_data
+        from stores import generate_random_store_data
+        from customers import generate_random_customer_data
+        from transactions import stream_random_transaction_data
+        generate_random_product_data(STUB_COUNTRY, 10_000, is_saved=True, seed=0,
+                                     value_pool_size=value_pool_size or 10_000)
+        generate_random_store_data(STUB_COUNTRY, 100, is_saved=True, seed=0,
+                                   value_pool_size=value_pool_size or 10_000)
+        generate_random_customer_data(STUB_COUNTRY, 10_000, is_saved=True, seed=0)
+        start = time.perf_counter()
+        output_path = stream_random_transaction_data(numb_rows, seed=0)
+    elif case == 'coords':
+        from helper_functions import generate_random_coords_in_region
+        start = time.perf_counter()
+        generate_random_coords_in_region(STUB_COUNTRY, region, numb_rows)
+    else:
+        raise ValueError(f"Unknown benchmark case {case}, expected one of {CASES}")
+    seconds = time.perf_counter() - start
+
+    return {
+        'case': case,
+        'rows': numb_rows,
+        'seconds': seconds,
+        'rows_per_sec': numb_rows / seconds if seconds > 0 else None,
+        'peak_rss_bytes': get_peak_rss_bytes(),
+        'peak_rss_children_bytes': get_peak_rss_bytes(resource.RUSAGE_CHILDREN),
+        'output_bytes': get_output_bytes(output_path) if output_path is not None else 0,
+    }
+
+
+def run_case_in_subprocess(case: str, numb_rows: int, value_pool_size: int,
+                           region: str, timeout: float) -> dict:
+    """Runs one benchmark case in a fresh interpreter and working folder,
+       so the peak memory and the caches of a case don't leak into the next.
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name in ('configs', 'shap'):
+            os.symlink(REPO_DIR / name, Path(work_dir) / name)
+        cache_dir = Path('.cache').resolve()
+        cache_dir.mkdir(exist_ok=True)
+        os.symlink(cache_dir, Path(work_dir) / '.cache')
+        command = [sys.executable, str(Path(__file__).resolve()), 'case', case, str(numb_rows),
+                   '--region', region]
+        if value_pool_size is not None:
+            command += ['--value-pool-size', str(value_pool_size)]
+        env = {**os.environ, 'PYTHONPATH': os.pathsep.join([str(REPO_DIR), os.environ.get('PYTHONPATH', '')])}
+        try:
+            completed = subprocess.run(command, cwd=work_dir, env=env, capture_output=True,
+                                       text=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return {'case': case, 'rows': numb_rows, 'error': f'timed out after {timeout}s'}
+    if completed.returncode != 0:
+        error = completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else 'failed'
+        return {'case': case, 'rows': numb_rows, 'error': error}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def measure_import_time(module: str = 'retail_faker', repeat: int = 5) -> dict:
+    """Imports a module in fresh interpreters and measures how long it takes.
+
+    Parameters
+    ----------
+        module: the module to import
+        repeat: the number of interpreters, the fastest import is kept so
+                the result doesn't depend on a cold disk cache
+
+    Returns
+    -------
+        result: the import time in seconds, the slowest modules it imported
+                and the `LAZY_MODULES` it loaded
+    """
+    script = (f'import sys, json, time\n'
+              f'start = time.perf_counter()\n'
+              f'import {module}\n'
+              f'seconds = time.perf_counter() - start\n'
+              f'print(json.dumps({{"seconds": seconds, "modules": sorted(sys.modules)}}))')
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join([str(REPO_DIR), os.environ.get('PYTHONPATH', '')])}
+    runs = []
+    for _ in range(repeat):
+        completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', script], cwd=REPO_DIR,
+                                   env=env, capture_output=True, text=True, check=True)
+        runs.append((json.loads(completed.stdout.strip().splitlines()[-1]), completed.stderr))
+    result, importtime = min(runs, key=lambda run: run[0]['seconds'])
+
+    # -X importtime lines are `import time: self [us] | cumulative | package`.
+    cumulative = {}
+    for line in importtime.splitlines():
+        fields = line.split('|')
+        if line.startswith('import time:') and fields[1].strip().isdigit():
+            cumulative[fields[2].strip()] = int(fields[1]) / 1e6
+    slowest = sorted(cumulative.items(), key=lambda item: -item[1])[:10]
+    return {
+        'module': module,
+        'seconds': result['seconds'],
+        'budget_seconds': IMPORT_TIME_BUDGET,
+        'slowest_modules': dict(slowest),
+        'lazy_modules_loaded': [name for name in LAZY_MODULES if name in result['modules']],
+    }
+
+
+def get_git_commit() -> str:
+    """Returns the current git commit of the repository, if any.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare_results(results: dict, baseline: dict, tolerance: float) -> list:
+    """Compares the throughput of two benchmark runs.
+
+    Parameters
+    ----------
+        results: the current benchmark results
+        baseline: the benchmark results to compare against
+        tolerance: the accepted relative drop of rows per second
+
+    Returns
+    -------
+        regressions: a list of messages, one per case and scale slower than
+                     the baseline by more than `tolerance`
+    """
+    baseline_rates = {(r['case'], r['rows']): r.get('rows_per_sec') for r in baseline['results']}
+    regressions = []
+    for result in results['results']:
+        old_rate = baseline_rates.get((result['case'], result['rows']))
+        new_rate = result.get('rows_per_sec')
+        if old_rate and new_rate and new_rate < old_rate * (1 - tolerance):
+            regressions.append(f"{result['case']} at {result['rows']:,} rows: "
+                               f"{new_rate:,.0f} rows/s against {old_rate:,.0f} rows/s")
+    return regressions
+
+
+def run_benchmarks(cases: list, scales: list, value_pool_size: int, region: str,
+                   timeout: float) -> dict:
+    """Runs every case at every scale, each in its own subprocess.
+
+    Returns
+    -------
+        results: the benchmark report
+    """
+    results = []
+    for case in cases:
+        for numb_rows in scales:
+            result = run_case_in_subprocess(case, numb_rows, value_pool_size, region, timeout)
+            print(json.dumps(result), flush=True)
+            results.append(result)
+    return {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': get_git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'value_pool_size': value_pool_size,
+        'results': results,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the retail data generators.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='run the benchmarks and save a JSON report')
+    run_parser.add_argument('--cases', nargs='+', default=CASES, choices=CASES)
+    run_parser.add_argument('--scales', nargs='+', type=int, default=DEFAULT_SCALES)
+    run_parser.add_argument('--value-pool-size', type=int, default=10_000,
+                            help='size of the Faker value pools, 0 to call Faker per row')
+    run_parser.add_argument('--region', default=STUB_REGIONS[0])
+    run_parser.add_argument('--timeout', type=float, default=3600)
+    run_parser.add_argument('--output', default=None, help='path of the JSON report')
+    run_parser.add_argument('--compare', default=None, help='a previous JSON report to compare with')
+    run_parser.add_argument('--tolerance', type=float, default=0.2)
+
+    case_parser = subparsers.add_parser('case', help='run a single case in this process')
+    case_parser.add_argument('case', choices=CASES)
+    case_parser.add_argument('rows', type=int)
+    case_parser.add_argument('--value-pool-size', type=int, default=None)
+    case_parser.add_argument('--region', default=STUB_REGIONS[0])
+
+    imports_parser = subparsers.add_parser(
+        'imports', help='check the import time of the entry point against its budget')
+    imports_parser.add_argument('--module', default='retail_faker')
+    imports_parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == 'imports':
+        result = measure_import_time(args.module, args.repeat)
+        print(json.dumps(result, indent=2))
+        if result['seconds'] > IMPORT_TIME_BUDGET or result['lazy_modules_loaded']:
+            print(f"Import of {args.module} over budget: {result['seconds']:.3f}s, "
+                  f"loaded {result['lazy_modules_loaded']}")
+            sys.exit(1)
+    elif args.command == 'case':
+        # Keep stdout for the JSON result, the generators' progress goes to stderr.
+        stdout, sys.stdout = sys.stdout, sys.stderr
+        result = run_case(args.case, args.rows, args.value_pool_size, args.region)
+        sys.stdout = stdout
+        print(json.dumps(result))
+    else:
+        value_pool_size = args.value_pool_size or None
+        report = run_benchmarks(args.cases, args.scales, value_pool_size, args.region, args.timeout)
+        output = Path(args.output or f"benchmarks/results-{datetime.now():%Y%m%d-%H%M%S}.json")
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2))
+        print(f'Benchmark results saved to {output}')
+        if args.compare:
+            regressions = compare_results(report, json.loads(Path(args.compare).read_text()),
+                                          args.tolerance)
+            for regression in regressions:
+                print(f'Regression: {regression}')
+            if regressions:
+                sys.exit(1)
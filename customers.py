@@ -0,0 +1,127 @@
+import numpy as np
+import pyarrow as pa
+from tqdm import tqdm
+from datetime import date, datetime, timedelta
+
+from helper_functions import save_table
+from helper_functions import table_to_pandas
+from helper_functions import get_chunk_tasks
+from value_pools import load_value_pools
+from value_pools import draw_from_pool
+from value_pools import generate_uuid4_array
+from instrumentation import phase
+
+
+CUSTOMER_SCHEMA = pa.schema([
+    ('customer_id', pa.string()),
+    ('name', pa.string()),
+    ('email', pa.string()),
+    ('address', pa.string()),
+    ('city', pa.string()),
+    ('country', pa.string()),
+    ('signup_date', pa.string()),
+    ('purchase_frequency', pa.float64()),
+])
+
+CUSTOMER_PROVIDERS = ['name', 'email', 'street_address', 'city']
+
+# Pareto shape of the purchase frequency, 1.16 gives the usual 80/20 split
+# where a fifth of the customers make most of the purchases.
+PURCHASE_FREQUENCY_SHAPE = 1.16
+
+
+def generate_customer_columns(country_name: str, numb_customers: int, value_pools: dict,
+                              rng: np.random.Generator, reference_date: date = None) -> dict:
+    """Generates the columns of `numb_customers` customers with NumPy.
+
+    Parameters
+    ----------
+        country_name: the country of the customers
+        numb_customers: the number of customers to generate
+        value_pools: the Faker value pools of `CUSTOMER_PROVIDERS`
+        rng: the random generator to use
+        reference_date: the last day of the signup dates, defaults to today
+
+    Returns
+    -------
+        columns: a dict mapping column names to Arrow or NumPy arrays
+    """
+    reference_date = reference_date or date.today()
+    signup_labels = [(reference_date - timedelta(days=d)).strftime('%Y-%m-%d')
+                     for d in range(5 * 365)]
+    return {
+        'customer_id': generate_uuid4_array(numb_customers, rng),
+        'name': draw_from_pool(value_pools['name'], numb_customers, rng),
+        'email': draw_from_pool(value_pools['email'], numb_customers, rng),
+        'address': draw_from_pool(value_pools['street_address'], numb_customers, rng),
+        'city': draw_from_pool(value_pools['city'], numb_customers, rng),
+        'country': pa.repeat(pa.scalar(country_name, pa.string()), numb_customers),
+        'signup_date': draw_from_pool(signup_labels, numb_customers, rng),
+        'purchase_frequency': rng.pareto(PURCHASE_FREQUENCY_SHAPE, numb_customers) + 1,
+    }
+
+
+def generate_random_customer_data(country_name: str,
+                                  numb_customers: int,
+                                  is_saved: bool = False,
+                                  chunk_size: int = 1_000_000,
+                                  seed: int = None,
+                                  shard_index: int = 0,
+                                  num_shards: int = 1,
+                                  value_pool_size: int = 10_000,
+                                  locale: str = 'en_US',
+                                  as_arrow: bool = False,
+                                  first_chunk: int = 0,
+                                  reference_date: date = None):
+    """Generates random customer data for a given country.
+
+    Each customer gets a `purchase_frequency` drawn from a power law,
+    which the basket generator uses to pick who buys, so a few customers
+    account for most of the transactions.
+
+    Parameters
+    ----------
+        country_name: the country to generate customer data for
+        numb_customers: the number of customers to generate
+        is_saved: whether to save the generated data as `customers.parquet`
+        chunk_size: the number of rows generated per chunk. The same seed
+                    and chunk size always give the same customers
+        seed: the seed of the run, a random one is used if None
+        shard_index: the index of the shard to generate
+        num_shards: the number of shards the rows are split into
+        value_pool_size: the number of Faker values per text field
+        locale: the Faker locale of the value pools
+        as_arrow: whether to return a pyarrow Table instead of a pandas
+                  DataFrame
+        first_chunk: the index of the first chunk, to continue the rows of
+                     a previous run with new seeds
+        reference_date: the last day of the signup dates, defaults to
+                        today. Runs that must give the same customers must
+                        share it
+
+    Returns
+    -------
+        customers: the generated customers as a pandas DataFrame or a
+                   pyarrow Table
+    """
+    if reference_date is None:
+        reference_date = date.today()
+    if isinstance(reference_date, datetime):
+        reference_date = reference_date.date()
+    value_pools = load_value_pools(CUSTOMER_PROVIDERS, value_pool_size, locale)
+    numb = f'{numb_customers:,}'.replace(',', ' ')
+
+    tasks = get_chunk_tasks(numb_customers, chunk_size, seed, 'customers', shard_index,
+                            num_shards, first_chunk)
+    batches = []
+    for start, stop, chunk_seed, _ in tqdm(tasks, desc=f"Generating {numb} customers data"):
+        with phase('generate_rows', stop - start):
+            columns = generate_customer_columns(country_name, stop - start, value_pools,
+                                                np.random.default_rng(chunk_seed),
+                                                reference_date)
+            batches.append(pa.RecordBatch.from_pydict(columns, schema=CUSTOMER_SCHEMA))
+
+    customers = pa.Table.from_batches(batches, CUSTOMER_SCHEMA)
+    if is_saved:
+        save_table(customers, 'customers.parquet')
+    return customers if as_arrow else table_to_pandas(customers)
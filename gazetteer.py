@@ -0,0 +1,244 @@
+import os
+import json
+import argparse
+import unicodedata
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from pathlib import Path
+from typing import NamedTuple
+
+
+GAZETTEER_PATH = 'configs/gazetteer.arrow'
+GAZETTEER_VERSION = '1'
+GAZETTEER_SCHEMA = pa.schema([
+    ('country_code', pa.string()),
+    ('subdivision', pa.string()),
+    ('city', pa.string()),
+    ('population', pa.int64()),
+])
+
+# The columns of the GeoNames `citiesXXX.txt` dumps used to build the gazetteer.
+GEONAMES_COLUMNS = {1: 'city', 6: 'feature_class', 8: 'country_code', 10: 'admin1_code',
+                    14: 'population'}
+GEONAMES_NUMB_COLUMNS = 19
+
+
+class Gazetteer(NamedTuple):
+    """The cities of each (country code, subdivision), as flat arrays.
+
+    The cities of a subdivision are the contiguous rows `start` to `stop`
+    of `cities`, sorted by decreasing population, where
+    `index[(country_code, normalize_name(subdivision))] = (group, start, stop)`.
+    `population_cdf[start:stop] - group` is the population CDF of the
+    subdivision. Shifting each subdivision by its group number keeps the
+    array sorted, so the cities of any subdivisions are drawn with a
+    single `searchsorted`.
+    """
+    cities: pa.Array
+    population_cdf: np.ndarray
+    index: dict
+
+
+_gazetteer_cache = {}
+
+
+def normalize_name(name: str) -> str:
+    """Returns a subdivision name without case, accents, spaces or
+       punctuation, so 'Île-de-France' and 'Ile de France' match.
+    """
+    name = unicodedata.normalize('NFKD', str(name)).casefold()
+    return ''.join(c for c in name if c.isalnum())
+
+
+def write_gazetteer(table: pa.Table, file_path: str=GAZETTEER_PATH) -> Path:
+    """Writes a gazetteer as an uncompressed Arrow IPC file of the cities
+       sorted by country, subdivision and decreasing population, with the
+       offsets of each subdivision in the schema metadata.
+
+    Parameters
+    ----------
+        table: the cities, with the columns of `GAZETTEER_SCHEMA`
+        file_path: the path of the gazetteer
+
+    Returns
+    -------
+        file_path: the path of the written gazetteer
+    """
+    table = table.select(GAZETTEER_SCHEMA.names).cast(GAZETTEER_SCHEMA)
+    table = table.sort_by([('country_code', 'ascending'), ('subdivision', 'ascending'),
+                           ('population', 'descending')])
+
+    index = []
+    country_codes = table['country_code'].to_pylist()
+    subdivisions = table['subdivision'].to_pylist()
+    start = 0
+    for k in range(1, len(country_codes) + 1):
+        if (k == len(country_codes) or country_codes[k] != country_codes[start]
+                or subdivisions[k] != subdivisions[start]):
+            index.append([country_codes[start], subdivisions[start], start, k])
+            start = k
+
+    metadata = {'version': GAZETTEER_VERSION, 'index': json.dumps(index)}
+    table = table.replace_schema_metadata(metadata).combine_chunks()
+    file_path = Path(file_path)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = file_path.with_name(f'{file_path.name}.{os.getpid()}.tmp')
+    with pa.OSFile(str(tmp_path), 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=len(table) or None)
+    os.replace(tmp_path, file_path)
+    _gazetteer_cache.pop(file_path.resolve(), None)
+    return file_path
+
+
+def build_gazetteer(cities_path: str, admin1_path: str, file_path: str=GAZETTEER_PATH,
+                    min_population: int=0) -> Path:
+    """Builds the gazetteer from the GeoNames dumps, e.g. `cities1000.txt`
+       and `admin1CodesASCII.txt` from https://download.geonames.org/export/dump/.
+
+    The GeoNames subdivision names are replaced by the names pycountry
+    gives the same subdivisions when they match, as the stores draw their
+    regions from pycountry.
+
+    Parameters
+    ----------
+        cities_path: the GeoNames cities dump
+        admin1_path: the GeoNames first level subdivisions
+        file_path: the path of the gazetteer
+        min_population: the minimum population of the cities to keep
+
+    Returns
+    -------
+        file_path: the path of the written gazetteer
+    """
+    import pycountry
+    import pyarrow.csv as pacsv
+
+    read_options = pacsv.ReadOptions(column_names=[str(k) for k in range(GEONAMES_NUMB_COLUMNS)])
+    parse_options = pacsv.ParseOptions(delimiter='\t', quote_char=False)
+    convert_options = pacsv.ConvertOptions(include_columns=[str(k) for k in GEONAMES_COLUMNS],
+                                           column_types={'14': pa.int64()})
+    cities = pacsv.read_csv(cities_path, read_options, parse_options, convert_options)
+    cities = cities.rename_columns([GEONAMES_COLUMNS[int(name)] for name in cities.column_names])
+    cities = cities.filter(pc.and_(pc.equal(cities['feature_class'], 'P'),
+                                   pc.greater_equal(cities['population'], min_population)))
+
+    admin1_names = {}
+    with open(admin1_path, encoding='utf-8') as file:
+        for line in file:
+            code, name = line.rstrip('\n').split('\t')[:2]
+            admin1_names[code] = name
+    pycountry_names = {}
+    for subdivision in pycountry.subdivisions:
+        if subdivision.parent_code is None:
+            pycountry_names[(subdivision.country_code, normalize_name(subdivision.name))] = subdivision.name
+
+    country_codes = cities['country_code'].to_pylist()
+    subdivisions = []
+    for country_code, admin1_code in zip(country_codes, cities['admin1_code'].to_pylist()):
+        name = admin1_names.get(f'{country_code}.{admin1_code}', admin1_code)
+        subdivisions.append(pycountry_names.get((country_code, normalize_name(name)), name))
+    table = pa.table({'country_code': cities['country_code'],
+                      'subdivision': pa.array(subdivisions, pa.string()),
+                      'city': cities['city'],
+                      'population': cities['population']})
+    return write_gazetteer(table, file_path)
+
+
+def load_gazetteer(file_path: str=GAZETTEER_PATH) -> Gazetteer:
+    """Memory-maps the gazetteer, once per process.
+
+    Parameters
+    ----------
+        file_path: the path of the gazetteer
+
+    Returns
+    -------
+        gazetteer: the gazetteer, or None if there is none
+    """
+    file_path = Path(file_path).resolve()
+    if file_path in _gazetteer_cache:
+        return _gazetteer_cache[file_path]
+    if not file_path.exists():
+        _gazetteer_cache[file_path] = None
+        return None
+
+    table = pa.ipc.open_file(pa.memory_map(str(file_path), 'r')).read_all()
+    metadata = table.schema.metadata or {}
+    if metadata.get(b'version', b'').decode() != GAZETTEER_VERSION:
+        print(f"Ignoring gazetteer {file_path} with version {metadata.get(b'version')!r}")
+        _gazetteer_cache[file_path] = None
+        return None
+
+    entries = json.loads(metadata[b'index'])
+    starts = np.array([entry[2] for entry in entries], dtype=np.int64)
+    stops = np.array([entry[3] for entry in entries], dtype=np.int64)
+    # Cities without a population still get a small chance to be drawn.
+    weights = np.maximum(table['population'].to_numpy(), 1).astype(np.float64)
+    cumsum = np.cumsum(weights)
+    before = np.concatenate([[0.0], cumsum])[starts]
+    totals = cumsum[stops - 1] - before
+    lengths = stops - starts
+    group = np.repeat(np.arange(len(entries)), lengths)
+    population_cdf = (cumsum - np.repeat(before, lengths)) / np.repeat(totals, lengths) + group
+
+    index = {(country_code, normalize_name(subdivision)): (k, start, stop)
+             for k, (country_code, subdivision, start, stop) in enumerate(entries)}
+    gazetteer = Gazetteer(table['city'].combine_chunks(), population_cdf, index)
+    _gazetteer_cache[file_path] = gazetteer
+    return gazetteer
+
+
+def get_cities(gazetteer: Gazetteer, country_code: str, subdivision: str) -> pa.Array:
+    """Returns the cities of a subdivision, from the most populated, or
+       None if the subdivision is not in the gazetteer.
+    """
+    entry = gazetteer.index.get((country_code, normalize_name(subdivision)))
+    if entry is None:
+        return None
+    _, start, stop = entry
+    return gazetteer.cities[start:stop]
+
+
+def sample_cities(gazetteer: Gazetteer, country_code: str, region_names,
+                  rng: np.random.Generator) -> pa.Array:
+    """Draws a city in the region of each row, weighted by population.
+
+    Parameters
+    ----------
+        gazetteer: the gazetteer
+        country_code: the ISO 3166-1 alpha 2 code of the country
+        region_names: the region of each row
+        rng: the random generator to use
+
+    Returns
+    -------
+        cities: an Arrow array with the city of each row, null for the rows
+                whose region is not in the gazetteer
+    """
+    names, inverse = np.unique(np.asarray(region_names, dtype=object), return_inverse=True)
+    groups = np.array([gazetteer.index.get((country_code, normalize_name(name)), (-1,))[0]
+                       for name in names], dtype=np.int64)[inverse]
+    is_known = groups >= 0
+    positions = np.searchsorted(gazetteer.population_cdf,
+                                groups[is_known] + rng.random(is_known.sum()), side='right')
+    positions = positions.clip(max=len(gazetteer.population_cdf) - 1)
+    indices = np.full(len(groups), -1, dtype=np.int64)
+    indices[is_known] = positions
+    return gazetteer.cities.take(pa.array(indices, mask=~is_known))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Manage the city gazetteer.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help='build the gazetteer from GeoNames dumps')
+    build_parser.add_argument('cities', help='a GeoNames cities dump, e.g. cities1000.txt')
+    build_parser.add_argument('admin1', help='the GeoNames admin1CodesASCII.txt')
+    build_parser.add_argument('--min-population', type=int, default=0)
+    build_parser.add_argument('--file-path', default=GAZETTEER_PATH)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        saved_to = build_gazetteer(args.cities, args.admin1, args.file_path, args.min_population)
+        print(f'Gazetteer saved to {saved_to}')
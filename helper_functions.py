@@ -1,49 +1,685 @@
 import time
+import zlib
+import shutil
 import yaml
 import random
-import requests
-import pycountry
-import pandas as pd
+import numpy as np
 import pyarrow as pa
-import geopandas as gpd
 from pathlib import Path
+import pyarrow.csv as pacsv
 import pyarrow.parquet as pq
+import multiprocessing as mp
 from datetime import datetime
-from shapely.geometry import Point
-from countryinfo import CountryInfo
-from forex_python.converter import CurrencyRates
+from collections import deque
+from typing import NamedTuple, TYPE_CHECKING
 
-from ydata_profiling import ProfileReport
-from weasyprint import HTML
+from instrumentation import count
+from instrumentation import instrumented
+from instrumentation import get_output_bytes
+from pricing import PRICE_DISTRIBUTIONS
+from pricing import DEFAULT_PRICE_DISTRIBUTION
+from shared_arrays import shared_pickle
+from shared_arrays import load_pickle
 
-def get_product_names():
-    """Get a list of product names from the Seq2Seq
+# pandas, shapely, geopandas, Faker and the network clients are imported by
+# the functions using them, so importing the generators stays fast.
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+PARQUET_COMPRESSION = 'zstd'
+PARQUET_COMPRESSION_LEVEL = 3
+PARQUET_PAGE_SIZE = 1024 * 1024
+ROW_GROUP_SIZE = 1_000_000
+# The rows buffered per partition before a row group is written. The
+# buffers of all the open partitions are held in memory at once.
+PARTITION_ROW_GROUP_SIZE = 10_000
+
+# The name of the part file of chunk `k` in a dataset folder.
+PART_NAME = 'part-{:08d}.parquet'
+
+# The output formats, picked from the extension of the output file.
+OUTPUT_FORMATS = ['parquet', 'csv']
+
+# Low cardinality string columns, stored as Arrow dictionaries so readers
+# get them back as categoricals.
+DICTIONARY_COLUMNS = ['category', 'subcategory', 'currency', 'store_type',
+                      'country', 'state_or_Province', 'city']
+
+def get_product_names(names_per_pair: int=50, quantize: bool=False) -> tuple:
+    """Get the product names of every subcategory from the Seq2Seq
        model.
+
+    The names are cached on disk, see `product_names.load_product_name_pool`.
+
+    Parameters
+    ----------
+        names_per_pair: the number of names sampled per subcategory
+        quantize: whether to apply dynamic int8 quantization to the model
+
+    Returns
+    -------
+        names: a flat array of product names
+        offsets: the names of subcategory `k` of the product catalog are
+                 `names[offsets[k]:offsets[k + 1]]`
     """
-    ...
+    from product_names import load_product_name_pool
+
+    return load_product_name_pool(names_per_pair, quantize=quantize)
+
+
+def is_string_type(data_type: pa.DataType) -> bool:
+    """Returns whether `data_type` is an Arrow string or large string.
+    """
+    return pa.types.is_string(data_type) or pa.types.is_large_string(data_type)
+
+
+def dictionary_schema(schema: pa.Schema, columns: list=DICTIONARY_COLUMNS) -> pa.Schema:
+    """Returns `schema` with the string `columns` as dictionary columns.
+    """
+    fields = [pa.field(field.name, pa.dictionary(pa.int32(), field.type))
+              if field.name in columns and is_string_type(field.type) else field
+              for field in schema]
+    return pa.schema(fields)
+
+
+def encode_dictionary_columns(data, columns: list=DICTIONARY_COLUMNS):
+    """Dictionary encodes the string `columns` of a Table or RecordBatch.
+    """
+    arrays = [column.dictionary_encode()
+              if name in columns and is_string_type(column.type) else column
+              for name, column in zip(data.schema.names, data.columns)]
+    return type(data).from_arrays(arrays, names=data.schema.names)
+
+
+def get_parquet_options(compression_level: int=PARQUET_COMPRESSION_LEVEL,
+                        page_size: int=PARQUET_PAGE_SIZE) -> dict:
+    """Returns the parquet writer options shared by every output file.
+
+    Every column is dictionary encoded, parquet falls back to plain
+    encoding for the columns whose dictionary grows too large. Statistics
+    are written for every column so scans can skip row groups.
+
+    Parameters
+    ----------
+        compression_level: the zstd compression level
+        page_size: the target size in bytes of the data pages
+
+    Returns
+    -------
+        options: keyword arguments of `pq.ParquetWriter` and of
+                 `ds.ParquetFileFormat.make_write_options`
+    """
+    return {
+        'compression': PARQUET_COMPRESSION,
+        'compression_level': compression_level,
+        'use_dictionary': True,
+        'write_statistics': True,
+        'data_page_size': page_size,
+    }
 
 
-def save_data(df: pd.DataFrame, file_path: str) -> None:
+def get_output_format(file_path) -> str:
+    """Returns the format of an output from its extension, one of
+       `OUTPUT_FORMATS`.
+    """
+    output_format = Path(file_path).suffix.lstrip('.')
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output {file_path}, expected one of the extensions "
+                         f"{OUTPUT_FORMATS}")
+    return output_format
+
+
+def remove_output(save_to: Path) -> None:
+    """Removes a previous output, file or partitioned dataset.
+    """
+    if save_to.is_dir():
+        shutil.rmtree(save_to)
+    elif save_to.exists():
+        save_to.unlink()
+
+
+def remove_stale_parts(save_to: Path, basename_template: str, shard_prefixes: list) -> None:
+    """Removes the part files a sharded run replaces from every partition
+       of a dataset folder.
+
+    Each shard removes its own previous parts, named after its
+    `basename_template`, and the parts of no shard of the run, e.g. those
+    of a run with other shards. The parts of the other shards of the run
+    are left to them, so shards never remove the files of each other,
+    whatever order they run in.
+
+    Parameters
+    ----------
+        save_to: the folder of the dataset
+        basename_template: the file names of the shard, e.g.
+                           'part-00000004-{i}.parquet'
+        shard_prefixes: the file name prefixes of all the shards of the run,
+                        e.g. ['part-00000000-', 'part-00000004-']
+    """
+    own_prefix = basename_template.split('{i}')[0]
+    for part_path in save_to.rglob('*'):
+        name = part_path.name
+        if part_path.is_file() and (name.startswith(own_prefix)
+                                    or not name.startswith(tuple(shard_prefixes))):
+            part_path.unlink(missing_ok=True)
+
+
+def write_partitioned_dataset(data, save_to: Path, schema: pa.Schema, partition_cols: list,
+                              row_group_size: int=ROW_GROUP_SIZE,
+                              compression_level: int=PARQUET_COMPRESSION_LEVEL,
+                              page_size: int=PARQUET_PAGE_SIZE,
+                              basename_template: str=None) -> None:
+    """Writes a Hive partitioned parquet or csv dataset, as in
+       `save_to/date=2024-01-31/part-0.parquet`.
+
+    The partition columns are stored in the folder names only, so engines
+    such as Spark or DuckDB prune whole files on them.
+
+    Parameters
+    ----------
+        data: a Table, or an iterable of RecordBatch
+        save_to: the folder of the dataset
+        schema: the schema of the data
+        partition_cols: the columns to partition by
+        row_group_size: the maximum number of rows per row group
+        compression_level: the zstd compression level
+        page_size: the target size in bytes of the parquet data pages
+        basename_template: the file names in each partition, e.g.
+                           'part-00001-{i}.parquet'. Shards writing to the
+                           same dataset must use different templates
+    """
+    # pyarrow.dataset loads pandas, it is only imported for partitioned outputs.
+    import pyarrow.dataset as ds
+
+    if get_output_format(save_to) == 'csv':
+        file_format = ds.CsvFileFormat()
+        file_options = file_format.make_write_options()
+    else:
+        file_format = ds.ParquetFileFormat()
+        file_options = file_format.make_write_options(**get_parquet_options(compression_level,
+                                                                                page_size))
+    ds.write_dataset(data, save_to, schema=schema, format=file_format,
+                     file_options=file_options,
+                     partitioning=partition_cols, partitioning_flavor='hive',
+                     basename_template=basename_template or f'part-{{i}}{Path(save_to).suffix}',
+                     min_rows_per_group=min(row_group_size, PARTITION_ROW_GROUP_SIZE),
+                     max_rows_per_group=row_group_size,
+                     max_partitions=4096,
+                     existing_data_behavior='overwrite_or_ignore')
+
+
+@instrumented('write')
+def save_table(table: pa.Table, file_path: str, partition_cols: list=None,
+               row_group_size: int=ROW_GROUP_SIZE,
+               compression_level: int=PARQUET_COMPRESSION_LEVEL,
+               page_size: int=PARQUET_PAGE_SIZE) -> Path:
     """Creates a folder `retail_data` if it doesn't exist.
-         Then saves the data in the folder as in :
+         Then saves the table in the folder as in :
             retail_data/`file_name.parquet`.
 
+    The `DICTIONARY_COLUMNS` are dictionary encoded and the file is
+    compressed with zstd. A `file_path` ending in `.csv` is written as
+    plain csv instead.
+
+    Parameters
+    ----------
+        table: the data as a pyarrow Table
+        file_path: the name of the file to write in `retail_data`
+        partition_cols: the columns to partition by. If given, `file_path`
+                        is written as a Hive partitioned dataset folder
+        row_group_size: the number of rows per parquet row group
+        compression_level: the zstd compression level
+        page_size: the target size in bytes of the parquet data pages
+
+    Returns
+    -------
+        save_to: the path of the written file or folder
+    """
+    folder_path = Path('retail_data')
+    if not folder_path.exists():
+        folder_path.mkdir()
+    save_to = folder_path / file_path
+    is_csv = get_output_format(save_to) == 'csv'
+    if not is_csv:
+        table = encode_dictionary_columns(table)
+    remove_output(save_to)
+    if partition_cols:
+        write_partitioned_dataset(table, save_to, table.schema, partition_cols,
+                                  row_group_size, compression_level, page_size)
+    elif is_csv:
+        pacsv.write_csv(table, save_to)
+    else:
+        pq.write_table(table, save_to, row_group_size=row_group_size,
+                       **get_parquet_options(compression_level, page_size))
+    count('rows', table.num_rows)
+    count('bytes', get_output_bytes(save_to))
+    return save_to
+
+
+def save_data(df: 'pd.DataFrame', file_path: str, partition_cols: list=None,
+              row_group_size: int=ROW_GROUP_SIZE,
+              compression_level: int=PARQUET_COMPRESSION_LEVEL,
+              page_size: int=PARQUET_PAGE_SIZE) -> Path:
+    """Saves a pandas DataFrame as `retail_data/file_name.parquet`, without
+       its index. See `save_table`.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    return save_table(table, file_path, partition_cols, row_group_size, compression_level,
+                      page_size)
+
+
+def convert_to_dataset(save_to: Path) -> Path:
+    """Turns a single parquet file into a dataset folder of the same name
+       holding the file as its first part, so parts can be added to it.
+       The file is moved, not rewritten.
+
+    Parameters
+    ----------
+        save_to: the path of the parquet file or dataset folder
+
+    Returns
+    -------
+        save_to: the path of the dataset folder
+    """
+    if save_to.is_file():
+        moved_to = save_to.with_name(save_to.name + '.tmp')
+        save_to.rename(moved_to)
+        save_to.mkdir()
+        moved_to.rename(save_to / 'part-initial.parquet')
+    save_to.mkdir(parents=True, exist_ok=True)
+    return save_to
+
+
+@instrumented('write')
+def append_table(table: pa.Table, file_path: str, part_name: str,
+                 compression_level: int=PARQUET_COMPRESSION_LEVEL,
+                 page_size: int=PARQUET_PAGE_SIZE) -> Path:
+    """Adds a table as a new part of the dataset `retail_data/file_path`,
+       without reading or rewriting the existing parts.
+
+    Parameters
+    ----------
+        table: the rows to add
+        file_path: the name of the dataset in `retail_data`
+        part_name: the name of the new part file, unique in the dataset
+        compression_level: the zstd compression level
+        page_size: the target size in bytes of the parquet data pages
+
+    Returns
+    -------
+        part_path: the path of the written part
+    """
+    save_to = convert_to_dataset(Path('retail_data') / file_path)
+    part_path = save_to / part_name
+    pq.write_table(encode_dictionary_columns(table), part_path,
+                   **get_parquet_options(compression_level, page_size))
+    count('rows', table.num_rows)
+    count('bytes', get_output_bytes(part_path))
+    return part_path
+
+
+@instrumented('dataframe_build')
+def table_to_pandas(table: pa.Table) -> 'pd.DataFrame':
+    """Converts a generated table to pandas.
+
+    Each column gets its own block, so numeric columns are not copied into
+    a consolidated 2D block, and the Arrow buffers are released column by
+    column, so the table and the DataFrame are not both fully in memory.
+    The table can't be used after the conversion.
+
+    Parameters
+    ----------
+        table: the pyarrow Table to convert
+
+    Returns
+    -------
+        df: the table as a pandas DataFrame
+    """
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+@instrumented('write')
+def save_batches(batches, file_path: str, schema: pa.Schema,
+                 row_group_size: int = ROW_GROUP_SIZE,
+                 partition_cols: list = None,
+                 compression_level: int = PARQUET_COMPRESSION_LEVEL,
+                 page_size: int = PARQUET_PAGE_SIZE,
+                 basename_template: str = None,
+                 shard_prefixes: list = None) -> Path:
+    """Streams record batches to `retail_data/file_name.parquet` through a
+       single ParquetWriter.
+
+    Batches are buffered until `row_group_size` rows are available, then
+    written out as one row group, so memory stays bounded by the row group
+    size whatever the total number of rows is.
+
+    A `file_path` ending in `.csv` is streamed through a CSVWriter instead.
+    With `partition_cols` the batches are written as a Hive partitioned
+    dataset. Each partition buffers `PARTITION_ROW_GROUP_SIZE`
+    rows before writing a row group, so memory is bounded by the number of
+    partitions times that size.
+
     Parameters
     ----------
-        df: the data as a pandas DataFrame
+        batches: an iterable of pyarrow RecordBatch
+        file_path: the name of the file to write in `retail_data`
+        schema: the schema shared by all the batches
+        row_group_size: the number of rows per parquet row group
+        partition_cols: the columns to partition by, if any
+        compression_level: the zstd compression level
+        page_size: the target size in bytes of the parquet data pages
+        basename_template: the file names in each partition, for shards
+                           writing to the same dataset. A previous dataset
+                           is only removed when it is None, otherwise the
+                           parts are added to it
+        shard_prefixes: with `basename_template`, the file name prefixes of
+                        all the shards of a run replacing the dataset. The
+                        parts of a previous run are then removed, each shard
+                        removing its own ones, see `remove_stale_parts`
 
     Returns
     -------
-        None
+        save_to: the path of the written file or folder
     """
     folder_path = Path('retail_data')
     if not folder_path.exists():
         folder_path.mkdir()
-    table = pa.Table.from_pandas(df)
     save_to = folder_path / file_path
-    pq.write_table(table, save_to)
-    return
+    if not partition_cols or basename_template is None:
+        remove_output(save_to)
+    elif shard_prefixes is not None:
+        if save_to.is_file():
+            save_to.unlink(missing_ok=True)
+        save_to.mkdir(parents=True, exist_ok=True)
+        remove_stale_parts(save_to, basename_template, shard_prefixes)
+    else:
+        convert_to_dataset(save_to)
+    previous_bytes = get_output_bytes(save_to)
+
+    is_csv = get_output_format(save_to) == 'csv'
+    if not is_csv:
+        schema = dictionary_schema(schema)
+        batches = (encode_dictionary_columns(batch) for batch in batches)
+    if partition_cols:
+        write_partitioned_dataset(batches, save_to, schema, partition_cols, row_group_size,
+                                  compression_level, page_size, basename_template)
+        count('bytes', get_output_bytes(save_to) - previous_bytes)
+        return save_to
+    if is_csv:
+        with pacsv.CSVWriter(save_to, schema) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+        count('bytes', get_output_bytes(save_to))
+        return save_to
+
+    buffer, buffered_rows = [], 0
+    with pq.ParquetWriter(save_to, schema,
+                          **get_parquet_options(compression_level, page_size)) as writer:
+        for batch in batches:
+            buffer.append(batch)
+            buffered_rows += batch.num_rows
+            if buffered_rows >= row_group_size:
+                writer.write_table(pa.Table.from_batches(buffer, schema),
+                                   row_group_size=row_group_size)
+                buffer, buffered_rows = [], 0
+        if buffer:
+            writer.write_table(pa.Table.from_batches(buffer, schema),
+                               row_group_size=row_group_size)
+    count('bytes', get_output_bytes(save_to))
+    return save_to
+
+
+def split_into_chunks(numb_rows: int, chunk_size: int) -> list:
+    """Splits `numb_rows` rows into contiguous ranges of at most
+       `chunk_size` rows.
+
+    Parameters
+    ----------
+        numb_rows: the total number of rows
+        chunk_size: the maximum number of rows per range
+
+    Returns
+    -------
+        chunks: a list of (start, stop) tuples
+    """
+    return [(start, min(start + chunk_size, numb_rows))
+            for start in range(0, numb_rows, chunk_size)]
+
+
+def derive_chunk_seeds(seed: int, stream: str, numb_chunks: int, first_chunk: int=0) -> list:
+    """Derives an independent seed for each chunk of a table.
+
+    The seed of chunk `k` only depends on `seed`, the name of the stream
+    and `k`, so any process or node can generate any chunk and get the same
+    rows as a serial run.
+
+    Parameters
+    ----------
+        seed: the seed of the whole run, a random one is drawn if None
+        stream: the name of the table or random stream, e.g. 'products'
+        numb_chunks: the number of chunks
+        first_chunk: the index of the first chunk, to continue the chunks
+                     of a previous run
+
+    Returns
+    -------
+        seeds: a list of `numb_chunks` integer seeds
+    """
+    entropy = np.random.SeedSequence(seed).entropy
+    stream_key = zlib.crc32(stream.encode())
+    return [int(np.random.SeedSequence(entropy, spawn_key=(stream_key, k)).generate_state(1)[0])
+            for k in range(first_chunk, first_chunk + numb_chunks)]
+
+
+def get_shard_chunks(chunks: list, shard_index: int=0, num_shards: int=1) -> list:
+    """Returns the chunks that belong to a shard.
+
+    Each shard gets a contiguous block of chunks, so concatenating the
+    shards in order gives the chunks of a serial run.
+
+    Parameters
+    ----------
+        chunks: the (start, stop) ranges of the whole table
+        shard_index: the index of the shard, from 0 to `num_shards - 1`
+        num_shards: the total number of shards
+
+    Returns
+    -------
+        shard_chunks: a list of (chunk_index, start, stop) tuples
+    """
+    if not 0 <= shard_index < num_shards:
+        raise ValueError(f"shard_index must be in [0, {num_shards}), got {shard_index}")
+    first = len(chunks) * shard_index // num_shards
+    last = len(chunks) * (shard_index + 1) // num_shards
+    return [(k, *chunks[k]) for k in range(first, last)]
+
+
+def get_chunk_tasks(numb_rows: int, chunk_size: int, seed: int, stream: str,
+                    shard_index: int=0, num_shards: int=1, first_chunk: int=0,
+                    part_dir: str=None) -> list:
+    """Returns the chunks of rows a shard generates, each with its own seed.
+
+    Parameters
+    ----------
+        numb_rows: the total number of rows
+        chunk_size: the maximum number of rows per chunk
+        seed: the seed of the whole run, a random one is drawn if None
+        stream: the name of the table, see `derive_chunk_seeds`
+        shard_index: the index of the shard, see `get_shard_chunks`
+        num_shards: the total number of shards
+        first_chunk: the index of the first chunk, to continue the chunks
+                     of a previous run
+        part_dir: if given, the folder the chunks are written to, created
+                  if missing, a chunk `k` being named `PART_NAME.format(k)`
+
+    Returns
+    -------
+        tasks: a list of (start, stop, seed, part_path) tuples, `part_path`
+               being None without `part_dir`
+    """
+    chunks = split_into_chunks(numb_rows, chunk_size)
+    seeds = derive_chunk_seeds(seed, stream, len(chunks), first_chunk)
+    if part_dir is not None:
+        part_dir = Path(part_dir)
+        part_dir.mkdir(parents=True, exist_ok=True)
+    return [(start, stop, seeds[k],
+             None if part_dir is None else part_dir / PART_NAME.format(first_chunk + k))
+            for k, start, stop in get_shard_chunks(chunks, shard_index, num_shards)]
+
+
+_worker_contexts = {}
+
+
+def run_in_worker(task):
+    """Runs a task on a worker of a shared pool.
+
+    The task is a tuple of (key, context, size, func, args), `context`
+    being the name of the shared memory block holding the pickled
+    (initializer, initargs), see `shared_arrays.shared_pickle`. The worker
+    unpickles them and calls `initializer(*initargs)` the first time it
+    sees `context` for the initializer named `key`, then returns
+    `func(args)`.
+    """
+    key, context, size, func, args = task
+    if _worker_contexts.get(key) != context:
+        initializer, initargs = load_pickle(context, size)
+        initializer(*initargs)
+        _worker_contexts[key] = context
+    return func(args)
+
+
+def imap_bounded(pool: mp.Pool, func, tasks: list, max_pending: int=None):
+    """Maps `func` over `tasks` on a pool, yielding the results in order,
+       with at most `max_pending` tasks submitted ahead of the consumer.
+
+    This bounds the results held in memory when the consumer, e.g. a
+    writer, is slower than the workers. Without `max_pending` all the tasks
+    are submitted at once, as with `pool.imap`.
+    """
+    if max_pending is None:
+        yield from pool.imap(func, tasks)
+        return
+    pending = deque()
+    for task in tasks:
+        if len(pending) == max_pending:
+            yield pending.popleft().get()
+        pending.append(pool.apply_async(func, (task,)))
+    while pending:
+        yield pending.popleft().get()
+
+
+def imap_chunks(func, tasks: list, initializer, initargs: tuple,
+                pool: mp.Pool=None, numb_workers: int=None, max_pending: int=None):
+    """Maps `func` over `tasks` on worker processes set up with
+       `initializer(*initargs)`, yielding the results in order.
+
+    Without a `pool`, a pool is created for the call. With one, e.g. a pool
+    shared by several countries, the workers keep their caches (shapefile,
+    catalog, value pools) between calls. The initargs are pickled once
+    into shared memory, and each worker reads them only the first time it
+    runs a task of the call, so the tasks carry just the name of the block.
+
+    Parameters
+    ----------
+        func: the function run on each task
+        tasks: the tasks
+        initializer: the function setting up the worker globals
+        initargs: the arguments of `initializer`
+        pool: a pool to run on, a new one is created if None
+        numb_workers: the number of workers of a new pool, defaults to
+                      the number of cpus
+        max_pending: the maximum number of tasks submitted ahead of the
+                     results consumed, see `imap_bounded`
+
+    Yields
+    ------
+        result: the result of each task, in order
+    """
+    if pool is None:
+        with mp.Pool(numb_workers or mp.cpu_count(), initializer=initializer,
+                     initargs=initargs) as pool:
+            yield from imap_bounded(pool, func, tasks, max_pending)
+        return
+    key = f'{initializer.__module__}.{initializer.__qualname__}'
+    with shared_pickle((initializer, initargs)) as (context, size):
+        yield from imap_bounded(pool, run_in_worker, [(key, context, size, func, task)
+                                                      for task in tasks], max_pending)
+
+
+def build_alias_table(weights: np.ndarray) -> tuple:
+    """Builds a Walker alias table to sample indices proportionally to
+       `weights` in constant time per draw.
+
+    The table is built with vectorized rounds of Vose's method: the small
+    entries are matched to the large ones through the cumulative sums of
+    their deficit and excess, so the build stays O(n) in NumPy.
+
+    Parameters
+    ----------
+        weights: the non-negative weight of each index
+
+    Returns
+    -------
+        prob, alias: the acceptance probability and the alias of each index
+    """
+    weights = np.asarray(weights, dtype=float)
+    numb_weights = len(weights)
+    scaled = weights * numb_weights / weights.sum()
+    prob = np.ones(numb_weights)
+    alias = np.arange(numb_weights)
+    small = np.flatnonzero(scaled < 1)
+    large = np.flatnonzero(scaled > 1)
+    while len(small) and len(large):
+        deficit = 1 - scaled[small]
+        excess_end = np.cumsum(scaled[large] - 1)
+        deficit_start = np.cumsum(deficit) - deficit
+        # Each small entry is aliased to the large entry whose excess
+        # covers the start of its deficit.
+        owner = np.searchsorted(excess_end, deficit_start, side='right')
+        served = owner < len(large)
+        if not served.any():
+            break
+        prob[small[served]] = scaled[small[served]]
+        alias[small[served]] = large[owner[served]]
+        scaled[large] -= np.bincount(owner[served], weights=deficit[served], minlength=len(large))
+        small = np.concatenate([small[~served], large[scaled[large] < 1]])
+        large = large[scaled[large] > 1]
+    return prob, alias
+
 
+def sample_alias(prob: np.ndarray, alias: np.ndarray, numb_samples: int,
+                 rng: np.random.Generator) -> np.ndarray:
+    """Draws indices from a Walker alias table.
+
+    Parameters
+    ----------
+        prob, alias: the alias table, see `build_alias_table`
+        numb_samples: the number of indices to draw
+        rng: the random generator to use
+
+    Returns
+    -------
+        indices: the drawn indices
+    """
+    indices = rng.integers(0, len(prob), size=numb_samples)
+    return np.where(rng.random(numb_samples) < prob[indices], indices, alias[indices])
+
+
+def rows_to_record_batch(rows: list, schema: pa.Schema) -> pa.RecordBatch:
+    """Converts a list of row dicts into a columnar Arrow record batch.
+
+    Parameters
+    ----------
+        rows: the rows as dictionaries keyed by column name
+        schema: the schema of the record batch
+
+    Returns
+    -------
+        batch: the rows as a pyarrow RecordBatch
+    """
+    columns = {name: [row[name] for row in rows] for name in schema.names}
+    return pa.RecordBatch.from_pydict(columns, schema=schema)
 
 
 def timer_decorator(func):
@@ -65,41 +701,253 @@ def timer_decorator(func):
     return wrapper
 
 
+SHAPEFILE_PATH = 'shap/ne_10m_admin_1_states_provinces.shp'
+
+_triangulation_cache = {}
+
+
+def get_shapefile_errors() -> tuple:
+    """Returns the exceptions raised when the shapefile is missing or can't
+       be opened, e.g. to catch them in `except get_shapefile_errors():`,
+       which only imports pyogrio when an exception is raised.
+    """
+    try:
+        from pyogrio.errors import DataSourceError
+    except ImportError:
+        return (FileNotFoundError,)
+    return (FileNotFoundError, DataSourceError)
+
+
+def load_region_index(shapefile_path: str=SHAPEFILE_PATH) -> dict:
+    """Loads the regions of a shapefile once and indexes them by the
+       pycountry names of their country and subdivision.
+
+    The regions are joined to the pycountry subdivisions by their
+    ISO 3166-2 code through a crosswalk built once per shapefile version,
+    see `region_crosswalk.py`.
+
+    Parameters
+    ----------
+        shapefile_path: path to the shapefile
+
+    Returns
+    -------
+        region_index: a dict mapping (country_name, region_name) to the
+                      region's `Region`, with its area, bounds and
+                      prepared geometry
+    """
+    from region_crosswalk import load_crosswalk
+
+    return load_crosswalk(shapefile_path)
+
+
+def triangulate_geometry(geometry) -> tuple:
+    """Splits a (multi)polygon into triangles for area-weighted sampling.
+
+    Parameters
+    ----------
+        geometry: the polygon or multipolygon to triangulate
+
+    Returns
+    -------
+        triangles: an array of shape (n, 3, 2) of the triangles vertices
+        area_cdf: the cumulative share of the total area of the triangles
+    """
+    import shapely
+
+    parts = shapely.get_parts(shapely.constrained_delaunay_triangles(geometry))
+    triangles = shapely.get_coordinates(parts).reshape(len(parts), 4, 2)[:, :3]
+    area_cdf = np.cumsum(shapely.area(parts))
+    return triangles, area_cdf / area_cdf[-1]
+
+
+def sample_points_in_triangles(triangles: np.ndarray, area_cdf: np.ndarray,
+                               num_points: int,
+                               rng: np.random.Generator = None) -> np.ndarray:
+    """Samples points uniformly over a triangulated area.
+
+    Parameters
+    ----------
+        triangles: an array of shape (n, 3, 2) of the triangles vertices
+        area_cdf: the cumulative share of the total area of the triangles
+        num_points: the number of points to sample
+        rng: the random generator to use, a new one is created if None
+
+    Returns
+    -------
+        points: an array of shape (num_points, 2) of (latitude, longitude)
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    chosen = triangles[np.searchsorted(area_cdf, rng.random(num_points), side='right')
+                       .clip(max=len(area_cdf) - 1)]
+    u, v = rng.random(num_points), rng.random(num_points)
+    # Points falling in the far half of the parallelogram are folded back.
+    folded = u + v > 1
+    u[folded], v[folded] = 1 - u[folded], 1 - v[folded]
+    a, b, c = chosen[:, 0], chosen[:, 1], chosen[:, 2]
+    points = a + u[:, None] * (b - a) + v[:, None] * (c - a)
+    return points[:, ::-1]
+
+
+def sample_points_in_geometry(geometry, num_points: int,
+                              rng: np.random.Generator = None) -> np.ndarray:
+    """Samples points uniformly over a (multi)polygon by rejection.
+
+    Used when shapely has no constrained triangulation. The points are
+    split between the polygons according to their area, then each polygon
+    is rejection-sampled from its own bounding box in vectorized batches,
+    which keeps the acceptance rate high for regions made of many islands.
+
+    Parameters
+    ----------
+        geometry: the polygon or multipolygon to sample from
+        num_points: the number of points to sample
+        rng: the random generator to use, a new one is created if None
+
+    Returns
+    -------
+        points: an array of shape (num_points, 2) of (latitude, longitude)
+    """
+    import shapely
+
+    if rng is None:
+        rng = np.random.default_rng()
+    polygons = shapely.get_parts(geometry)
+    areas = shapely.area(polygons)
+    counts = rng.multinomial(num_points, areas / areas.sum())
+    points = []
+    for polygon, count in zip(polygons, counts):
+        if count == 0:
+            continue
+        shapely.prepare(polygon)
+        min_x, min_y, max_x, max_y = polygon.bounds
+        acceptance = max(polygon.area / ((max_x - min_x) * (max_y - min_y)), 1e-3)
+        found = 0
+        while found < count:
+            size = int((count - found) / acceptance * 1.1) + 16
+            lng = rng.uniform(min_x, max_x, size)
+            lat = rng.uniform(min_y, max_y, size)
+            inside = shapely.contains_xy(polygon, lng, lat)
+            accepted = np.column_stack([lat[inside], lng[inside]])[:count - found]
+            points.append(accepted)
+            found += len(accepted)
+    if not points:
+        return np.empty((0, 2))
+    points = np.concatenate(points)
+    return points[rng.permutation(len(points))]
+
+
 def generate_random_coords_in_region(country_name: str,
-                                     region_name: str, num_points: int):
+                                     region_name: str, num_points: int,
+                                     rng: np.random.Generator = None) -> np.ndarray:
     """Generates random latitude and longitude
        coordinates within a given region.
 
+    The shapefile is read once per process and each region is triangulated
+    on first use, so later calls only draw random numbers.
+
     Parameters
     ----------
-        shapefile_path: path to the shapefile
         country_name: the country to generate coordinates for
         region_name: the region to generate coordinates for
         num_points: the number of coordinates to generate
+        rng: the random generator to use, a new one is created if None
 
     Returns
     -------
-        random_points: the generated coordinates
+        random_points: an array of shape (num_points, 2) of (latitude, longitude)
+    """
+    import shapely
+
+    region_index = load_region_index()
+    key = (country_name, region_name)
+    if key not in region_index:
+        raise ValueError(f"No region {region_name} found for {country_name} in the shapefile")
+    if not hasattr(shapely, 'constrained_delaunay_triangles'):
+        return sample_points_in_geometry(region_index[key].geometry, num_points, rng)
+    if key not in _triangulation_cache:
+        _triangulation_cache[key] = triangulate_geometry(region_index[key].geometry)
+    triangles, area_cdf = _triangulation_cache[key]
+    return sample_points_in_triangles(triangles, area_cdf, num_points, rng)
+
+
+class ProductCatalog(NamedTuple):
+    """The product categories of `products_configs.yaml` as flat arrays.
+
+    Subcategories are stored contiguously per category: the subcategories
+    of category `c` are the rows `subcategory_offsets[c]` to
+    `subcategory_offsets[c + 1]` of `subcategories`, `category_index`,
+    `low_price`, `high_price` and `price_distribution`, the index in
+    `pricing.PRICE_DISTRIBUTIONS` of the distribution of the prices.
     """
-    shapefile_path = "shap/ne_10m_admin_1_states_provinces.shp"
-    gdf = gpd.read_file(shapefile_path)
+    categories: tuple
+    subcategories: tuple
+    category_index: np.ndarray
+    subcategory_offsets: np.ndarray
+    low_price: np.ndarray
+    high_price: np.ndarray
+    price_distribution: np.ndarray
+
+
+_catalog_cache = {}
+
 
-    region = gdf[(gdf['admin'] == country_name) & (gdf['name'] == region_name)].iloc[0]
+@instrumented('config_load')
+def load_product_catalog(file_path: str='configs/products_configs.yaml') -> ProductCatalog:
+    """Loads the product catalog from a yaml file.
+
+    The file is parsed once and cached until its modification time
+    changes, so config edits are picked up without parsing the file on
+    every call. The returned arrays are read-only.
+
+    A subcategory is given as `[low, high]` or `[low, high, distribution]`,
+    with the distribution of its prices in `pricing.PRICE_DISTRIBUTIONS`.
+    The default distribution is the top level `price_distribution` of the
+    file, or `pricing.DEFAULT_PRICE_DISTRIBUTION`.
+
+    Parameters
+    ----------
+        file_path: path to the yaml file
 
-    bbox = region.geometry.bounds
-    min_x, min_y, max_x, max_y = bbox
+    Returns
+    -------
+        catalog: the product catalog
+    """
+    file_path = Path(file_path).resolve()
+    mtime = file_path.stat().st_mtime_ns
+    cached = _catalog_cache.get(file_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
 
-    random_points = []
-    while len(random_points) < num_points:
-        random_lat = random.uniform(min_y, max_y)
-        random_lng = random.uniform(min_x, max_x)
-        point = Point(random_lng, random_lat)
+    with open(file_path, 'r') as f:
+        categories_data = yaml.safe_load(f)
 
-        # Check if the point is within the region's geometry
-        if region.geometry.contains(point):
-            random_points.append((random_lat, random_lng))
+    default_distribution = categories_data.get('price_distribution', DEFAULT_PRICE_DISTRIBUTION)
+    categories, subcategories = [], []
+    category_index, offsets, low_price, high_price, price_distribution = [], [0], [], [], []
+    for i, (category, subcategories_dict) in enumerate(categories_data['categories'].items()):
+        categories.append(category)
+        for subcategory, (low, high, *distribution) in subcategories_dict.items():
+            distribution = distribution[0] if distribution else default_distribution
+            if distribution not in PRICE_DISTRIBUTIONS:
+                raise ValueError(f'Unknown price distribution {distribution!r} for {subcategory} '
+                                 f'in {file_path}, expected one of {PRICE_DISTRIBUTIONS}')
+            subcategories.append(subcategory)
+            category_index.append(i)
+            low_price.append(low)
+            high_price.append(high)
+            price_distribution.append(PRICE_DISTRIBUTIONS.index(distribution))
+        offsets.append(len(subcategories))
 
-    return random_points
+    arrays = [np.array(category_index, dtype=np.int32), np.array(offsets, dtype=np.int32),
+              np.array(low_price, dtype=float), np.array(high_price, dtype=float),
+              np.array(price_distribution, dtype=np.int8)]
+    for array in arrays:
+        array.flags.writeable = False
+    catalog = ProductCatalog(tuple(categories), tuple(subcategories), *arrays)
+    _catalog_cache[file_path] = (mtime, catalog)
+    return catalog
 
 
 def load_subcategories_from_yaml(category: str,
@@ -115,13 +963,13 @@ def load_subcategories_from_yaml(category: str,
     -------
         subcategories: the subcategories of the given category
     """
-    file_path = Path(file_path)
-    with open(file_path, 'r') as f:
-        categories_data = yaml.safe_load(f)
-    categories = categories_data['categories']
-    if category in categories:
-        return categories[category]
-    return {}
+    catalog = load_product_catalog(file_path)
+    if category not in catalog.categories:
+        return {}
+    i = catalog.categories.index(category)
+    start, stop = catalog.subcategory_offsets[i], catalog.subcategory_offsets[i + 1]
+    return {catalog.subcategories[k]: [float(catalog.low_price[k]), float(catalog.high_price[k])]
+            for k in range(start, stop)}
 
 
 def get_regions_of_country(country_name: str) -> list:
@@ -135,6 +983,8 @@ def get_regions_of_country(country_name: str) -> list:
     -------
         country_subdivisions: the regions of the given country
     """
+    import pycountry
+
     country_code = get_country_code(country_name)
     country_subdivisions = []
     for subdivision in pycountry.subdivisions.get(country_code=country_code):
@@ -153,11 +1003,7 @@ def load_categories_from_yaml(file_path: str='configs/products_configs.yaml') ->
     -------
         categories: the product categories
     """
-    file_path = Path(file_path)
-    with open(file_path, 'r') as f:
-        categories_data = yaml.safe_load(f)
-    categories = list(categories_data['categories'].keys())
-    return categories
+    return list(load_product_catalog(file_path).categories)
 
 
 def get_country_code(country_name: str) -> str:
@@ -171,6 +1017,8 @@ def get_country_code(country_name: str) -> str:
     -------
         country_code: the country code for the given country name
     """
+    import pycountry
+
     try:
         country = pycountry.countries.get(name=country_name)
         return country.alpha_2
@@ -191,6 +1039,9 @@ def get_currency_code(country_name: str) -> str:
     -------
         currency_code: the currency code for the given country name
     """
+    import pycountry
+    from countryinfo import CountryInfo
+
     try:
         country_obj = pycountry.countries.search_fuzzy(country_name)[0]
         country_info = CountryInfo(country_obj.name)
@@ -204,6 +1055,8 @@ def get_currency_code(country_name: str) -> str:
 def get_exchange_rate(country_name: str) -> float:
     """Returns the exchange rate for a given country name.
     """
+    from forex_python.converter import CurrencyRates
+
     country_currency_code = get_currency_code(country_name)
     currency_rates = CurrencyRates()
     try:
@@ -217,6 +1070,8 @@ def get_exchange_rate(country_name: str) -> float:
 def convert_usd_to_local(amount_usd: float, country_name: str) -> float:
     """Converts an amount from USD to the local currency of a given country.
 
+    The exchange rate is read from the local reference data store.
+
     Parameters
     ----------
         amount_usd: the amount in USD to convert
@@ -232,17 +1087,18 @@ def convert_usd_to_local(amount_usd: float, country_name: str) -> float:
         >>> amount_usd = 100
         >>> convert_usd_to_local(amount_usd, country)
     """
-    cr = CurrencyRates()
-    currency_code = get_currency_code(country_name)
+    from reference_data import get_country_reference
+
+    reference = get_country_reference(country_name)
     try:
-        converted_amount = cr.convert('USD', currency_code, amount_usd)
-        return round(converted_amount, 2), currency_code
+        converted_amount = amount_usd / reference['exchange_rate']
+        return round(converted_amount, 2), reference['currency_code']
     except Exception as e:
         print(f"Error: {e}")
         return None
 
 
-def get_inflation_rate(country_name: str) -> pd.DataFrame:
+def get_inflation_rate(country_name: str) -> float:
     """Returns the inflation rate for a given country name.
 
     Parameters
@@ -250,8 +1106,11 @@ def get_inflation_rate(country_name: str) -> pd.DataFrame:
         country_code: the country code to get the inflation rate for
     Returns
     -------
-        df: the inflation rate for the given country code and time period
+        inflation_rate: the latest inflation rate of the country, as a fraction
     """
+    import requests
+    import pandas as pd
+
     start_year = datetime.now().year - 2
     end_year = datetime.now().year
     country_code = get_country_code(country_name)
@@ -273,6 +1132,9 @@ def get_cities_in_subdivision(country_name: str,
                               username: str='retail_faker') -> list:
     """Returns the cities in a given subdivision of a given country.
 
+    The cities are read from the local gazetteer, see `gazetteer.py`, and
+    only fetched from the GeoNames API if there is no gazetteer.
+
     Parameters
     ----------
         country_name: the name of the country to get the cities for
@@ -281,14 +1143,20 @@ def get_cities_in_subdivision(country_name: str,
 
     Returns
     -------
-        cities: the cities in the given subdivision of the given country
-
-    Nonte
-    -----
-    This function is not working properly yet!
+        cities: the cities in the given subdivision of the given country,
+                from the most populated
     """
-    url = "http://api.geonames.org/searchJSON"
+    from gazetteer import load_gazetteer, get_cities
+
     country_code = get_country_code(country_name)
+    gazetteer = load_gazetteer()
+    if gazetteer is not None:
+        cities = get_cities(gazetteer, country_code, subdivision_name)
+        return [] if cities is None else cities.to_pylist()
+
+    import requests
+
+    url = "http://api.geonames.org/searchJSON"
     params = {
         "country": country_code,
         "adminName1": subdivision_name,
@@ -0,0 +1,282 @@
+import os
+import sys
+import json
+import time
+import signal
+import cProfile
+import resource
+import functools
+from pathlib import Path
+from collections import Counter
+from datetime import datetime
+from contextlib import contextmanager
+
+
+# The phases timed by the generators. Phases nest, e.g. the transaction
+# batches are generated inside the `write` phase that streams them.
+PHASES = ['reference_data', 'config_load', 'generate_rows', 'dataframe_build', 'write']
+COUNTERS = ['rows', 'bytes', 'retries']
+PROMETHEUS_PREFIX = 'retail_faker'
+PROFILE_DIR = 'profiles'
+SAMPLING_INTERVAL = 0.005
+
+_phase_totals = {}
+_phase_stack = []
+_listeners = []
+_profilers = {}
+_stack_samples = Counter()
+
+
+def get_peak_rss_bytes(who: int=resource.RUSAGE_SELF) -> int:
+    """Returns the peak resident memory in bytes of the process, or of its
+       largest terminated child with `resource.RUSAGE_CHILDREN`.
+    """
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    rss_unit = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(who).ru_maxrss * rss_unit
+
+
+def get_output_bytes(path: Path) -> int:
+    """Returns the size in bytes of a file, or of all the files in a folder.
+    """
+    path = Path(path)
+    if path.is_dir():
+        return sum(f.stat().st_size for f in path.rglob('*') if f.is_file())
+    return path.stat().st_size if path.exists() else 0
+
+
+def add_listener(listener) -> None:
+    """Registers a function called with the record of every phase, see
+       `phase`.
+    """
+    _listeners.append(listener)
+
+
+def remove_listener(listener) -> None:
+    """Unregisters a function added with `add_listener`.
+    """
+    _listeners.remove(listener)
+
+
+def reset() -> None:
+    """Clears the totals of the phases and the profiles collected so far.
+    """
+    _phase_totals.clear()
+    _profilers.clear()
+    _stack_samples.clear()
+
+
+@contextmanager
+def phase(name: str, rows: int = None, telemetry=None):
+    """Times a phase and adds it to the totals of the report.
+
+    The record of the phase holds its duration, the part of it not spent
+    in nested phases, its counters and the peak memory of the process so
+    far. Counters are set on the yielded record or added with `count`.
+    Phases run in worker processes are only timed there, so the report
+    covers the main process.
+
+    Parameters
+    ----------
+        name: the name of the phase, e.g. 'write'
+        rows: the number of rows the phase handles, if known
+        telemetry: a function called with the record of this phase, on top
+                   of the listeners registered with `add_listener`
+
+    Yields
+    ------
+        record: the record of the phase
+    """
+    record = {'event': 'phase', 'phase': name}
+    if rows is not None:
+        record['rows'] = rows
+    profiler = _profilers.get(name)
+    # A single profiler can be active at a time, nested phases are part
+    # of the profile of the outer one.
+    if profiler is not None and any(entry[2] for entry in _phase_stack):
+        profiler = None
+    entry = [record, 0.0, profiler is not None]
+    _phase_stack.append(entry)
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield record
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        seconds = time.perf_counter() - start
+        _phase_stack.pop()
+        if _phase_stack:
+            _phase_stack[-1][1] += seconds
+
+        record['seconds'] = round(seconds, 6)
+        record['self_seconds'] = round(seconds - entry[1], 6)
+        if record.get('rows') is not None:
+            record['rows_per_sec'] = record['rows'] / seconds if seconds > 0 else None
+        record['peak_rss_bytes'] = get_peak_rss_bytes()
+
+        totals = _phase_totals.setdefault(name, {'calls': 0, 'seconds': 0.0, 'self_seconds': 0.0,
+                                                 **{counter: 0 for counter in COUNTERS}})
+        totals['calls'] += 1
+        totals['seconds'] += seconds
+        totals['self_seconds'] += seconds - entry[1]
+        for counter in COUNTERS:
+            totals[counter] += record.get(counter) or 0
+        for listener in ([telemetry] if telemetry is not None else []) + _listeners:
+            listener(record)
+
+
+def count(counter: str, value: int = 1) -> None:
+    """Adds `value` to a counter, e.g. 'bytes' or 'retries', of the
+       innermost running phase. Does nothing outside of a phase.
+    """
+    if _phase_stack:
+        record = _phase_stack[-1][0]
+        record[counter] = (record.get(counter) or 0) + value
+
+
+def instrumented(name: str):
+    """A decorator running a function as a phase.
+
+    Usage
+    -----
+    @instrumented('write')
+    def save_table(table, file_path):
+        pass
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_report() -> dict:
+    """Returns the totals of every phase run so far.
+
+    Returns
+    -------
+        report: a dict with the peak memory and, per phase, its number of
+                calls, seconds, seconds not spent in nested phases, rows,
+                bytes and retries
+    """
+    phases = {}
+    for name, totals in _phase_totals.items():
+        phases[name] = dict(totals)
+        if totals['rows'] and totals['seconds'] > 0:
+            phases[name]['rows_per_sec'] = totals['rows'] / totals['seconds']
+    return {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'pid': os.getpid(),
+        'peak_rss_bytes': get_peak_rss_bytes(),
+        'phases': phases,
+    }
+
+
+def write_atomically(file_path: Path, text: str) -> Path:
+    """Writes a file next to its destination then renames it, so readers
+       such as the node exporter never see a partial file.
+    """
+    file_path = Path(file_path)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = file_path.with_name(file_path.name + '.tmp')
+    tmp_path.write_text(text)
+    os.replace(tmp_path, file_path)
+    return file_path
+
+
+def format_prometheus(report: dict) -> str:
+    """Formats a report in the Prometheus text exposition format.
+    """
+    metrics = [('calls', 'counter', 'Number of runs of the phase.'),
+               ('seconds', 'counter', 'Seconds spent in the phase.'),
+               ('self_seconds', 'counter', 'Seconds spent in the phase outside nested phases.'),
+               ('rows', 'counter', 'Rows handled by the phase.'),
+               ('bytes', 'counter', 'Bytes written by the phase.'),
+               ('retries', 'counter', 'Retried requests of the phase.')]
+    lines = []
+    for metric, metric_type, description in metrics:
+        name = f'{PROMETHEUS_PREFIX}_phase_{metric}_total'
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} {metric_type}']
+        for phase_name, totals in report['phases'].items():
+            lines.append(f'{name}{{phase="{phase_name}"}} {totals[metric]}')
+    name = f'{PROMETHEUS_PREFIX}_peak_rss_bytes'
+    lines += [f'# HELP {name} Peak resident memory of the process.', f'# TYPE {name} gauge',
+              f"{name} {report['peak_rss_bytes']}"]
+    return '\n'.join(lines) + '\n'
+
+
+def save_report(file_path: str) -> Path:
+    """Writes the report of the phases run so far, as a Prometheus
+       textfile if `file_path` ends in `.prom`, as JSON otherwise.
+    """
+    report = get_report()
+    if Path(file_path).suffix == '.prom':
+        return write_atomically(file_path, format_prometheus(report))
+    return write_atomically(file_path, json.dumps(report, indent=2))
+
+
+def enable_profiling(phases: list) -> None:
+    """Profiles the given phases with cProfile, see `save_profiles`.
+    """
+    for name in phases:
+        _profilers.setdefault(name, cProfile.Profile())
+
+
+def save_profiles(profile_dir: str = PROFILE_DIR) -> list:
+    """Writes the profile of each profiled phase as
+       `profile_dir/<phase>.prof`, readable with pstats or snakeviz.
+
+    Returns
+    -------
+        file_paths: the paths of the written profiles
+    """
+    profile_dir = Path(profile_dir)
+    profile_dir.mkdir(parents=True, exist_ok=True)
+    file_paths = []
+    for name, profiler in _profilers.items():
+        if profiler.getstats():
+            profiler.dump_stats(profile_dir / f'{name}.prof')
+            file_paths.append(profile_dir / f'{name}.prof')
+    return file_paths
+
+
+def record_stack_sample(signum, frame) -> None:
+    """Adds the current stack of the main thread to the samples.
+    """
+    stack = []
+    while frame is not None:
+        stack.append(f'{frame.f_code.co_name} ({Path(frame.f_code.co_filename).name}'
+                     f':{frame.f_code.co_firstlineno})')
+        frame = frame.f_back
+    _stack_samples[';'.join(reversed(stack))] += 1
+
+
+def start_sampling(interval: float = SAMPLING_INTERVAL) -> None:
+    """Samples the stack of the main thread every `interval` seconds of
+       cpu time, see `save_stack_samples`.
+
+    Sampling only costs a signal per interval, so unlike cProfile it can
+    run over a whole large job. It is only available on Unix.
+    """
+    signal.signal(signal.SIGPROF, record_stack_sample)
+    signal.setitimer(signal.ITIMER_PROF, interval, interval)
+
+
+def stop_sampling() -> None:
+    """Stops the sampling started by `start_sampling`.
+    """
+    signal.setitimer(signal.ITIMER_PROF, 0)
+    signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+
+def save_stack_samples(file_path: str) -> Path:
+    """Writes the stack samples in the collapsed stack format, one
+       `frame;frame;frame count` line per stack, as written by
+       `py-spy record --format raw` and read by flamegraph.pl or speedscope.
+    """
+    lines = [f'{stack} {numb}' for stack, numb in _stack_samples.most_common()]
+    return write_atomically(file_path, '\n'.join(lines) + '\n')
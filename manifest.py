@@ -0,0 +1,124 @@
+import os
+import json
+from pathlib import Path
+from datetime import datetime
+
+
+MANIFEST_PATH = 'retail_data/manifest.json'
+MANIFEST_VERSION = 1
+
+
+def new_manifest(country_name: str, seed: int) -> dict:
+    """Returns the manifest of a new dataset, with no rows.
+
+    Parameters
+    ----------
+        country_name: the country of the dataset
+        seed: the seed every run of the dataset derives its chunks from
+
+    Returns
+    -------
+        manifest: the manifest as a dict
+    """
+    return {
+        'version': MANIFEST_VERSION,
+        'country_name': country_name,
+        'seed': seed,
+        'tables': {},
+        'runs': [],
+    }
+
+
+def load_manifest(file_path: str=MANIFEST_PATH) -> dict:
+    """Loads the manifest of a dataset.
+
+    Parameters
+    ----------
+        file_path: the path of the manifest
+
+    Returns
+    -------
+        manifest: the manifest as a dict, or None if there is none
+    """
+    file_path = Path(file_path)
+    if not file_path.exists():
+        return None
+    manifest = json.loads(file_path.read_text())
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported manifest version {manifest.get('version')!r} in {file_path}")
+    return manifest
+
+
+def save_manifest(manifest: dict, file_path: str=MANIFEST_PATH) -> Path:
+    """Writes the manifest of a dataset.
+
+    The file is written next to its destination then renamed, so a run
+    that fails halfway leaves the previous manifest in place.
+
+    Parameters
+    ----------
+        manifest: the manifest as a dict
+        file_path: the path of the manifest
+
+    Returns
+    -------
+        file_path: the path of the written manifest
+    """
+    file_path = Path(file_path)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = file_path.with_name(file_path.name + '.tmp')
+    tmp_path.write_text(json.dumps(manifest, indent=2))
+    os.replace(tmp_path, file_path)
+    return file_path
+
+
+def get_table_entry(manifest: dict, table_name: str) -> dict:
+    """Returns the entry of a table in the manifest, with no rows if the
+       table was never generated.
+    """
+    return manifest['tables'].get(table_name, {'rows': 0, 'next_chunk': 0})
+
+
+def record_rows(manifest: dict, table_name: str, numb_rows: int, chunk_size: int, **fields) -> dict:
+    """Records rows added to a table.
+
+    The rows were generated from chunks `next_chunk` onwards, so the
+    next run continues with the chunks that follow and never reuses a seed.
+    The chunk size is recorded too, as later runs must use the same one.
+
+    Parameters
+    ----------
+        manifest: the manifest to update
+        table_name: the name of the table, e.g. 'products'
+        numb_rows: the number of rows added
+        chunk_size: the number of rows per chunk of the run
+        fields: other fields to set on the entry of the table
+
+    Returns
+    -------
+        entry: the updated entry of the table
+    """
+    entry = dict(get_table_entry(manifest, table_name))
+    entry['rows'] += numb_rows
+    entry['next_chunk'] += -(-numb_rows // chunk_size)
+    entry['chunk_size'] = chunk_size
+    entry.update(fields)
+    manifest['tables'][table_name] = entry
+    return entry
+
+
+def record_run(manifest: dict, mode: str, rows: dict) -> None:
+    """Adds a run to the history of the manifest.
+
+    Parameters
+    ----------
+        manifest: the manifest to update
+        mode: 'full' for a run that generated the dataset, 'append' for a
+              run that extended it
+        rows: the number of rows the run added to each table
+    """
+    manifest['runs'].append({
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'mode': mode,
+        'rows': rows,
+    })
@@ -0,0 +1,155 @@
+import numpy as np
+
+
+# The distributions prices can be drawn from within the [low, high] range
+# of a subcategory, set per subcategory in `products_configs.yaml`.
+PRICE_DISTRIBUTIONS = ['lognormal', 'loguniform', 'uniform']
+DEFAULT_PRICE_DISTRIBUTION = 'lognormal'
+# The [low, high] range of a subcategory spans this many standard
+# deviations of the log-normal distribution on each side of its median.
+LOGNORMAL_Z = 2.5
+MIN_PRICE = 0.01
+# Prices from this one end in .99, cheaper ones in .x9, e.g. 4.49.
+CHARM_THRESHOLD = 10.0
+
+
+def sample_lognormal(low: np.ndarray, high: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Draws one price per entry from a log-normal distribution truncated
+       to [low, high], centered on the geometric mean of the bounds.
+    """
+    log_low, log_high = np.log(low), np.log(high)
+    z_scores = rng.standard_normal(len(low))
+    # Redraw the few draws outside of the range, about 1% of them.
+    outside = np.flatnonzero(np.abs(z_scores) > LOGNORMAL_Z)
+    while len(outside):
+        z_scores[outside] = rng.standard_normal(len(outside))
+        outside = outside[np.abs(z_scores[outside]) > LOGNORMAL_Z]
+    return np.exp((log_low + log_high) / 2 + (log_high - log_low) / (2 * LOGNORMAL_Z) * z_scores)
+
+
+def sample_loguniform(low: np.ndarray, high: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Draws one price per entry with a uniform logarithm within [low, high].
+    """
+    log_low = np.log(low)
+    return np.exp(log_low + rng.random(len(low)) * (np.log(high) - log_low))
+
+
+def sample_uniform(low: np.ndarray, high: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Draws one price per entry uniformly within [low, high].
+    """
+    return low + rng.random(len(low)) * (high - low)
+
+
+SAMPLERS = {
+    'lognormal': sample_lognormal,
+    'loguniform': sample_loguniform,
+    'uniform': sample_uniform,
+}
+
+
+def sample_base_prices(low: np.ndarray, high: np.ndarray, distribution: np.ndarray,
+                       rng: np.random.Generator) -> np.ndarray:
+    """Draws the USD price of each product within its range.
+
+    Parameters
+    ----------
+        low: the lowest price of each product
+        high: the highest price of each product
+        distribution: the index in `PRICE_DISTRIBUTIONS` of the
+                      distribution of each product
+        rng: the random generator to use
+
+    Returns
+    -------
+        prices: the prices, with the products of each distribution drawn
+                in one call
+    """
+    low = np.maximum(low, MIN_PRICE)
+    high = np.maximum(high, low)
+    prices = np.empty(len(low))
+    for d in np.unique(distribution):
+        rows = np.flatnonzero(distribution == d)
+        prices[rows] = SAMPLERS[PRICE_DISTRIBUTIONS[d]](low[rows], high[rows], rng)
+    return np.clip(prices, low, high)
+
+
+def apply_inflation(prices: np.ndarray, inflation_rate) -> np.ndarray:
+    """Raises prices by a yearly inflation rate, a fraction, per product
+       or for all of them. Prices without an inflation rate are unchanged.
+    """
+    inflation_rate = np.asarray(inflation_rate, dtype=np.float64)
+    return prices * np.where(np.isnan(inflation_rate), 1.0, 1.0 + inflation_rate)
+
+
+def apply_charm_pricing(prices: np.ndarray, low: np.ndarray = None,
+                        high: np.ndarray = None) -> np.ndarray:
+    """Rounds prices up to the nearest charm price, e.g. 12.30 to 12.99
+       and 4.42 to 4.49.
+
+    With bounds, a charm price below `low`, e.g. 4.99 for 5.00, moves up
+    to the next charm price, and one above `high` down to the previous
+    one. Prices whose range holds no charm price are clipped to it.
+    """
+    scale = np.where(prices >= CHARM_THRESHOLD, 1.0, 10.0)
+    step = 1 / scale
+    charmed = np.maximum(np.ceil(prices * scale) / scale - 0.01, 0.09)
+    if low is not None:
+        charmed = np.where(charmed < low, charmed + step, charmed)
+    if high is not None:
+        charmed = np.where(charmed > high, charmed - step, charmed)
+    charmed = np.round(charmed, 2)
+    if low is not None:
+        charmed = np.maximum(charmed, np.ceil(np.round(low * 100, 6)) / 100)
+    if high is not None:
+        charmed = np.minimum(charmed, np.floor(np.round(high * 100, 6)) / 100)
+    return charmed
+
+
+def convert_from_usd(amounts_usd: np.ndarray, exchange_rate) -> tuple:
+    """Converts USD amounts to their local currency in one array operation.
+
+    Parameters
+    ----------
+        amounts_usd: the amounts in USD
+        exchange_rate: the value in USD of one unit of the local currency,
+                       per amount or for all of them
+
+    Returns
+    -------
+        amounts: the amounts in the local currency, or in USD where there
+                 is no exchange rate
+        has_rate: the mask of the converted amounts, the others fall back
+                  to USD
+    """
+    amounts_usd = np.asarray(amounts_usd, dtype=np.float64)
+    exchange_rate = np.broadcast_to(np.asarray(exchange_rate, dtype=np.float64), amounts_usd.shape)
+    has_rate = np.isfinite(exchange_rate) & (exchange_rate > 0)
+    amounts = np.divide(amounts_usd, exchange_rate, out=amounts_usd.copy(), where=has_rate)
+    return amounts, has_rate
+
+
+def generate_prices(low: np.ndarray, high: np.ndarray, distribution: np.ndarray,
+                    inflation_rate, rng: np.random.Generator) -> np.ndarray:
+    """Generates the shelf prices of products in USD: a draw within the
+       range of their subcategory, raised by inflation and charm priced.
+
+    Parameters
+    ----------
+        low: the lowest price of each product
+        high: the highest price of each product
+        distribution: the index in `PRICE_DISTRIBUTIONS` of the
+                      distribution of each product
+        inflation_rate: the inflation rate, per product or for all of them
+        rng: the random generator to use
+
+    Returns
+    -------
+        prices: the prices in USD, rounded to the cent, within the range of
+                their subcategory raised by inflation
+    """
+    prices = sample_base_prices(low, high, distribution, rng)
+    low = np.maximum(low, MIN_PRICE)
+    high = np.maximum(high, low)
+    return apply_charm_pricing(apply_inflation(prices, inflation_rate),
+                               apply_inflation(low, inflation_rate),
+                               apply_inflation(high, inflation_rate))
@@ -0,0 +1,174 @@
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pathlib import Path
+import pyarrow.parquet as pq
+
+from helper_functions import load_product_catalog
+
+
+MODEL_DIR = 'ml_modelling/models'
+PRODUCT_NAMES_PATH = '.cache/product_names/product_names.parquet'
+
+_model_cache = {}
+
+
+def load_name_model(model_dir: str=MODEL_DIR, quantize: bool=False) -> tuple:
+    """Loads the fine-tuned T5 model and its tokenizer once per process.
+
+    Parameters
+    ----------
+        model_dir: the folder the fine-tuned model was saved to
+        quantize: whether to apply dynamic int8 quantization to the linear
+                  layers, which speeds up generation on CPU
+
+    Returns
+    -------
+        tokenizer, model: the T5 tokenizer and model, in eval mode
+    """
+    import torch
+    from transformers import T5Tokenizer, T5ForConditionalGeneration
+
+    key = (str(Path(model_dir).resolve()), quantize)
+    if key in _model_cache:
+        return _model_cache[key]
+
+    tokenizer = T5Tokenizer.from_pretrained(model_dir)
+    model = T5ForConditionalGeneration.from_pretrained(model_dir)
+    model.eval()
+    if quantize:
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    _model_cache[key] = (tokenizer, model)
+    return tokenizer, model
+
+
+def build_prompt(category: str, subcategory: str) -> str:
+    """Returns the prompt the model was fine-tuned with for a pair.
+    """
+    return f"generate product name: {category},  {subcategory}"
+
+
+def generate_names_for_pairs(pairs: list, names_per_pair: int=50,
+                             model_dir: str=MODEL_DIR, batch_size: int=16,
+                             quantize: bool=False, temperature: float=0.8,
+                             top_p: float=0.95, max_new_tokens: int=16) -> dict:
+    """Generates product names for (category, subcategory) pairs.
+
+    The prompts are sent to the model in batches, and each prompt returns
+    `names_per_pair` sampled names in the same `generate` call.
+
+    Parameters
+    ----------
+        pairs: the (category, subcategory) pairs to generate names for
+        names_per_pair: the number of names sampled per pair
+        model_dir: the folder the fine-tuned model was saved to
+        batch_size: the number of prompts per generate call
+        quantize: whether to apply dynamic int8 quantization
+        temperature: the sampling temperature
+        top_p: the nucleus sampling probability
+        max_new_tokens: the maximum number of tokens per name
+
+    Returns
+    -------
+        names: a dict mapping each pair to its list of unique names
+    """
+    import torch
+
+    tokenizer, model = load_name_model(model_dir, quantize)
+    names = {}
+    with torch.inference_mode():
+        for start in range(0, len(pairs), batch_size):
+            batch_pairs = pairs[start:start + batch_size]
+            inputs = tokenizer([build_prompt(*pair) for pair in batch_pairs],
+                               return_tensors='pt', padding=True)
+            outputs = model.generate(
+                **inputs,
+                do_sample=True,
+                top_k=0,
+                top_p=top_p,
+                temperature=temperature,
+                max_new_tokens=max_new_tokens,
+                num_return_sequences=names_per_pair,
+            )
+            decoded = tokenizer.batch_decode(outputs, skip_special_tokens=True)
+            for i, pair in enumerate(batch_pairs):
+                pair_names = decoded[i * names_per_pair:(i + 1) * names_per_pair]
+                names[pair] = list(dict.fromkeys(name.strip() for name in pair_names if name.strip()))
+    return names
+
+
+def get_name_model_version(model_dir: str=MODEL_DIR, names_per_pair: int=50,
+                           quantize: bool=False) -> str:
+    """Returns a digest identifying the names a model generates: its folder,
+       the size and modification time of its files, and the generation
+       options, so cached names are regenerated when any of them changes.
+    """
+    model_dir = Path(model_dir).resolve()
+    parts = [str(model_dir), str(names_per_pair), str(quantize)]
+    if model_dir.is_dir():
+        for file_path in sorted(model_dir.rglob('*')):
+            if file_path.is_file():
+                stat = file_path.stat()
+                parts += [str(file_path.relative_to(model_dir)), str(stat.st_size),
+                          str(stat.st_mtime_ns)]
+    return hashlib.sha1('\n'.join(parts).encode()).hexdigest()[:16]
+
+
+def load_product_name_pool(names_per_pair: int=50, model_dir: str=MODEL_DIR,
+                           cache_path: str=PRODUCT_NAMES_PATH,
+                           quantize: bool=False) -> tuple:
+    """Returns the product names of every subcategory of the catalog.
+
+    Names are cached on disk per (category, subcategory) pair, and the
+    model is only loaded to generate the pairs missing from the cache. The
+    cache is tagged with `get_name_model_version`, and thrown away when
+    the model or the options change. It is written to a temporary file
+    then renamed, so concurrent readers never see a partial file.
+
+    Parameters
+    ----------
+        names_per_pair: the number of names sampled per missing pair
+        model_dir: the folder the fine-tuned model was saved to
+        cache_path: the parquet file the names are cached in
+        quantize: whether to apply dynamic int8 quantization
+
+    Returns
+    -------
+        names: a flat array of product names
+        offsets: the names of subcategory `k` of the catalog are
+                 `names[offsets[k]:offsets[k + 1]]`
+    """
+    catalog = load_product_catalog()
+    pairs = [(catalog.categories[c], subcategory)
+             for c, subcategory in zip(catalog.category_index, catalog.subcategories)]
+
+    cache_path = Path(cache_path)
+    version = get_name_model_version(model_dir, names_per_pair, quantize)
+    cached = {}
+    if cache_path.exists():
+        table = pq.read_table(cache_path)
+        if (table.schema.metadata or {}).get(b'version', b'').decode() == version:
+            df = table.to_pandas()
+            for pair, group in df.groupby(['category', 'subcategory'], sort=False):
+                cached[pair] = list(group['product_name'])
+
+    missing = [pair for pair in pairs if pair not in cached]
+    if missing:
+        cached.update(generate_names_for_pairs(missing, names_per_pair, model_dir,
+                                               quantize=quantize))
+        rows = [(category, subcategory, name)
+                for (category, subcategory), pair_names in cached.items()
+                for name in pair_names]
+        df = pd.DataFrame(rows, columns=['category', 'subcategory', 'product_name'])
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_name(f'{cache_path.name}.{os.getpid()}.tmp')
+        pq.write_table(table.replace_schema_metadata({'version': version}), tmp_path)
+        os.replace(tmp_path, cache_path)
+
+    pair_names = [cached.get(pair, []) for pair in pairs]
+    offsets = np.cumsum([0] + [len(names) for names in pair_names])
+    names = np.array([name for names in pair_names for name in names], dtype=object)
+    return names, offsets
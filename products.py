@@ -1,31 +1,36 @@
 
 import random
+import numpy as np
 import pyarrow as pa
-import pandas as pd
+import pyarrow.compute as pc
 from tqdm import tqdm
-from faker import Faker
 from pathlib import Path
 import multiprocessing as mp
 import pyarrow.parquet as pq
-from countryinfo import CountryInfo
-from forex_python.converter import CurrencyRates
-from forex_python.bitcoin import BtcConverter
+from datetime import date, datetime, timedelta
 
-fake = Faker()
-
-from helper_functions import load_subcategories_from_yaml
-from helper_functions import load_categories_from_yaml
-from helper_functions import get_currency_code
-from helper_functions import get_inflation_rate
-from helper_functions import get_currency_code
-from helper_functions import get_currency_code
-from helper_functions import get_exchange_rate
-from helper_functions import save_data
+from helper_functions import load_product_catalog
+from helper_functions import save_table
+from helper_functions import table_to_pandas
+from helper_functions import get_product_names
+from helper_functions import get_chunk_tasks
+from helper_functions import rows_to_record_batch
+from helper_functions import imap_chunks
+from reference_data import get_country_reference
+from value_pools import load_value_pools
+from value_pools import draw_from_pool
+from value_pools import generate_uuid4_array
+from value_pools import get_faker
+from instrumentation import phase
+from pricing import generate_prices
 
 
 def get_country_data(country_name: str) -> tuple:
     """Returns the contry data after handling the exceptions.
 
+    The data is read from the local reference data store, see
+    `reference_data.get_country_reference`.
+
     Parameters
     ----------
         country_name: the name of the country
@@ -35,74 +40,274 @@ def get_country_data(country_name: str) -> tuple:
         a tuple of (currency_code, inflation, exchange_rate)
     """
     try:
-        currency_code = get_currency_code(country_name)
-        inflation = get_inflation_rate(country_name)
-        exchange_rate = get_exchange_rate(country_name)
+        reference = get_country_reference(country_name)
     except:
         print(f'No data for {country_name}!. Using United States data instead.')
-        country_name = 'United States'
-        currency_code = get_currency_code(country_name)
-        inflation = get_inflation_rate(country_name)
-        exchange_rate = get_exchange_rate(country_name)
+        reference = get_country_reference('United States')
+
+    return reference['currency_code'], reference['inflation_rate'], reference['exchange_rate']
+
+
+PRODUCT_SCHEMA = pa.schema([
+    ('product_id', pa.string()),
+    ('product_name', pa.string()),
+    ('description', pa.string()),
+    ('category', pa.string()),
+    ('subcategory', pa.string()),
+    ('brand', pa.string()),
+    ('price_in_usd', pa.float64()),
+    ('inflation_rate', pa.float64()),
+    ('exchange_rate', pa.float64()),
+    ('currency', pa.string()),
+    ('expiration_date', pa.string()),
+])
 
-    return currency_code, inflation, exchange_rate
+PRODUCT_PROVIDERS = ['bs', 'sentence', 'company']
 
+worker_catalog = None
+worker_country_data = None
+worker_value_pools = None
+worker_product_names = None
+worker_reference_date = None
+
+
+def init_product_worker(product_catalog, country_data, value_pools=None, product_names=None,
+                        reference_date=None):
+    """Sets the product catalog, the country data, the optional value pools
+       and model product names, and the day the expiration dates count
+       from, shared by the rows generated in a worker.
+    """
+    global worker_catalog, worker_country_data, worker_value_pools, worker_product_names
+    global worker_reference_date
+    worker_catalog = product_catalog
+    worker_country_data = country_data
+    worker_value_pools = value_pools
+    worker_product_names = product_names
+    worker_reference_date = reference_date
 
 
 def generate_a_row_product_data(args):
     """Genrates a single product data row.
+
+    The row holds the `subcategory_index` of the product instead of its
+    price, `generate_product_batch` prices the rows of a chunk at once.
     """
-    _, categories, currency_code, inflation, exchange_rate = args
-    category = random.choice(categories)
-    subcategories_dict = load_subcategories_from_yaml(category)
-    subcategories = list(subcategories_dict.keys())
-    subcategory = random.choice(subcategories)
-    prices = subcategories_dict[subcategory]
+    _, currency_code, inflation, exchange_rate = args
+    fake = get_faker()
+    reference_date = worker_reference_date or date.today()
+    product_catalog = worker_catalog if worker_catalog is not None else load_product_catalog()
+    offsets = product_catalog.subcategory_offsets
+    category = random.randrange(len(product_catalog.categories))
+    k = random.randrange(offsets[category], offsets[category + 1])
+    product_name = None
+    if worker_product_names is not None:
+        names, names_offsets = worker_product_names
+        if names_offsets[k] < names_offsets[k + 1]:
+            product_name = names[random.randrange(names_offsets[k], names_offsets[k + 1])]
     return {
         'product_id': fake.uuid4(),
-        'product_name': fake.bs().title(),
+        'product_name': product_name or fake.bs().title(),
         'description': fake.sentence(),
-        'category': category,
-        'subcategory': subcategory,
+        'category': product_catalog.categories[category],
+        'subcategory': product_catalog.subcategories[k],
+        'subcategory_index': k,
         'brand': fake.company(),
-        'price_in_usd': round(random.uniform(prices[0], prices[0]), 2),
         'inflation_rate': inflation,
         'exchange_rate': exchange_rate,
         'currency': currency_code,
-        'expiration_date': fake.date_between(start_date='+30d', end_date='+365d').strftime('%Y-%m-%d'),
+        'expiration_date': fake.date_between(
+            start_date=reference_date + timedelta(days=30),
+            end_date=reference_date + timedelta(days=365)).strftime('%Y-%m-%d'),
+    }
+
+
+def generate_product_columns(numb_products: int, rng: np.random.Generator) -> dict:
+    """Generates the columns of `numb_products` products with NumPy, drawing
+       the text fields from the worker's value pools.
+
+    Parameters
+    ----------
+        numb_products: the number of products to generate
+        rng: the random generator to use
+
+    Returns
+    -------
+        columns: a dict mapping column names to Arrow or NumPy arrays
+    """
+    product_catalog = worker_catalog
+    currency_code, inflation, exchange_rate = worker_country_data
+    offsets = product_catalog.subcategory_offsets
+    category = rng.integers(0, len(product_catalog.categories), size=numb_products)
+    sizes = offsets[category + 1] - offsets[category]
+    k = offsets[category] + (rng.random(numb_products) * sizes).astype(np.int64)
+
+    product_name = draw_from_pool(worker_value_pools['bs'], numb_products, rng)
+    if worker_product_names is not None:
+        names, names_offsets = worker_product_names
+        counts = names_offsets[k + 1] - names_offsets[k]
+        picks = names_offsets[k] + (rng.random(numb_products) * counts).astype(np.int64)
+        model_name = pa.array(names, pa.string()).take(picks.clip(max=len(names) - 1))
+        product_name = pc.if_else(pa.array(counts > 0), model_name, product_name)
+
+    price_in_usd = generate_prices(product_catalog.low_price[k], product_catalog.high_price[k],
+                                   product_catalog.price_distribution[k], inflation, rng)
+
+    reference_date = worker_reference_date or date.today()
+    expiration_labels = [(reference_date + timedelta(days=d)).strftime('%Y-%m-%d')
+                         for d in range(30, 366)]
+    return {
+        'product_id': generate_uuid4_array(numb_products, rng),
+        'product_name': product_name,
+        'description': draw_from_pool(worker_value_pools['sentence'], numb_products, rng),
+        'category': pa.array(product_catalog.categories, pa.string()).take(category),
+        'subcategory': pa.array(product_catalog.subcategories, pa.string()).take(k),
+        'brand': draw_from_pool(worker_value_pools['company'], numb_products, rng),
+        'price_in_usd': price_in_usd,
+        'inflation_rate': np.full(numb_products, inflation, dtype=float),
+        'exchange_rate': np.full(numb_products, exchange_rate, dtype=float),
+        'currency': pa.repeat(pa.scalar(currency_code, pa.string()), numb_products),
+        'expiration_date': draw_from_pool(expiration_labels, numb_products, rng),
     }
 
 
+def generate_product_batch(args):
+    """Generates the products of a contiguous range of rows as one batch.
+
+    Parameters
+    ----------
+        args: a tuple of (start, stop, seed, part_path). The random state of
+              the worker is seeded with `seed`. If `part_path` is given the
+              batch is written there instead of being returned.
+
+    Returns
+    -------
+        batch: the products as a pyarrow RecordBatch, or `part_path`
+    """
+    start, stop, seed, part_path = args
+    if worker_value_pools is not None:
+        columns = generate_product_columns(stop - start, np.random.default_rng(seed))
+        batch = pa.RecordBatch.from_pydict(columns, schema=PRODUCT_SCHEMA)
+    else:
+        random.seed(seed)
+        get_faker().seed_instance(seed)
+        rows = [generate_a_row_product_data((i, *worker_country_data)) for i in range(start, stop)]
+        product_catalog = worker_catalog if worker_catalog is not None else load_product_catalog()
+        _, inflation, _ = worker_country_data
+        k = np.fromiter((row['subcategory_index'] for row in rows), np.int64, len(rows))
+        prices = generate_prices(product_catalog.low_price[k], product_catalog.high_price[k],
+                                 product_catalog.price_distribution[k], inflation,
+                                 np.random.default_rng(seed))
+        for row, price in zip(rows, prices.tolist()):
+            row['price_in_usd'] = price
+        batch = rows_to_record_batch(rows, PRODUCT_SCHEMA)
+    if part_path is None:
+        return batch
+    pq.write_table(pa.Table.from_batches([batch]), part_path)
+    return part_path
+
+
 def generate_random_product_data(country_name: str, numb_products: int,
-                                 is_saved: bool = False):
-    """Generates random store data for a given country.
+                                 is_saved: bool = False,
+                                 chunk_size: int = 10_000,
+                                 numb_workers: int = None,
+                                 part_dir: str = None,
+                                 seed: int = None,
+                                 shard_index: int = 0,
+                                 num_shards: int = 1,
+                                 value_pool_size: int = None,
+                                 locale: str = 'en_US',
+                                 use_model_names: bool = False,
+                                 as_arrow: bool = False,
+                                 first_chunk: int = 0,
+                                 pool: mp.Pool = None,
+                                 reference_date: date = None):
+    """Generates random product data for a given country.
+
+    The rows are split into chunks of `chunk_size` rows. Each worker
+    generates a whole chunk and sends it back as a single Arrow record
+    batch, or writes it straight to a part file in `part_dir`.
 
     Parameters
     ----------
-        country_name: the country to generate store data for
-        numb_stores: the number of stores to generate
+        country_name: the country to generate product data for
+        numb_products: the number of products to generate
         is_saved: whether to save the generated data or not.
                   if True, the data will be saved in the current directory
                   with the name `products.parquet`
+        chunk_size: the number of rows generated per worker task
+        numb_workers: the number of worker processes, defaults to the
+                      number of cpus
+        part_dir: if given, the chunks are written by the workers to
+                  `part_dir/part-<k>.parquet`, see `helper_functions.PART_NAME`,
+                  and are not returned
+        seed: the seed of the run. The same seed and `chunk_size` always
+              give the same rows, whatever the number of workers or shards
+        shard_index: the index of the shard to generate
+        num_shards: the number of shards the rows are split into. Each
+                    shard holds a contiguous block of chunks
+        value_pool_size: if given, the product names, descriptions and brands
+                         are drawn from pools of that many Faker values,
+                         cached on disk, instead of calling Faker per row
+        locale: the Faker locale of the value pools
+        use_model_names: whether to draw the product names from the names
+                         generated by the fine-tuned T5 model for each
+                         subcategory, see `helper_functions.get_product_names`
+        as_arrow: whether to return a pyarrow Table instead of a pandas
+                  DataFrame
+        first_chunk: the index of the first chunk, to continue the rows of
+                     a previous run with new seeds
+        pool: a process pool to run on, e.g. shared by several countries,
+              a pool of `numb_workers` is created if None
+        reference_date: the day the expiration dates count from, defaults
+                        to today. Runs that must give the same products
+                        must share it
 
     Returns
     -------
-        stores: the generated stores
+        products: the generated products as a pandas DataFrame or a pyarrow
+                  Table, or the `part_dir` path if `part_dir` is given
     """
-    categories = load_categories_from_yaml()
-    currency_code, inflation, exchange_rate = get_country_data(country_name)
+    if reference_date is None:
+        reference_date = date.today()
+    if isinstance(reference_date, datetime):
+        reference_date = reference_date.date()
+    product_catalog = load_product_catalog()
+    country_data = get_country_data(country_name)
+    value_pools = None
+    if value_pool_size is not None:
+        value_pools = load_value_pools(PRODUCT_PROVIDERS, value_pool_size, locale)
+        value_pools['bs'] = pc.utf8_title(value_pools['bs'])
+    product_names = None
+    if use_model_names:
+        try:
+            product_names = get_product_names()
+        except Exception as e:
+            print(f'No product names from the model, using Faker names instead: {e}')
+        if product_names is not None and len(product_names[0]) == 0:
+            product_names = None
     formated_nb_products = f'{numb_products:,}'.replace(',', ' ')
 
-    with mp.Pool(mp.cpu_count()) as pool:
-        products = list(tqdm(pool.imap(generate_a_row_product_data,
-                                        [(i, categories, currency_code, inflation, exchange_rate)
-                                         for i in range(numb_products)]),
-                             total=numb_products, desc=f'Generating {formated_nb_products} products data!'))
+    tasks = get_chunk_tasks(numb_products, chunk_size, seed, 'products', shard_index, num_shards,
+                            first_chunk, part_dir)
+    numb_rows = sum(stop - start for start, stop, _, _ in tasks)
+
+    batches = []
+    results = imap_chunks(generate_product_batch, tasks, init_product_worker,
+                          (product_catalog, country_data, value_pools, product_names,
+                           reference_date),
+                          pool, numb_workers)
+    with phase('generate_rows', numb_rows), \
+            tqdm(total=numb_rows, desc=f'Generating {formated_nb_products} products data!') as pbar:
+        for (start, stop, _, _), batch in zip(tasks, results):
+            batches.append(batch)
+            pbar.update(stop - start)
 
-    product_df = pd.DataFrame(products)
+    if part_dir is not None:
+        return Path(part_dir)
+    products = pa.Table.from_batches(batches, PRODUCT_SCHEMA)
     if is_saved:
-        save_data(product_df, 'products.parquet')
-    return product_df
+        save_table(products, 'products.parquet')
+    return products if as_arrow else table_to_pandas(products)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,287 @@
+import os
+import time
+import argparse
+import pyarrow as pa
+from pathlib import Path
+import pyarrow.parquet as pq
+from datetime import datetime, timezone
+
+from instrumentation import instrumented
+
+
+REFERENCE_DATA_PATH = 'configs/reference_data.parquet'
+REFERENCE_DATA_VERSION = '1'
+CACHE_TTL = 3600
+MAX_AGE = 7 * 24 * 3600
+
+REFERENCE_SCHEMA = pa.schema([
+    ('country_name', pa.string()),
+    ('country_code', pa.string()),
+    ('currency_code', pa.string()),
+    ('exchange_rate', pa.float64()),
+    ('inflation_rate', pa.float64()),
+    ('regions', pa.list_(pa.string())),
+    ('fetched_at', pa.timestamp('s', tz='UTC')),
+], metadata={'version': REFERENCE_DATA_VERSION})
+
+_reference_cache = {}
+
+
+def is_offline() -> bool:
+    """Returns True when the network must not be used, i.e. when the
+       `RETAIL_FAKER_OFFLINE` environment variable is set to 1, true or yes.
+    """
+    return os.environ.get('RETAIL_FAKER_OFFLINE', '').lower() in ('1', 'true', 'yes')
+
+
+def load_reference_data(file_path: str=REFERENCE_DATA_PATH, ttl: float=CACHE_TTL) -> dict:
+    """Loads the reference data snapshot.
+
+    The snapshot is kept in memory for `ttl` seconds, and is read again
+    sooner only if the file changed on disk.
+
+    Parameters
+    ----------
+        file_path: path to the parquet snapshot
+        ttl: the number of seconds the snapshot is cached for
+
+    Returns
+    -------
+        reference_data: a dict mapping country names to their reference data
+    """
+    file_path = Path(file_path).resolve()
+    mtime = file_path.stat().st_mtime_ns if file_path.exists() else None
+    cached = _reference_cache.get(file_path)
+    if cached is not None and cached[1] == mtime and time.monotonic() - cached[0] < ttl:
+        return cached[2]
+
+    reference_data = {}
+    if mtime is not None:
+        table = pq.read_table(file_path)
+        version = (table.schema.metadata or {}).get(b'version', b'').decode()
+        if version != REFERENCE_DATA_VERSION:
+            print(f'Ignoring reference data snapshot {file_path} with version {version!r}')
+        else:
+            reference_data = {row['country_name']: row for row in table.to_pylist()}
+    _reference_cache[file_path] = (time.monotonic(), mtime, reference_data)
+    return reference_data
+
+
+def save_reference_data(reference_data: dict, file_path: str=REFERENCE_DATA_PATH) -> Path:
+    """Writes the reference data snapshot.
+
+    The file is written next to its destination then renamed, so readers
+    never see a partially written snapshot.
+
+    Parameters
+    ----------
+        reference_data: a dict mapping country names to their reference data
+        file_path: path to the parquet snapshot
+
+    Returns
+    -------
+        file_path: the path of the written snapshot
+    """
+    file_path = Path(file_path)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    rows = sorted(reference_data.values(), key=lambda row: row['country_name'])
+    table = pa.Table.from_pylist(rows, schema=REFERENCE_SCHEMA)
+    tmp_path = file_path.with_name(file_path.name + '.tmp')
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, file_path)
+    _reference_cache.pop(file_path.resolve(), None)
+    return file_path
+
+
+def build_local_reference(country_name: str) -> dict:
+    """Builds the reference data of a country from the locally installed
+       packages only. The exchange and inflation rates are left empty.
+
+    Parameters
+    ----------
+        country_name: the name of the country
+
+    Returns
+    -------
+        reference: the reference data of the country
+    """
+    import pycountry
+    from countryinfo import CountryInfo
+
+    country = pycountry.countries.lookup(country_name)
+    try:
+        currency_code = CountryInfo(country.name).currencies()[0]
+    except Exception:
+        currency_code = None
+    return {
+        'country_name': country_name,
+        'country_code': country.alpha_2,
+        'currency_code': currency_code,
+        'exchange_rate': None,
+        'inflation_rate': None,
+        'regions': [subdivision.name for subdivision in
+                    pycountry.subdivisions.get(country_code=country.alpha_2) or []],
+        'fetched_at': None,
+    }
+
+
+def merge_reference(previous: dict, reference: dict) -> dict:
+    """Returns the reference data to keep for a country after a fetch: the
+       fetched one, unless some of its requests failed and the snapshot
+       already has an entry for the country.
+
+    A partly failed fetch has no `fetched_at`, so when it is saved for a
+    country without a complete entry, the next run fetches it again.
+    """
+    if (reference['fetched_at'] is None and previous is not None
+            and previous['fetched_at'] is not None):
+        return previous
+    return reference
+
+
+def fetch_country_reference(country_name: str) -> dict:
+    """Fetches the reference data of a country from the network, its
+       rates being requested concurrently, see `reference_fetch`.
+
+    Parameters
+    ----------
+        country_name: the name of the country
+
+    Returns
+    -------
+        reference: the reference data of the country
+    """
+    from reference_fetch import fetch_references
+
+    reference = fetch_references([country_name])[country_name]
+    if isinstance(reference, Exception):
+        raise reference
+    return reference
+
+
+def is_fresh(reference: dict, max_age: float=MAX_AGE) -> bool:
+    """Returns True if the reference data of a country was fetched less
+       than `max_age` seconds ago. A partly failed fetch has no
+       `fetched_at`, and is never fresh.
+    """
+    fetched_at = reference['fetched_at']
+    return (fetched_at is not None and
+            (datetime.now(timezone.utc) - fetched_at).total_seconds() < max_age)
+
+
+@instrumented('reference_data')
+def get_country_reference(country_name: str, offline: bool=None,
+                          file_path: str=REFERENCE_DATA_PATH,
+                          max_age: float=MAX_AGE) -> dict:
+    """Returns the reference data of a country.
+
+    The data is read from the local snapshot. When the network may be used,
+    countries missing from the snapshot or older than `max_age` seconds are
+    fetched and written back to it, a failed fetch keeping the previous
+    entry of the country. In offline mode the network is never
+    used, and a country missing from the snapshot only gets the data
+    available from the installed packages.
+
+    Parameters
+    ----------
+        country_name: the name of the country
+        offline: whether to avoid the network, defaults to `is_offline()`
+        file_path: path to the parquet snapshot
+        max_age: the age in seconds after which a snapshot entry is refetched
+
+    Returns
+    -------
+        reference: a dict with the country_code, currency_code, exchange_rate,
+                   inflation_rate and regions of the country
+    """
+    if offline is None:
+        offline = is_offline()
+    reference_data = load_reference_data(file_path)
+    reference = reference_data.get(country_name)
+    if reference is not None and (offline or is_fresh(reference, max_age)):
+        return reference
+
+    if offline:
+        print(f'No reference data for {country_name} in {file_path}, rates are left empty.')
+        return build_local_reference(country_name)
+
+    try:
+        reference = fetch_country_reference(country_name)
+    except Exception as e:
+        print(f'Error fetching reference data for {country_name}: {e}')
+        return reference if reference is not None else build_local_reference(country_name)
+    reference = merge_reference(reference_data.get(country_name), reference)
+    if reference is not reference_data.get(country_name):
+        save_reference_data({**reference_data, country_name: reference}, file_path)
+    return reference
+
+
+def refresh_reference_data(country_names: list=None,
+                           file_path: str=REFERENCE_DATA_PATH) -> Path:
+    """Fetches the reference data of the given countries from the network
+       and rebuilds the snapshot.
+
+    Parameters
+    ----------
+        country_names: the countries to fetch, defaults to the countries
+                       already in the snapshot, or to all the countries if
+                       the snapshot is empty
+        file_path: path to the parquet snapshot
+
+    Returns
+    -------
+        file_path: the path of the written snapshot
+    """
+    import pycountry
+
+    from reference_fetch import fetch_references
+
+    reference_data = dict(load_reference_data(file_path))
+    if not country_names:
+        country_names = list(reference_data) or [country.name for country in pycountry.countries]
+    for country_name, reference in fetch_references(country_names).items():
+        if isinstance(reference, Exception):
+            print(f'Error fetching reference data for {country_name}: {reference}')
+        else:
+            reference_data[country_name] = merge_reference(reference_data.get(country_name),
+                                                           reference)
+    return save_reference_data(reference_data, file_path)
+
+
+def prefetch_reference_data(country_names: list, offline: bool=None,
+                            file_path: str=REFERENCE_DATA_PATH,
+                            max_age: float=MAX_AGE) -> None:
+    """Fetches the countries missing from the snapshot or older than
+       `max_age` seconds all at once, so a multi-country run doesn't wait
+       for their requests one country after another.
+
+    Parameters
+    ----------
+        country_names: the names of the countries
+        offline: whether to avoid the network, defaults to `is_offline()`.
+                 Nothing is fetched when offline
+        file_path: path to the parquet snapshot
+        max_age: the age in seconds after which a snapshot entry is refetched
+    """
+    if offline is None:
+        offline = is_offline()
+    reference_data = load_reference_data(file_path)
+    stale = [country_name for country_name in country_names
+             if country_name not in reference_data or not is_fresh(reference_data[country_name],
+                                                                     max_age)]
+    if offline or not stale:
+        return
+    refresh_reference_data(stale, file_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Manage the country reference data snapshot.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    refresh_parser = subparsers.add_parser('refresh', help='rebuild the snapshot from the network')
+    refresh_parser.add_argument('countries', nargs='*', help='the countries to refresh')
+    refresh_parser.add_argument('--file-path', default=REFERENCE_DATA_PATH)
+    args = parser.parse_args()
+
+    if args.command == 'refresh':
+        saved_to = refresh_reference_data(args.countries, args.file_path)
+        print(f'Reference data saved to {saved_to}')
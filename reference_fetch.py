@@ -0,0 +1,242 @@
+import random
+import functools
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from helper_functions import get_country_code
+from helper_functions import get_currency_code
+from helper_functions import get_regions_of_country
+from instrumentation import count
+
+
+DEFAULT_URLS = {
+    # The source forex_python reads its rates from.
+    'exchange_rate': 'https://theratesapi.com/api/latest',
+    'inflation_rate': 'http://api.worldbank.org/v2/country/{country_code}/indicator/FP.CPI.TOTL.ZG',
+}
+MAX_CONCURRENCY = 16
+# (connect, read) timeouts in seconds.
+TIMEOUT = (3.05, 10)
+MAX_RETRIES = 3
+BACKOFF = 0.5
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class FetchError(Exception):
+    """Raised when a request still fails after its retries.
+    """
+
+
+class AsyncFetcher:
+    """Fetches JSON documents concurrently over one pooled HTTP session.
+
+    Requests run on a pool of `max_concurrency` threads sharing one
+    `requests.Session`, so the connections to each host are kept alive
+    and reused. At most
+    `max_concurrency` requests are in flight at a time. Identical requests
+    are coalesced: a request made while the same one is in flight, or
+    after it completed, waits for and returns the same response.
+
+    Failed requests, i.e. timeouts, connection errors and the
+    `RETRY_STATUSES`, are retried up to `max_retries` times with an
+    exponential backoff and full jitter, honouring the `Retry-After` header.
+
+    Parameters
+    ----------
+        urls: the urls of the sources, see `DEFAULT_URLS`, e.g. to point
+              them to a local server
+        max_concurrency: the maximum number of requests in flight
+        timeout: the (connect, read) timeouts of a request in seconds
+        max_retries: the number of retries of a failed request
+        backoff: the base delay in seconds between retries
+    """
+
+    def __init__(self, urls: dict = None, max_concurrency: int = MAX_CONCURRENCY,
+                 timeout: tuple = TIMEOUT, max_retries: int = MAX_RETRIES,
+                 backoff: float = BACKOFF):
+        import requests
+
+        self.urls = {**DEFAULT_URLS, **(urls or {})}
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=max_concurrency,
+                                                pool_maxsize=max_concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_concurrency, thread_name_prefix='fetch')
+        self._max_concurrency = max_concurrency
+        self._loop = None
+        self._semaphore = None
+        self._requests = {}
+
+    def close(self) -> None:
+        self._executor.shutdown()
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    async def get_json(self, url: str, params: dict = None):
+        """Returns the decoded JSON response of a GET request, coalescing
+           identical requests.
+        """
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Tasks and semaphores belong to the event loop they were made in.
+            self._loop, self._requests = loop, {}
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        key = (url, tuple(sorted((params or {}).items())))
+        if key not in self._requests:
+            self._requests[key] = asyncio.ensure_future(self._get_json(url, params))
+        return await self._requests[key]
+
+    async def _get_json(self, url: str, params: dict = None):
+        import requests
+
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                async with self._semaphore:
+                    response = await self._loop.run_in_executor(
+                        self._executor,
+                        functools.partial(self.session.get, url, params=params,
+                                          timeout=self.timeout))
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    return response.json()
+                error = FetchError(f'{url} returned {response.status_code}')
+                retry_after = response.headers.get('Retry-After')
+            except (requests.Timeout, requests.ConnectionError) as e:
+                error = e
+            except requests.RequestException as e:
+                raise FetchError(f'{url} failed: {e}') from e
+
+            if attempt == self.max_retries:
+                break
+            count('retries')
+            delay = random.uniform(0, self.backoff * 2 ** attempt)
+            if retry_after is not None and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            await asyncio.sleep(delay)
+        raise FetchError(f'{url} failed after {self.max_retries} retries: {error}')
+
+
+async def fetch_exchange_rate(fetcher: AsyncFetcher, currency_code: str) -> float:
+    """Returns the value in USD of one unit of a currency.
+    """
+    if currency_code is None:
+        return None
+    if currency_code == 'USD':
+        return 1.
+    data = await fetcher.get_json(fetcher.urls['exchange_rate'],
+                                  {'base': currency_code, 'symbols': 'USD', 'rtype': 'fpy'})
+    return data.get('rates', {}).get('USD')
+
+
+async def fetch_inflation_rate(fetcher: AsyncFetcher, country_code: str) -> float:
+    """Returns the latest yearly inflation rate of a country, as a fraction,
+       from the World Bank.
+    """
+    end_year = datetime.now().year
+    url = fetcher.urls['inflation_rate'].format(country_code=country_code)
+    data = await fetcher.get_json(url, {'format': 'json', 'date': f'{end_year - 2}:{end_year}'})
+    if len(data) < 2 or data[1] is None:
+        return None
+    # The years are sorted from the latest one, which may not be published yet.
+    for entry in data[1]:
+        if entry.get('value') is not None:
+            return entry['value'] / 100.0
+    return None
+
+
+def lookup_country(country_name: str) -> tuple:
+    """Returns the country code, currency code and regions of a country
+       from the installed packages.
+    """
+    return (get_country_code(country_name), get_currency_code(country_name),
+            get_regions_of_country(country_name))
+
+
+async def fetch_country_reference_async(fetcher: AsyncFetcher, country_name: str) -> dict:
+    """Fetches the reference data of a country, its exchange and inflation
+       rates, concurrently.
+
+    The codes and regions of the country are looked up on a thread, so the
+    lookups of a country don't hold up the requests of the others. A rate
+    that can't be fetched is left empty, as in
+    `helper_functions.get_exchange_rate`, and the reference then has no
+    `fetched_at`, so it is fetched again by the next run.
+
+    Parameters
+    ----------
+        fetcher: the fetcher to use
+        country_name: the name of the country
+
+    Returns
+    -------
+        reference: the reference data of the country
+    """
+    loop = asyncio.get_running_loop()
+    country_code, currency_code, regions = await loop.run_in_executor(None, lookup_country,
+                                                                      country_name)
+
+    results = await asyncio.gather(fetch_exchange_rate(fetcher, currency_code),
+                                   fetch_inflation_rate(fetcher, country_code),
+                                   return_exceptions=True)
+    failed = False
+    for result in results:
+        if isinstance(result, Exception):
+            print(f'Error fetching reference data for {country_name}: {result}')
+            failed = True
+    exchange_rate, inflation_rate = [None if isinstance(result, Exception) else result
+                                     for result in results]
+
+    return {
+        'country_name': country_name,
+        'country_code': country_code,
+        'currency_code': currency_code,
+        'exchange_rate': exchange_rate,
+        'inflation_rate': inflation_rate,
+        'regions': regions,
+        'fetched_at': None if failed else datetime.now(timezone.utc),
+    }
+
+
+async def fetch_references_async(country_names: list, fetcher: AsyncFetcher = None) -> dict:
+    """Fetches the reference data of several countries concurrently, see
+       `fetch_references`.
+    """
+    if fetcher is None:
+        with AsyncFetcher() as fetcher:
+            return await fetch_references_async(country_names, fetcher)
+    results = await asyncio.gather(*[fetch_country_reference_async(fetcher, country_name)
+                                     for country_name in country_names],
+                                   return_exceptions=True)
+    return dict(zip(country_names, results))
+
+
+def fetch_references(country_names: list, fetcher: AsyncFetcher = None) -> dict:
+    """Fetches the reference data of several countries concurrently.
+
+    The requests of all the countries overlap, share one connection pool
+    and are coalesced, e.g. the exchange rate of the euro is fetched once
+    for all the euro countries.
+
+    Parameters
+    ----------
+        country_names: the names of the countries
+        fetcher: the fetcher to use, a default one is created if None
+
+    Returns
+    -------
+        references: a dict mapping each country to its reference data, or
+                    to the exception raised for it, e.g. for an unknown
+                    country
+    """
+    return asyncio.run(fetch_references_async(country_names, fetcher))
@@ -0,0 +1,253 @@
+import os
+import hashlib
+import argparse
+import numpy as np
+import pyarrow as pa
+from pathlib import Path
+from typing import NamedTuple
+
+from gazetteer import normalize_name
+
+
+CROSSWALK_DIR = 'configs'
+CROSSWALK_VERSION = '1'
+CROSSWALK_SCHEMA = pa.schema([
+    ('code', pa.string()),
+    ('country_code', pa.string()),
+    ('country_name', pa.string()),
+    ('region_name', pa.string()),
+    ('shapefile_rows', pa.list_(pa.int64())),
+    ('area_km2', pa.float64()),
+    ('min_longitude', pa.float64()),
+    ('min_latitude', pa.float64()),
+    ('max_longitude', pa.float64()),
+    ('max_latitude', pa.float64()),
+    ('geometry', pa.binary()),
+])
+# The columns of the Natural Earth admin 1 shapefile used for the join.
+SHAPEFILE_COLUMNS = ['iso_3166_2', 'iso_a2', 'name']
+KM_PER_DEGREE = 111.32
+
+
+class Region(NamedTuple):
+    """A pycountry subdivision joined to its shapefile geometry.
+    """
+    code: str
+    area_km2: float
+    bounds: tuple
+    geometry: object
+
+
+_crosswalk_cache = {}
+
+
+def get_shapefile_version(shapefile_path: str) -> str:
+    """Returns a digest identifying a shapefile and the pycountry release
+       it is joined to, so a crosswalk is rebuilt when either changes.
+    """
+    import pycountry
+
+    shapefile_path = Path(shapefile_path)
+    parts = [CROSSWALK_VERSION, getattr(pycountry, '__version__', '')]
+    version_path = shapefile_path.with_suffix('.VERSION.txt')
+    if version_path.exists():
+        parts.append(version_path.read_text().strip())
+    for suffix in ['.shp', '.dbf']:
+        stat = shapefile_path.with_suffix(suffix).stat()
+        parts += [str(stat.st_size), str(stat.st_mtime_ns)]
+    return hashlib.sha1('\n'.join(parts).encode()).hexdigest()[:16]
+
+
+def get_crosswalk_path(shapefile_path: str) -> Path:
+    """Returns the path the crosswalk of a shapefile is persisted to.
+    """
+    return Path(CROSSWALK_DIR) / f'{Path(shapefile_path).stem}.crosswalk.arrow'
+
+
+def get_area_km2(geometry) -> float:
+    """Returns the approximate area of a geometry in longitude and latitude
+       degrees, in square kilometers.
+    """
+    import shapely
+
+    parts = shapely.get_parts(geometry)
+    latitude = shapely.get_coordinates(shapely.centroid(parts))[:, 1]
+    return float(np.sum(shapely.area(parts) * np.cos(np.radians(latitude)))) * KM_PER_DEGREE ** 2
+
+
+def build_crosswalk(shapefile_path: str) -> pa.Table:
+    """Joins the pycountry subdivisions to the regions of a shapefile.
+
+    A shapefile region is matched to a subdivision by its ISO 3166-2 code,
+    or by its name within its country when the code is unknown to
+    pycountry. A subdivision without a region of its own, e.g. a French
+    region when the shapefile has its departments, gets the union of the
+    regions of its sub-subdivisions.
+
+    Parameters
+    ----------
+        shapefile_path: path to the shapefile
+
+    Returns
+    -------
+        crosswalk: a table with the columns of `CROSSWALK_SCHEMA`, one row
+                   per subdivision with a geometry
+    """
+    import shapely
+    import pycountry
+    import geopandas as gpd
+
+    gdf = gpd.read_file(shapefile_path, columns=SHAPEFILE_COLUMNS)
+    subdivisions = {subdivision.code: subdivision for subdivision in pycountry.subdivisions}
+    codes_by_name = {(subdivision.country_code, normalize_name(subdivision.name)): code
+                     for code, subdivision in subdivisions.items()}
+
+    direct_rows, descendant_rows = {}, {}
+    for row, (code, country_code, name, geometry) in enumerate(
+            zip(gdf['iso_3166_2'], gdf['iso_a2'], gdf['name'], gdf.geometry)):
+        if geometry is None or geometry.is_empty:
+            continue
+        if code not in subdivisions:
+            country_code = str(code).split('-')[0] if country_code in (None, '-99') else country_code
+            code = codes_by_name.get((country_code, normalize_name(name)))
+            if code is None:
+                continue
+        direct_rows.setdefault(code, []).append(row)
+        parent_code = subdivisions[code].parent_code
+        while parent_code in subdivisions:
+            descendant_rows.setdefault(parent_code, []).append(row)
+            parent_code = subdivisions[parent_code].parent_code
+
+    columns = {name: [] for name in CROSSWALK_SCHEMA.names}
+    for code in sorted(direct_rows.keys() | descendant_rows.keys()):
+        rows = direct_rows.get(code) or descendant_rows[code]
+        geometry = shapely.union_all(gdf.geometry.values[rows])
+        subdivision = subdivisions[code]
+        country = pycountry.countries.get(alpha_2=subdivision.country_code)
+        columns['code'].append(code)
+        columns['country_code'].append(subdivision.country_code)
+        columns['country_name'].append(country.name if country is not None else None)
+        columns['region_name'].append(subdivision.name)
+        columns['shapefile_rows'].append(rows)
+        columns['area_km2'].append(get_area_km2(geometry))
+        for name, bound in zip(['min_longitude', 'min_latitude', 'max_longitude', 'max_latitude'],
+                               geometry.bounds):
+            columns[name].append(bound)
+        columns['geometry'].append(shapely.to_wkb(geometry))
+    return pa.table(columns, schema=CROSSWALK_SCHEMA)
+
+
+def save_crosswalk(crosswalk: pa.Table, file_path: str, version: str) -> Path:
+    """Writes a crosswalk as an Arrow IPC file tagged with the version of
+       its shapefile.
+    """
+    crosswalk = crosswalk.replace_schema_metadata({'version': version})
+    file_path = Path(file_path)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = file_path.with_name(f'{file_path.name}.{os.getpid()}.tmp')
+    with pa.OSFile(str(tmp_path), 'wb') as sink:
+        with pa.ipc.new_file(sink, crosswalk.schema) as writer:
+            writer.write_table(crosswalk)
+    os.replace(tmp_path, file_path)
+    return file_path
+
+
+def read_crosswalk(file_path: str, version: str) -> pa.Table:
+    """Reads a persisted crosswalk, or returns None if there is none or it
+       was built from another version of the shapefile.
+    """
+    file_path = Path(file_path)
+    if not file_path.exists():
+        return None
+    crosswalk = pa.ipc.open_file(pa.memory_map(str(file_path), 'r')).read_all()
+    metadata = crosswalk.schema.metadata or {}
+    if metadata.get(b'version', b'').decode() != version:
+        return None
+    return crosswalk
+
+
+def load_crosswalk(shapefile_path: str, crosswalk_path: str=None) -> dict:
+    """Loads the crosswalk of a shapefile, once per process.
+
+    The crosswalk is built on first use and persisted next to the
+    configs, then only read back until the shapefile or pycountry change.
+    The geometries are prepared, so repeated containment tests against
+    them are fast.
+
+    Parameters
+    ----------
+        shapefile_path: path to the shapefile
+        crosswalk_path: where to persist the crosswalk, defaults to
+                        `get_crosswalk_path(shapefile_path)`
+
+    Returns
+    -------
+        crosswalk: a dict mapping (country_name, region_name) to its `Region`
+    """
+    shapefile_path = str(Path(shapefile_path).resolve())
+    if shapefile_path in _crosswalk_cache:
+        return _crosswalk_cache[shapefile_path]
+
+    import shapely
+
+    if crosswalk_path is None:
+        crosswalk_path = get_crosswalk_path(shapefile_path)
+    version = get_shapefile_version(shapefile_path)
+    table = read_crosswalk(crosswalk_path, version)
+    if table is None:
+        print(f'Building the region crosswalk of {shapefile_path}')
+        table = build_crosswalk(shapefile_path)
+        save_crosswalk(table, crosswalk_path, version)
+
+    geometries = shapely.from_wkb(table['geometry'].to_numpy(zero_copy_only=False))
+    shapely.prepare(geometries)
+    bounds = np.column_stack([table[name].to_numpy() for name in
+                              ['min_longitude', 'min_latitude', 'max_longitude', 'max_latitude']])
+    crosswalk = {}
+    for k, (code, country_name, region_name, area_km2) in enumerate(zip(
+            table['code'].to_pylist(), table['country_name'].to_pylist(),
+            table['region_name'].to_pylist(), table['area_km2'].to_pylist())):
+        # Subdivisions sharing a name keep the first one, by code.
+        crosswalk.setdefault((country_name, region_name),
+                             Region(code, area_km2, tuple(bounds[k].tolist()), geometries[k]))
+    _crosswalk_cache[shapefile_path] = crosswalk
+    return crosswalk
+
+
+def get_region_weights(crosswalk: dict, country_name: str, regions: list) -> np.ndarray:
+    """Returns the probability of each region of a country, proportional
+       to its area.
+
+    Regions missing from the crosswalk get the mean area of the others,
+    so they keep a share of the stores.
+
+    Parameters
+    ----------
+        crosswalk: the crosswalk, see `load_crosswalk`
+        country_name: the name of the country
+        regions: the regions of the country
+
+    Returns
+    -------
+        weights: the probabilities of the regions, uniform if none of them
+                 is in the crosswalk
+    """
+    areas = np.array([crosswalk[(country_name, region_name)].area_km2
+                      if (country_name, region_name) in crosswalk else np.nan
+                      for region_name in regions], dtype=np.float64)
+    if np.isnan(areas).all():
+        return np.full(len(regions), 1 / len(regions))
+    areas[np.isnan(areas)] = np.nanmean(areas)
+    return areas / areas.sum()
+
+
+if __name__ == '__main__':
+    from helper_functions import SHAPEFILE_PATH
+
+    parser = argparse.ArgumentParser(description='Build the region crosswalk of a shapefile.')
+    parser.add_argument('--shapefile', default=SHAPEFILE_PATH)
+    parser.add_argument('--file-path', default=None)
+    args = parser.parse_args()
+
+    crosswalk = load_crosswalk(args.shapefile, args.file_path)
+    print(f'{len(crosswalk)} regions in the crosswalk of {args.shapefile}')
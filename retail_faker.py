@@ -1,43 +1,445 @@
 
+import json
+import yaml
+import argparse
+import numpy as np
+import pyarrow as pa
+from pathlib import Path
+import multiprocessing as mp
+from datetime import date, datetime, timedelta
 from products import generate_random_product_data
-from transactions import generate_random_transaction_data
+from transactions import stream_random_transaction_data
 from stores import generate_random_store_data
+from customers import generate_random_customer_data
+from helper_functions import save_table
+from helper_functions import append_table
+from helper_functions import save_batches
+from helper_functions import remove_output
+from helper_functions import derive_chunk_seeds
+from helper_functions import OUTPUT_FORMATS
+from helper_functions import PART_NAME
+from reference_data import prefetch_reference_data
+from manifest import MANIFEST_PATH
+from manifest import new_manifest
+from manifest import load_manifest
+from manifest import save_manifest
+from manifest import get_table_entry
+from manifest import record_rows
+from manifest import record_run
+import instrumentation
+from instrumentation import phase
 
 
+# The number of rows per chunk of each table. Chunks are the unit of
+# seeding, so appending runs must use the same sizes as the first run.
+CHUNK_SIZES = {
+    'products': 10_000,
+    'stores': 10_000,
+    'customers': 1_000_000,
+    'transactions': 1_000_000,
+}
+NUMB_DAYS = 366
+TABLE_NAMES = ['products', 'stores', 'customers', 'transactions']
+
+# The number of rows of each table for the sizes of the `generate` command.
+SIZE_PRESETS = {
+    'S': {'stores': 10, 'products': 1_000, 'customers': 1_000, 'transactions': 100_000},
+    'M': {'stores': 100, 'products': 10_000, 'customers': 100_000, 'transactions': 10_000_000},
+    'L': {'stores': 1_000, 'products': 100_000, 'customers': 1_000_000,
+          'transactions': 100_000_000},
+    'XL': {'stores': 10_000, 'products': 1_000_000, 'customers': 10_000_000,
+           'transactions': 1_000_000_000},
+}
+
+
+def print_json_line(record: dict, file=None) -> None:
+    """Prints a telemetry record as a line of JSON, on stdout by default.
+    """
+    print(json.dumps(record, default=str), file=file, flush=True)
+
 
 def generate_random_retail_data(country_name: str,
                                 num_stores: int,
                                 num_products: int,
                                 num_transactions: int,
-                                numb_unique_ids: int):
+                                num_customers: int,
+                                seed: int = None,
+                                shard_index: int = 0,
+                                num_shards: int = 1,
+                                reference_date: datetime = None,
+                                partition_by: list = None,
+                                numb_workers: int = None,
+                                chunk_size: int = None,
+                                output_format: str = 'parquet',
+                                telemetry=None) -> dict:
     """Generates random retail data for a given country.
 
+    With a seed the data is reproducible, and can be split into
+    `num_shards` shards generated by different processes or nodes. Every
+    shard generates the same products, stores and customers, which only shard 0
+    saves, and its own block of transactions saved as
+    `transactions-<shard_index>.parquet`. Concatenating the transaction
+    shards in order gives the transactions of a single run.
+
+    Shard 0 also writes `manifest.json`, which records the seed and the
+    rows of each table so `append_retail_data` can extend the dataset, if
+    its transactions are partitioned by date.
+
     Parameters
     ----------
         country_name: the country to generate retail data for
         num_stores: the number of stores to generate
         num_products: the number of products to generate
         num_transactions: the number of transactions to generate
+        num_customers: the number of customers to generate
+        seed: the seed of the run, a random one is drawn and recorded in the
+              manifest if None
+        shard_index: the index of the shard to generate
+        num_shards: the number of shards the transactions are split into
+        reference_date: the last day of the transaction timestamps, which
+                        the product expiration and customer signup
+                        dates count from too.
+                        Shards of the same dataset must share it, defaults
+                        to today
+        partition_by: the columns to partition the transactions by, e.g.
+                      ['date']. All the shards then write to a single
+                      `transactions.parquet` dataset folder
+        numb_workers: the number of worker processes of the products and
+                      stores, defaults to the number of cpus. The
+                      transactions use as many workers sharing the
+                      products in shared memory, or none if None
+        chunk_size: the number of rows per chunk of every table, defaults
+                    to `CHUNK_SIZES`. The same seed and chunk size always
+                    give the same data
+        output_format: one of `OUTPUT_FORMATS`. Only parquet datasets can
+                       be extended by `append_retail_data`
+        telemetry: a function called with the record of each phase and of
+                   the run, e.g. `print_json_line`, see `instrumentation.phase`
+
+    Returns
+    -------
+        summary: the record of the run, with its duration, rows and seed
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format {output_format}, expected one of "
+                         f"{OUTPUT_FORMATS}")
+    if reference_date is None:
+        reference_date = date.today()
+    if isinstance(reference_date, datetime):
+        reference_date = reference_date.date()
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy)
+    chunk_sizes = {table_name: chunk_size or CHUNK_SIZES[table_name] for table_name in TABLE_NAMES}
+    rows = {'products': num_products, 'stores': num_stores, 'customers': num_customers,
+            'transactions': num_transactions}
+
+    with phase('run', sum(rows.values()), telemetry) as summary:
+        summary.update(event='run', country=country_name, seed=seed, shard_index=shard_index,
+                       num_shards=num_shards, output_format=output_format)
+        with phase('products', num_products, telemetry):
+            products = generate_random_product_data(country_name, num_products, seed=seed,
+                                                    as_arrow=True, numb_workers=numb_workers,
+                                                    chunk_size=chunk_sizes['products'],
+                                                    reference_date=reference_date)
+        with phase('stores', num_stores, telemetry):
+            stores = generate_random_store_data(country_name, num_stores, seed=seed,
+                                                as_arrow=True, numb_workers=numb_workers,
+                                                chunk_size=chunk_sizes['stores'])
+        with phase('customers', num_customers, telemetry):
+            customers = generate_random_customer_data(country_name, num_customers, seed=seed,
+                                                      as_arrow=True,
+                                                      chunk_size=chunk_sizes['customers'],
+                                                      reference_date=reference_date)
+        if shard_index == 0:
+            with phase('save', num_products + num_stores + num_customers, telemetry):
+                save_table(products, f'products.{output_format}')
+                save_table(stores, f'stores.{output_format}')
+                save_table(customers, f'customers.{output_format}')
+
+        file_name = f'transactions.{output_format}'
+        if num_shards > 1 and not partition_by:
+            file_name = f'transactions-{shard_index:05d}.{output_format}'
+        with phase('transactions', num_transactions, telemetry):
+            stream_random_transaction_data(num_transactions,
+                                           batch_size=chunk_sizes['transactions'],
+                                           seed=seed, shard_index=shard_index,
+                                           num_shards=num_shards, reference_date=reference_date,
+                                           products=products, customers=customers, stores=stores,
+                                           file_name=file_name, partition_by=partition_by,
+                                           numb_days=NUMB_DAYS, numb_workers=numb_workers)
+
+        if shard_index == 0:
+            manifest = new_manifest(country_name, seed)
+            manifest['output_format'] = output_format
+            for table_name, numb_rows in rows.items():
+                record_rows(manifest, table_name, numb_rows, chunk_sizes[table_name])
+            first_day = reference_date - timedelta(days=NUMB_DAYS - 1)
+            record_rows(manifest, 'transactions', 0, chunk_sizes['transactions'],
+                        first_day=first_day.isoformat(), last_day=reference_date.isoformat(),
+                        partition_by=list(partition_by or []))
+            record_run(manifest, 'full', rows)
+            save_manifest(manifest)
+    return summary
+
+
+def check_date_partitioned(manifest: dict,
+                           file_path: str = 'retail_data/transactions.parquet') -> None:
+    """Raises a ValueError unless the transactions of the dataset are a
+       folder partitioned by date only, which a day of transactions can be
+       added to as new files. New rows added to a single file, or to a
+       folder with other partitions, would read back without a date.
+    """
+    partition_by = get_table_entry(manifest, 'transactions').get('partition_by', ['date'])
+    file_path = Path(file_path)
+    if partition_by != ['date'] or not file_path.is_dir() or any(
+            not path.name.startswith('date=') for path in file_path.iterdir()):
+        raise ValueError(f"Only transactions partitioned by date can be extended, generate "
+                         f"{file_path} with partition_by=['date'] first")
+
+
+def append_retail_data(num_transactions: int,
+                       day: date = None,
+                       num_products: int = 0,
+                       num_stores: int = 0,
+                       num_customers: int = 0) -> dict:
+    """Adds a day of transactions, and optionally new products, stores and
+       customers, to the dataset in `retail_data`, without rewriting it.
+
+    The transactions must have been generated with `partition_by=['date']`.
+    The seed and the next chunk of each table are read from the manifest,
+    so the new rows get fresh seeds and ids. New products, stores and
+    customers are written as new parts of their dataset folder, and the
+    transactions as new files in the `date` partition of the day. The
+    existing tables are only read for the columns the baskets are drawn
+    from, so a run costs the new rows, not the whole dataset.
+
+    Parameters
+    ----------
+        num_transactions: the number of transactions of the day
+        day: the day of the transactions, defaults to the day after the
+             last day of the dataset
+        num_products: the number of new products
+        num_stores: the number of new stores
+        num_customers: the number of new customers
 
     Returns
     -------
-        stores: the generated stores
-        products: the generated products
-        transactions: the generated transactions
+        manifest: the updated manifest
     """
-    generate_random_product_data(country_name, num_products, is_saved=True)
-    generate_random_store_data(country_name, num_stores, is_saved=True)
-    generate_random_transaction_data(num_transactions, numb_unique_ids, is_saved=True)
+    manifest = load_manifest()
+    if manifest is None:
+        raise FileNotFoundError('No manifest in retail_data, generate the dataset with '
+                                'generate_random_retail_data first')
+    if manifest.get('output_format', 'parquet') != 'parquet':
+        raise ValueError(f"Only parquet datasets can be extended, retail_data is "
+                         f"{manifest['output_format']}")
+    check_date_partitioned(manifest)
+    country_name, seed = manifest['country_name'], manifest['seed']
+    if day is None:
+        last_day = get_table_entry(manifest, 'transactions')['last_day']
+        day = date.fromisoformat(last_day) + timedelta(days=1)
+
+    generators = {
+        'products': (generate_random_product_data, num_products, {'reference_date': day}),
+        'stores': (generate_random_store_data, num_stores, {}),
+        'customers': (generate_random_customer_data, num_customers, {'reference_date': day}),
+    }
+    rows = {}
+    for table_name, (generate, numb_rows, options) in generators.items():
+        if not numb_rows:
+            continue
+        entry = get_table_entry(manifest, table_name)
+        chunk_size = entry.get('chunk_size', CHUNK_SIZES[table_name])
+        table = generate(country_name, numb_rows, seed=seed, as_arrow=True,
+                         chunk_size=chunk_size, first_chunk=entry['next_chunk'], **options)
+        append_table(table, f'{table_name}.parquet', PART_NAME.format(entry['next_chunk']))
+        record_rows(manifest, table_name, numb_rows, chunk_size)
+        rows[table_name] = numb_rows
+
+    entry = get_table_entry(manifest, 'transactions')
+    chunk_size = entry.get('chunk_size', CHUNK_SIZES['transactions'])
+    stream_random_transaction_data(num_transactions, batch_size=chunk_size,
+                                   seed=seed, reference_date=day, numb_days=1,
+                                   partition_by=['date'], first_chunk=entry['next_chunk'],
+                                   append=True)
+    last_day = max(date.fromisoformat(entry.get('last_day', day.isoformat())), day)
+    record_rows(manifest, 'transactions', num_transactions, chunk_size,
+                last_day=last_day.isoformat())
+    rows['transactions'] = num_transactions
+
+    record_run(manifest, 'append', rows)
+    save_manifest(manifest)
+    return manifest
+
+
+def with_country_column(table: pa.Table, country_name: str) -> pa.Table:
+    """Adds a `country` column to a table that doesn't have one.
+    """
+    if 'country' in table.schema.names:
+        return table
+    return table.append_column('country', pa.repeat(pa.scalar(country_name, pa.string()),
+                                                    table.num_rows))
+
+
+def generate_multi_country_retail_data(countries: dict,
+                                       seed: int = None,
+                                       reference_date: datetime = None,
+                                       numb_workers: int = None,
+                                       partition_by_date: bool = False) -> None:
+    """Generates the retail data of several countries as a single dataset
+       partitioned by country, e.g. `retail_data/stores.parquet/country=Denmark/`.
+
+    The reference data of the countries missing from the snapshot is
+    fetched up front, with the requests of all the countries overlapping.
+    All the countries run on one process pool, so the workers are started
+    once and keep their caches, e.g. the shapefile region index, between
+    countries. The reference data, the product catalog and the value pools
+    are cached in the main process too, so a run costs its total number
+    of rows rather than a full start-up per country. The dataset has no
+    manifest, so `append_retail_data` can't extend it.
+
+    Parameters
+    ----------
+        countries: a dict mapping each country to its number of `stores`,
+                   `products`, `transactions` and `customers`, e.g.
+                   {'Denmark': {'stores': 100, 'products': 10000, ...}}
+        seed: the seed of the run, each country derives its own seed from
+              it. A random one is used if None
+        reference_date: the last day of the transaction timestamps,
+                        defaults to today
+        numb_workers: the number of worker processes, defaults to the
+                      number of cpus
+        partition_by_date: whether to also partition the transactions by day
+    """
+    if reference_date is None:
+        reference_date = date.today()
+    partition_by = ['country', 'date'] if partition_by_date else ['country']
+    for table_name in TABLE_NAMES:
+        remove_output(Path('retail_data') / f'{table_name}.parquet')
+    # The manifest of a previous single country run doesn't describe this
+    # dataset, which `append_retail_data` can't extend.
+    remove_output(Path(MANIFEST_PATH))
+    prefetch_reference_data(list(countries))
+
+    with mp.Pool(numb_workers or mp.cpu_count()) as pool:
+        for country_name, counts in countries.items():
+            print(f'Generating the retail data of {country_name}')
+            country_seed = derive_chunk_seeds(seed, f'country:{country_name}', 1)[0]
+            products = generate_random_product_data(
+                country_name, counts.get('products', 0), seed=country_seed, as_arrow=True,
+                chunk_size=CHUNK_SIZES['products'], pool=pool, reference_date=reference_date)
+            stores = generate_random_store_data(
+                country_name, counts.get('stores', 0), seed=country_seed, as_arrow=True,
+                chunk_size=CHUNK_SIZES['stores'], pool=pool)
+            customers = generate_random_customer_data(
+                country_name, counts.get('customers', 0), seed=country_seed, as_arrow=True,
+                chunk_size=CHUNK_SIZES['customers'], reference_date=reference_date)
+
+            for table_name, table in [('products', products), ('stores', stores),
+                                      ('customers', customers)]:
+                table = with_country_column(table, country_name)
+                save_batches(table.to_batches(), f'{table_name}.parquet', table.schema,
+                             partition_cols=['country'], basename_template='part-{i}.parquet')
+            stream_random_transaction_data(
+                counts.get('transactions', 0), batch_size=CHUNK_SIZES['transactions'],
+                seed=country_seed, reference_date=reference_date, products=products,
+                customers=customers, stores=stores, partition_by=partition_by,
+                numb_days=NUMB_DAYS, append=True, constant_columns={'country': country_name},
+                pool=pool)
+
+
+def load_countries(file_path: str) -> dict:
+    """Loads the countries of a multi-country run from a YAML file mapping
+       each country to its numbers of stores, products, transactions and
+       customers.
+    """
+    with open(file_path, 'r') as file:
+        countries = yaml.safe_load(file)
+    for country_name, counts in countries.items():
+        unknown = set(counts) - set(TABLE_NAMES)
+        if unknown:
+            raise ValueError(f"Unknown tables {sorted(unknown)} for {country_name}, "
+                             f"expected some of {TABLE_NAMES}")
+    return countries
 
 
 if __name__ == "__main__":
-    import pandas as pd
-    country_name = 'Denmark'
-    num_stores = 100
-    num_products = 10000
-    num_transactions = 1000
-    numb_unique_ids = 20
-    generate_random_retail_data(country_name, num_stores, num_products, num_transactions, numb_unique_ids)
-    df = pd.read_parquet('retail_data/transactions.parquet')
-    print(df.head())
+    parser = argparse.ArgumentParser(description='Generate random retail data.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    generate_parser = subparsers.add_parser(
+        'generate', help='generate the retail data of a country, with phase timings as JSON lines')
+    generate_parser.add_argument('--country', default='Denmark')
+    generate_parser.add_argument('--size', choices=SIZE_PRESETS, default='S',
+                                 help='the preset numbers of rows, see SIZE_PRESETS')
+    for table_name in TABLE_NAMES:
+        generate_parser.add_argument(f'--{table_name}', type=int, default=None,
+                                     help=f'the number of {table_name}, overrides the size')
+    generate_parser.add_argument('--workers', type=int, default=None)
+    generate_parser.add_argument('--chunk-size', type=int, default=None,
+                                 help='the number of rows per chunk of every table')
+    generate_parser.add_argument('--format', choices=OUTPUT_FORMATS, default='parquet')
+    generate_parser.add_argument('--seed', type=int, default=None)
+    generate_parser.add_argument('--reference-date', type=date.fromisoformat, default=None)
+    generate_parser.add_argument('--partition-by-date', action='store_true')
+    generate_parser.add_argument('--shard-index', type=int, default=0)
+    generate_parser.add_argument('--num-shards', type=int, default=1)
+    generate_parser.add_argument('--telemetry', default='-',
+                                 help="the file the JSON lines are appended to, '-' for stdout")
+
+    countries_parser = subparsers.add_parser(
+        'countries', help='generate several countries into one dataset partitioned by country')
+    countries_parser.add_argument('spec', help='a YAML file mapping each country to its numbers '
+                                               'of stores, products, transactions and customers, '
+                                               'see configs/countries.yaml')
+    countries_parser.add_argument('--seed', type=int, default=None)
+    countries_parser.add_argument('--workers', type=int, default=None)
+    countries_parser.add_argument('--reference-date', type=date.fromisoformat, default=None)
+    countries_parser.add_argument('--partition-by-date', action='store_true')
+
+    for subparser in (generate_parser, countries_parser):
+        subparser.add_argument('--report', default=None,
+                               help='the file the totals of each phase are written to, as a '
+                                    'Prometheus textfile if it ends in .prom, as JSON otherwise')
+        subparser.add_argument('--profile', nargs='+', default=[], metavar='PHASE',
+                               help=f'phases to profile with cProfile, e.g. '
+                                    f'{" ".join(instrumentation.PHASES)}')
+        subparser.add_argument('--profile-dir', default=instrumentation.PROFILE_DIR)
+        subparser.add_argument('--sample', default=None, metavar='FILE',
+                               help='sample the stacks of the run and write them to FILE in '
+                                    'the collapsed stack format of flamegraphs')
+    args = parser.parse_args()
+
+    instrumentation.enable_profiling(args.profile)
+    if args.sample:
+        instrumentation.start_sampling()
+
+    if args.command == 'generate':
+        rows = dict(SIZE_PRESETS[args.size])
+        for table_name in TABLE_NAMES:
+            if getattr(args, table_name) is not None:
+                rows[table_name] = getattr(args, table_name)
+        telemetry_file = None if args.telemetry == '-' else open(args.telemetry, 'a')
+        try:
+            generate_random_retail_data(
+                args.country, rows['stores'], rows['products'], rows['transactions'],
+                rows['customers'], seed=args.seed, shard_index=args.shard_index,
+                num_shards=args.num_shards, reference_date=args.reference_date,
+                partition_by=['date'] if args.partition_by_date else None,
+                numb_workers=args.workers, chunk_size=args.chunk_size, output_format=args.format,
+                telemetry=lambda record: print_json_line(record, telemetry_file))
+        finally:
+            if telemetry_file is not None:
+                telemetry_file.close()
+    else:
+        generate_multi_country_retail_data(load_countries(args.spec), args.seed,
+                                           args.reference_date, args.workers,
+                                           args.partition_by_date)
 
+    if args.sample:
+        instrumentation.stop_sampling()
+        instrumentation.save_stack_samples(args.sample)
+    if args.profile:
+        instrumentation.save_profiles(args.profile_dir)
+    if args.report:
+        instrumentation.save_report(args.report)
@@ -0,0 +1,221 @@
+import sys
+import pickle
+import numpy as np
+import pyarrow as pa
+from typing import NamedTuple
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from multiprocessing import resource_tracker
+
+
+# Buffers start on cache line boundaries, as in Arrow.
+ALIGNMENT = 64
+
+# Whether this process shares the resource tracker of its parent, set on
+# the first attach.
+_inherited_tracker = None
+
+
+class SharedArray(NamedTuple):
+    """Stands for a NumPy or Arrow array stored in a shared memory block.
+
+    `layout` is the shape of a NumPy array, or the (length, null_count,
+    offset) of an Arrow array. `buffers` holds the (offset, size) of each
+    buffer in the block, None for the missing Arrow buffers.
+    """
+    kind: str
+    dtype: object
+    layout: tuple
+    buffers: tuple
+
+
+def collect_buffers(obj, buffers: list):
+    """Returns `obj` with its arrays replaced by `SharedArray`s, adding the
+       bytes of their buffers to `buffers`.
+
+    Dicts, tuples, lists and NamedTuples are walked, other values are kept
+    as they are.
+    """
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.hasobject:
+            raise ValueError('Arrays of Python objects can not be shared')
+        buffers.append(np.ascontiguousarray(obj).view(np.uint8).reshape(-1))
+        return SharedArray('numpy', obj.dtype.str, obj.shape, (len(buffers) - 1,))
+    if isinstance(obj, pa.Array):
+        if obj.type.num_fields or pa.types.is_dictionary(obj.type):
+            raise ValueError(f'Arrow arrays of type {obj.type} can not be shared')
+        indices = []
+        for buffer in obj.buffers():
+            if buffer is None:
+                indices.append(None)
+            else:
+                buffers.append(np.frombuffer(buffer, dtype=np.uint8))
+                indices.append(len(buffers) - 1)
+        return SharedArray('arrow', obj.type, (len(obj), obj.null_count, obj.offset),
+                           tuple(indices))
+    if isinstance(obj, dict):
+        return {key: collect_buffers(value, buffers) for key, value in obj.items()}
+    if isinstance(obj, tuple) and hasattr(obj, '_fields'):
+        return type(obj)(*[collect_buffers(value, buffers) for value in obj])
+    if isinstance(obj, (tuple, list)):
+        return type(obj)(collect_buffers(value, buffers) for value in obj)
+    return obj
+
+
+def place_buffers(template, placements: list):
+    """Replaces the buffer indices of the `SharedArray`s of `template` by
+       their (offset, size) in the block.
+    """
+    if isinstance(template, SharedArray):
+        return template._replace(buffers=tuple(None if k is None else placements[k]
+                                               for k in template.buffers))
+    if isinstance(template, dict):
+        return {key: place_buffers(value, placements) for key, value in template.items()}
+    if isinstance(template, tuple) and hasattr(template, '_fields'):
+        return type(template)(*[place_buffers(value, placements) for value in template])
+    if isinstance(template, (tuple, list)):
+        return type(template)(place_buffers(value, placements) for value in template)
+    return template
+
+
+def restore_arrays(template, block: memoryview):
+    """Rebuilds the arrays of `template` as read-only views of `block`.
+    """
+    if isinstance(template, SharedArray):
+        if template.kind == 'numpy':
+            offset = template.buffers[0][0]
+            array = np.ndarray(template.layout, np.dtype(template.dtype), block, offset)
+            array.flags.writeable = False
+            return array
+        length, null_count, offset = template.layout
+        buffers = [None if placement is None
+                   else pa.py_buffer(block[placement[0]:placement[0] + placement[1]])
+                   for placement in template.buffers]
+        return pa.Array.from_buffers(template.dtype, length, buffers, null_count, offset)
+    if isinstance(template, dict):
+        return {key: restore_arrays(value, block) for key, value in template.items()}
+    if isinstance(template, tuple) and hasattr(template, '_fields'):
+        return type(template)(*[restore_arrays(value, block) for value in template])
+    if isinstance(template, (tuple, list)):
+        return type(template)(restore_arrays(value, block) for value in template)
+    return template
+
+
+@contextmanager
+def shared_arrays(obj):
+    """Copies the NumPy and Arrow arrays of `obj` into one shared memory
+       block, for worker processes to attach to with `attach_arrays`.
+
+    Only the name of the block and a template of `obj`, a few hundred
+    bytes, are sent to the workers, instead of pickling the arrays for
+    each of them. The block is freed when the context exits.
+
+    Usage
+    -----
+    with shared_arrays(basket_model) as (name, template):
+        pool.map(func, tasks)  # the workers call attach_arrays(name, template)
+
+    Parameters
+    ----------
+        obj: the arrays to share, in dicts, tuples, lists or NamedTuples
+
+    Yields
+    ------
+        name, template: the name of the shared memory block, and `obj` with
+                        its arrays replaced by `SharedArray`s
+    """
+    buffers = []
+    template = collect_buffers(obj, buffers)
+    placements, size = [], 0
+    for buffer in buffers:
+        size = -(-size // ALIGNMENT) * ALIGNMENT
+        placements.append((size, len(buffer)))
+        size += len(buffer)
+
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        target = np.ndarray(block.size, np.uint8, block.buf)
+        for buffer, (offset, numb_bytes) in zip(buffers, placements):
+            target[offset:offset + numb_bytes] = buffer
+        del target
+        yield block.name, place_buffers(template, placements)
+    finally:
+        block.close()
+        block.unlink()
+
+
+def attach_block(name: str) -> shared_memory.SharedMemory:
+    """Attaches to a shared memory block created by another process,
+       leaving its lifetime to that process.
+    """
+    global _inherited_tracker
+
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    # Attaching registers the block with the resource tracker, which
+    # unlinks it when its processes exit. Workers started before their
+    # parent ran a tracker start their own one, the block is taken back
+    # from it so it lives as long as the parent wants.
+    if _inherited_tracker is None:
+        _inherited_tracker = resource_tracker._resource_tracker._fd is not None
+    block = shared_memory.SharedMemory(name=name)
+    if not _inherited_tracker:
+        resource_tracker.unregister(block._name, 'shared_memory')
+    return block
+
+
+def attach_arrays(name: str, template) -> tuple:
+    """Attaches to a block shared with `shared_arrays`, without copying it.
+
+    Parameters
+    ----------
+        name: the name of the shared memory block
+        template: the template yielded by `shared_arrays`
+
+    Returns
+    -------
+        block, obj: the attached block, to keep open as long as `obj` is
+                    used, and `obj` with its arrays as read-only views of
+                    the block
+    """
+    block = attach_block(name)
+    return block, restore_arrays(template, block.buf)
+
+
+@contextmanager
+def shared_pickle(obj):
+    """Pickles `obj` once into a shared memory block, for worker processes
+       to unpickle with `load_pickle`.
+
+    Unlike `shared_arrays`, any picklable object can be shared, but every
+    worker gets its own copy of it. The block is freed when the context
+    exits.
+
+    Parameters
+    ----------
+        obj: the object to share
+
+    Yields
+    ------
+        name, size: the name of the shared memory block and the size of the
+                    pickle
+    """
+    data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    block = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+    try:
+        block.buf[:len(data)] = data
+        yield block.name, len(data)
+    finally:
+        block.close()
+        block.unlink()
+
+
+def load_pickle(name: str, size: int):
+    """Unpickles an object shared with `shared_pickle`.
+    """
+    block = attach_block(name)
+    try:
+        with block.buf[:size] as data:
+            return pickle.loads(data)
+    finally:
+        block.close()
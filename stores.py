@@ -1,16 +1,31 @@
-import pandas as pd
+import numpy as np
 import random
 import pyarrow as pa
+import pyarrow.compute as pc
 from pathlib import Path
 import pyarrow.parquet as pq
 import multiprocessing as mp
 from tqdm import tqdm
-from faker import Faker
-fake = Faker()
 
-from helper_functions import get_regions_of_country
+from reference_data import get_country_reference
+from value_pools import load_value_pools
+from value_pools import draw_from_pool
+from value_pools import generate_uuid4_array
+from value_pools import get_faker
 from helper_functions import timer_decorator
-from helper_functions import save_data
+from helper_functions import save_table
+from helper_functions import table_to_pandas
+from helper_functions import get_chunk_tasks
+from helper_functions import rows_to_record_batch
+from helper_functions import imap_chunks
+from helper_functions import load_region_index
+from helper_functions import get_shapefile_errors
+from helper_functions import generate_random_coords_in_region
+from helper_functions import get_country_code
+from instrumentation import phase
+from gazetteer import load_gazetteer
+from gazetteer import sample_cities
+from region_crosswalk import get_region_weights
 
 
 def get_regions(country_name: str):
@@ -26,7 +41,7 @@ def get_regions(country_name: str):
         regions: the regions of the country
     """
     try:
-        regions = get_regions_of_country(country_name)
+        regions = get_country_reference(country_name)['regions']
     except:
         print(f'No data for {country_name}!. Using United States data instead.')
         country_name = 'United States'
@@ -35,11 +50,83 @@ def get_regions(country_name: str):
     return regions, country_name
 
 
+STORE_SCHEMA = pa.schema([
+    ('store_id', pa.string()),
+    ('store Name', pa.string()),
+    ('address', pa.string()),
+    ('city', pa.string()),
+    ('state_or_Province', pa.string()),
+    ('country', pa.string()),
+    ('postal/Zip Code', pa.string()),
+    ('store_type', pa.string()),
+    ('opening_hours', pa.string()),
+    ('manager', pa.string()),
+    ('number_of_employees', pa.int64()),
+    ('number_of_non_self_checkout_lanes', pa.int64()),
+    ('number_of_self_checkout_lanes', pa.int64()),
+    ('latitude', pa.float64()),
+    ('longitude', pa.float64()),
+])
+
+STORE_TYPES = ["Supermarket", "Convenience Store", "Department Store"]
+STORE_PROVIDERS = ['company', 'street_address', 'city', 'zipcode', 'name']
+
+worker_country_name = None
+worker_regions = None
+worker_value_pools = None
+worker_country_code = None
+worker_region_weights = None
+
+
+def init_store_worker(country_name, regions, value_pools=None, country_code=None,
+                      region_weights=None):
+    """Sets the country, the regions, their optional weights and the
+       optional value pools shared by the rows generated in a worker.
+    """
+    global worker_country_name, worker_regions, worker_value_pools, worker_country_code, \
+        worker_region_weights
+    worker_country_name = country_name
+    worker_regions = regions
+    worker_value_pools = value_pools
+    worker_country_code = country_code
+    worker_region_weights = region_weights
+
+
+def generate_store_cities(country_code: str, region_names, fallback: pa.Array,
+                          rng: np.random.Generator) -> pa.Array:
+    """Draws the city of each store among the cities of its region in the
+       gazetteer, weighted by population.
+
+    Stores whose region is not in the gazetteer, or all of them if there
+    is no gazetteer, keep their `fallback` city.
+
+    Parameters
+    ----------
+        country_code: the ISO 3166-1 alpha 2 code of the country
+        region_names: the region of each store
+        fallback: the Faker city of each store
+        rng: the random generator to use
+
+    Returns
+    -------
+        cities: an Arrow array with the city of each store
+    """
+    gazetteer = load_gazetteer()
+    if gazetteer is None or country_code is None:
+        return fallback
+    cities = sample_cities(gazetteer, country_code, region_names, rng)
+    return pc.coalesce(cities, fallback)
+
+
 def generate_a_row_store_data(args):
     """Genrates a single store data row.
     """
-    _, country_name, regions = args
-    region_name = random.choice(regions)
+    _, country_name, regions, region_weights = args
+    fake = get_faker()
+    if region_weights is None:
+        region_name = random.choice(regions)
+    else:
+        region_name = random.choices(regions, region_weights)[0]
     return {
         "store_id": fake.uuid4(),
         "store Name": fake.company(),
@@ -48,7 +135,7 @@ def generate_a_row_store_data(args):
         "state_or_Province": region_name,
         "country": country_name,
         "postal/Zip Code": fake.zipcode(),
-        "store_type": random.choice(["Supermarket", "Convenience Store", "Department Store"]),
+        "store_type": random.choice(STORE_TYPES),
         "opening_hours": "8:00 AM - 9:00 PM",
         "manager": fake.name(),
         "number_of_employees": random.randint(5, 100),
@@ -57,40 +144,244 @@ def generate_a_row_store_data(args):
     }
 
 
+def get_missing_regions(country_name: str, regions: list) -> list:
+    """Returns the regions that have no geometry in the shapefile.
+
+    Parameters
+    ----------
+        country_name: the name of the country
+        regions: the regions of the country
+
+    Returns
+    -------
+        missing: the regions without geometry, all of them if the
+                 shapefile can't be read
+    """
+    try:
+        region_index = load_region_index()
+    except get_shapefile_errors() as e:
+        print(f'No shapefile available, stores are left without coordinates: {e}')
+        return list(regions)
+    return [region_name for region_name in regions
+            if (country_name, region_name) not in region_index]
+
+
+def get_store_region_weights(country_name: str, regions: list) -> np.ndarray:
+    """Returns the probability of a store to be in each region, from the
+       area of the regions, or None if the shapefile can't be read.
+    """
+    try:
+        region_index = load_region_index()
+    except get_shapefile_errors():
+        return None
+    return get_region_weights(region_index, country_name, regions)
+
+
+def generate_store_coordinates(country_name: str, region_names: list,
+                               rng: np.random.Generator = None) -> tuple:
+    """Draws the `latitude` and `longitude` of stores uniformly within
+       their region.
+
+    The coordinates of all the stores of a region are drawn in one call.
+    Stores whose region is not in the shapefile get missing coordinates.
+
+    Parameters
+    ----------
+        country_name: the name of the country of the stores
+        region_names: the region of each store
+        rng: the random generator to use, a new one is created if None
+
+    Returns
+    -------
+        latitude, longitude: two arrays with the coordinates of each store
+    """
+    latitude = np.full(len(region_names), np.nan)
+    longitude = np.full(len(region_names), np.nan)
+    try:
+        load_region_index()
+    except get_shapefile_errors():
+        return latitude, longitude
+
+    names, inverse = np.unique(np.asarray(region_names, dtype=object), return_inverse=True)
+    for k, region_name in enumerate(names):
+        rows = np.flatnonzero(inverse == k)
+        try:
+            coords = generate_random_coords_in_region(country_name, region_name, len(rows), rng)
+        except ValueError:
+            continue
+        latitude[rows], longitude[rows] = coords[:, 0], coords[:, 1]
+    return latitude, longitude
+
+
+def generate_store_columns(numb_stores: int, rng: np.random.Generator) -> dict:
+    """Generates the columns of `numb_stores` stores with NumPy, drawing
+       the text fields from the worker's value pools.
+
+    Parameters
+    ----------
+        numb_stores: the number of stores to generate
+        rng: the random generator to use
+
+    Returns
+    -------
+        columns: a dict mapping column names to Arrow or NumPy arrays
+    """
+    region_names = draw_from_pool(worker_regions, numb_stores, rng, worker_region_weights)
+    latitude, longitude = generate_store_coordinates(
+        worker_country_name, region_names.to_numpy(zero_copy_only=False), rng)
+    columns = {
+        "store_id": generate_uuid4_array(numb_stores, rng),
+        "store Name": draw_from_pool(worker_value_pools['company'], numb_stores, rng),
+        "address": draw_from_pool(worker_value_pools['street_address'], numb_stores, rng),
+        "city": draw_from_pool(worker_value_pools['city'], numb_stores, rng),
+        "state_or_Province": region_names,
+        "country": pa.repeat(pa.scalar(worker_country_name, pa.string()), numb_stores),
+        "postal/Zip Code": draw_from_pool(worker_value_pools['zipcode'], numb_stores, rng),
+        "store_type": draw_from_pool(STORE_TYPES, numb_stores, rng),
+        "opening_hours": pa.repeat(pa.scalar("8:00 AM - 9:00 PM", pa.string()), numb_stores),
+        "manager": draw_from_pool(worker_value_pools['name'], numb_stores, rng),
+        "number_of_employees": rng.integers(5, 101, size=numb_stores),
+        "number_of_non_self_checkout_lanes": rng.integers(2, 21, size=numb_stores),
+        "number_of_self_checkout_lanes": rng.integers(0, 5, size=numb_stores),
+        "latitude": latitude,
+        "longitude": longitude,
+    }
+    # Drawn last, so the other columns don't depend on the gazetteer.
+    columns["city"] = generate_store_cities(worker_country_code,
+                                            region_names.to_numpy(zero_copy_only=False),
+                                            columns["city"], rng)
+    return columns
+
+
+def generate_store_batch(args):
+    """Generates the stores of a contiguous range of rows as one batch.
+
+    Parameters
+    ----------
+        args: a tuple of (start, stop, seed, part_path). The random state of
+              the worker is seeded with `seed`. If `part_path` is given the
+              batch is written there instead of being returned.
+
+    Returns
+    -------
+        batch: the stores as a pyarrow RecordBatch, or `part_path`
+    """
+    start, stop, seed, part_path = args
+    if worker_value_pools is not None:
+        columns = generate_store_columns(stop - start, np.random.default_rng(seed))
+        batch = pa.RecordBatch.from_pydict(columns, schema=STORE_SCHEMA)
+    else:
+        random.seed(seed)
+        get_faker().seed_instance(seed)
+        rows = [generate_a_row_store_data((i, worker_country_name, worker_regions,
+                                           worker_region_weights))
+                for i in range(start, stop)]
+        region_names = [row['state_or_Province'] for row in rows]
+        rng = np.random.default_rng(seed)
+        latitude, longitude = generate_store_coordinates(worker_country_name, region_names, rng)
+        cities = generate_store_cities(worker_country_code, region_names,
+                                       pa.array([row['city'] for row in rows], pa.string()), rng)
+        for row, lat, lng, city in zip(rows, latitude, longitude, cities.to_pylist()):
+            row['latitude'], row['longitude'], row['city'] = lat, lng, city
+        batch = rows_to_record_batch(rows, STORE_SCHEMA)
+    if part_path is None:
+        return batch
+    pq.write_table(pa.Table.from_batches([batch]), part_path)
+    return part_path
+
+
 def generate_random_store_data(country_name: str,
                                numb_stores: int,
-                               is_saved: bool = False):
+                               is_saved: bool = False,
+                               chunk_size: int = 10_000,
+                               numb_workers: int = None,
+                               part_dir: str = None,
+                               seed: int = None,
+                               shard_index: int = 0,
+                               num_shards: int = 1,
+                               value_pool_size: int = None,
+                               locale: str = 'en_US',
+                               as_arrow: bool = False,
+                               first_chunk: int = 0,
+                               pool: mp.Pool = None):
     """Generates random store data for a given country.
 
+    The rows are split into chunks of `chunk_size` rows. Each worker
+    generates a whole chunk and sends it back as a single Arrow record
+    batch, or writes it straight to a part file in `part_dir`.
+
     Parameters
     ----------
         country_name: the country to generate store data for
         numb_stores: the number of stores to generate
+        is_saved: whether to save the generated data as `stores.parquet`
+        chunk_size: the number of rows generated per worker task
+        numb_workers: the number of worker processes, defaults to the
+                      number of cpus
+        part_dir: if given, the chunks are written by the workers to
+                  `part_dir/part-<k>.parquet`, see `helper_functions.PART_NAME`,
+                  and are not returned
+        seed: the seed of the run. The same seed and `chunk_size` always
+              give the same rows, whatever the number of workers or shards
+        shard_index: the index of the shard to generate
+        num_shards: the number of shards the rows are split into. Each
+                    shard holds a contiguous block of chunks
+        value_pool_size: if given, the names, addresses, cities, zip codes
+                         and managers are drawn from pools of that many
+                         Faker values, cached on disk, instead of calling
+                         Faker per row
+        locale: the Faker locale of the value pools
+        as_arrow: whether to return a pyarrow Table instead of a pandas
+                  DataFrame
+        first_chunk: the index of the first chunk, to continue the rows of
+                     a previous run with new seeds
+        pool: a process pool to run on, e.g. shared by several countries,
+              a pool of `numb_workers` is created if None
 
     Returns
     -------
-        stores: the generated stores
+        stores: the generated stores as a pandas DataFrame or a pyarrow
+                Table, or the `part_dir` path if `part_dir` is given
     """
     regions, country_name = get_regions(country_name)
     numb = f'{numb_stores:,}'.replace(',', ' ')
 
-    with mp.Pool(mp.cpu_count()) as pool:
-        args_list = [(i, country_name, regions) for i in range(numb_stores)]
+    missing = get_missing_regions(country_name, regions)
+    if missing and len(missing) < len(regions):
+        print(f'No geometry for {len(missing)} regions of {country_name}: {", ".join(missing)}')
+    region_weights = get_store_region_weights(country_name, regions)
+
+    value_pools = None
+    if value_pool_size is not None:
+        value_pools = load_value_pools(STORE_PROVIDERS, value_pool_size, locale)
 
-        with tqdm(total=len(args_list), desc=f"Generating {numb} stores data") as pbar:
-            result = []
-            for store in pool.imap_unordered(generate_a_row_store_data, args_list):
-                result.append(store)
-                pbar.update()
+    tasks = get_chunk_tasks(numb_stores, chunk_size, seed, 'stores', shard_index, num_shards,
+                            first_chunk, part_dir)
+    numb_rows = sum(stop - start for start, stop, _, _ in tasks)
 
-    stores_df = pd.DataFrame(result)
+    batches = []
+    results = imap_chunks(generate_store_batch, tasks, init_store_worker,
+                          (country_name, regions, value_pools, get_country_code(country_name),
+                           region_weights),
+                          pool, numb_workers)
+    with phase('generate_rows', numb_rows), \
+            tqdm(total=numb_rows, desc=f"Generating {numb} stores data") as pbar:
+        for (start, stop, _, _), batch in zip(tasks, results):
+            batches.append(batch)
+            pbar.update(stop - start)
+
+    if part_dir is not None:
+        return Path(part_dir)
+    stores = pa.Table.from_batches(batches, STORE_SCHEMA)
     if is_saved:
-        save_data(stores_df, 'stores.parquet')
-    return stores_df
+        save_table(stores, 'stores.parquet')
+    return stores if as_arrow else table_to_pandas(stores)
 
 
 
 if __name__ == "__main__":
+    import pandas as pd
+
     pd.set_option('display.max_columns', None)
 
 
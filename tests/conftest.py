@@ -0,0 +1,53 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+
+REPO_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_DIR))
+
+
+def link_configs(path):
+    for name in ['configs', 'shap']:
+        (path / name).symlink_to(REPO_DIR / name)
+    return path
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Runs a test in an empty directory holding links to the configs and
+       the shapefile, so the generated `retail_data` never lands in the repo.
+    """
+    link_configs(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('RETAIL_FAKER_OFFLINE', '1')
+    return tmp_path
+
+
+@pytest.fixture(scope='session')
+def tables(tmp_path_factory):
+    """Small products, customers and stores tables to draw transactions
+       from, generated once with the country lookups stubbed.
+    """
+    import benchmark
+    from products import generate_random_product_data
+    from customers import generate_random_customer_data
+    from stores import generate_random_store_data
+
+    os.environ['RETAIL_FAKER_OFFLINE'] = '1'
+    benchmark.stub_country_lookups()
+    cwd = os.getcwd()
+    os.chdir(link_configs(tmp_path_factory.mktemp('tables')))
+    try:
+        return {
+            'products': generate_random_product_data('Denmark', 500, seed=1, numb_workers=1,
+                                                     value_pool_size=100, as_arrow=True),
+            'customers': generate_random_customer_data('Denmark', 1000, seed=1,
+                                                       value_pool_size=100, as_arrow=True),
+            'stores': generate_random_store_data('Denmark', 20, seed=1, numb_workers=1,
+                                                 value_pool_size=100, as_arrow=True),
+        }
+    finally:
+        os.chdir(cwd)
@@ -0,0 +1,32 @@
+import numpy as np
+
+from helper_functions import build_alias_table
+from helper_functions import sample_alias
+
+
+NUMB_DRAWS = 2_000_000
+
+
+def check_frequencies(weights, seed=0):
+    weights = np.asarray(weights, dtype=float)
+    expected = weights / weights.sum()
+    draws = sample_alias(*build_alias_table(weights), NUMB_DRAWS, np.random.default_rng(seed))
+    frequencies = np.bincount(draws, minlength=len(weights)) / NUMB_DRAWS
+    # Within 5 standard deviations of the binomial count of each index.
+    tolerance = 5 * np.sqrt(expected * (1 - expected) / NUMB_DRAWS) + 1e-9
+    assert np.all(np.abs(frequencies - expected) <= tolerance)
+
+
+def test_alias_follows_zipf_weights():
+    check_frequencies(1 / np.arange(1, 1001) ** 1.1)
+
+
+def test_alias_follows_skewed_weights_with_zeros():
+    weights = np.random.default_rng(1).pareto(1.5, 500) + 1
+    weights[::7] = 0
+    check_frequencies(weights)
+
+
+def test_alias_with_uniform_and_single_weights():
+    check_frequencies(np.ones(10))
+    assert np.all(sample_alias(*build_alias_table([3.0]), 1000, np.random.default_rng(0)) == 0)
@@ -0,0 +1,22 @@
+from datetime import date
+
+import pytest
+
+import benchmark
+from customers import generate_random_customer_data
+
+
+@pytest.fixture(autouse=True)
+def stubbed(workdir):
+    benchmark.stub_country_lookups()
+
+
+def test_customers_only_depend_on_seed_and_reference_date():
+    customers = [generate_random_customer_data('Denmark', 300, seed=4, value_pool_size=100,
+                                               reference_date=reference_date, as_arrow=True)
+                 for reference_date in [date(2024, 1, 31), date(2024, 1, 31), date(2020, 6, 1)]]
+
+    assert customers[0].equals(customers[1])
+    signup_dates = customers[2]['signup_date'].cast('string').to_pylist()
+    assert max(signup_dates) <= '2020-06-01'
+    assert min(signup_dates) > '2015-06-01'
@@ -0,0 +1,62 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from gazetteer import build_gazetteer
+from gazetteer import get_cities
+from gazetteer import load_gazetteer
+from gazetteer import sample_cities
+
+
+FIXTURES_DIR = Path(__file__).resolve().parent / 'fixtures'
+
+REGION_CITIES = {
+    'Île-de-France': {'Paris': 2138551, 'Boulogne-Billancourt': 121334, 'Versailles': 85771},
+    'Auvergne-Rhône-Alpes': {'Lyon': 522969, 'Grenoble': 158552},
+    'Provence-Alpes-Côte-d’Azur': {'Marseille': 870731, 'Nice': 342669, 'Toulon': 171953},
+}
+
+
+@pytest.fixture(scope='module')
+def gazetteer(tmp_path_factory):
+    file_path = tmp_path_factory.mktemp('gazetteer') / 'gazetteer.arrow'
+    build_gazetteer(FIXTURES_DIR / 'cities.txt', FIXTURES_DIR / 'admin1CodesASCII.txt', file_path)
+    return load_gazetteer(file_path)
+
+
+def test_gazetteer_uses_pycountry_names(gazetteer):
+    # Sorted by decreasing population, without the administrative areas.
+    assert get_cities(gazetteer, 'FR', 'Île-de-France').to_pylist() == [
+        'Paris', 'Boulogne-Billancourt', 'Versailles']
+    # Written differently in GeoNames and in pycountry.
+    assert get_cities(gazetteer, 'FR', 'Provence-Alpes-Côte-d’Azur').to_pylist() == [
+        'Marseille', 'Nice', 'Toulon']
+    # Without a pycountry match the GeoNames name is kept.
+    assert get_cities(gazetteer, 'DK', 'Capital Region').to_pylist() == ['Copenhagen']
+
+
+def test_sampled_cities_belong_to_their_region(gazetteer):
+    rng = np.random.default_rng(0)
+    regions = rng.choice(list(REGION_CITIES) + ['Corse'], 10_000)
+
+    cities = sample_cities(gazetteer, 'FR', regions, rng).to_pylist()
+
+    for region, city in zip(regions, cities):
+        if region == 'Corse':
+            assert city is None
+        else:
+            assert city in REGION_CITIES[region]
+
+
+def test_sampled_cities_follow_population(gazetteer):
+    numb_rows = 500_000
+    cities = sample_cities(gazetteer, 'FR', ['Provence-Alpes-Côte-d’Azur'] * numb_rows,
+                           np.random.default_rng(1)).to_pylist()
+
+    populations = REGION_CITIES['Provence-Alpes-Côte-d’Azur']
+    total = sum(populations.values())
+    for city, population in populations.items():
+        expected = population / total
+        tolerance = 5 * np.sqrt(expected * (1 - expected) / numb_rows)
+        assert abs(cities.count(city) / numb_rows - expected) <= tolerance
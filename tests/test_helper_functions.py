@@ -0,0 +1,51 @@
+import pyarrow as pa
+import pytest
+
+import helper_functions
+from helper_functions import PARQUET_PAGE_SIZE
+from helper_functions import append_table
+from helper_functions import derive_chunk_seeds
+from helper_functions import get_chunk_tasks
+from helper_functions import get_parquet_options
+from helper_functions import save_batches
+from helper_functions import save_table
+
+
+def test_chunk_tasks_of_shards_make_the_serial_run():
+    serial = get_chunk_tasks(25, 10, 7, 'products')
+    shards = [task for shard_index in range(2)
+              for task in get_chunk_tasks(25, 10, 7, 'products', shard_index, 2)]
+
+    assert shards == serial
+    assert [(start, stop) for start, stop, _, _ in serial] == [(0, 10), (10, 20), (20, 25)]
+    assert [seed for _, _, seed, _ in serial] == derive_chunk_seeds(7, 'products', 3)
+
+
+def test_chunk_tasks_name_the_parts_after_their_chunk(tmp_path):
+    tasks = get_chunk_tasks(25, 10, 7, 'products', first_chunk=4, part_dir=tmp_path / 'parts')
+
+    assert [part_path.name for _, _, _, part_path in tasks] == [
+        'part-00000004.parquet', 'part-00000005.parquet', 'part-00000006.parquet']
+    assert (tmp_path / 'parts').is_dir()
+
+
+@pytest.mark.parametrize('write', [
+    lambda table: save_table(table, 'table.parquet', page_size=4096),
+    lambda table: save_table(table, 'table.parquet', ['group'], page_size=4096),
+    lambda table: append_table(table, 'table.parquet', 'part-0.parquet', page_size=4096),
+    lambda table: save_batches(table.to_batches(), 'table.parquet', table.schema,
+                               page_size=4096),
+    lambda table: save_batches(table.to_batches(), 'table.parquet', table.schema,
+                               partition_cols=['group'], page_size=4096),
+])
+def test_writers_pass_the_page_size_to_parquet(workdir, monkeypatch, write):
+    page_sizes = []
+
+    def get_options(compression_level, page_size=PARQUET_PAGE_SIZE):
+        page_sizes.append(page_size)
+        return get_parquet_options(compression_level, page_size)
+
+    monkeypatch.setattr(helper_functions, 'get_parquet_options', get_options)
+    write(pa.table({'group': ['a', 'b'] * 50, 'value': list(range(100))}))
+
+    assert page_sizes == [4096]
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from helper_functions import load_product_catalog
+from pricing import PRICE_DISTRIBUTIONS
+from pricing import apply_charm_pricing
+from pricing import generate_prices
+
+
+REPEATS = 2_000
+
+
+@pytest.fixture(scope='module')
+def catalog():
+    from conftest import REPO_DIR
+
+    return load_product_catalog(str(REPO_DIR / 'configs' / 'products_configs.yaml'))
+
+
+@pytest.mark.parametrize('distribution', PRICE_DISTRIBUTIONS)
+@pytest.mark.parametrize('inflation_rate', [None, 0.035])
+def test_prices_stay_within_their_range(catalog, distribution, inflation_rate):
+    low = np.repeat(catalog.low_price, REPEATS)
+    high = np.repeat(catalog.high_price, REPEATS)
+    distributions = np.full(len(low), PRICE_DISTRIBUTIONS.index(distribution), dtype=np.int8)
+
+    prices = generate_prices(low, high, distributions, inflation_rate, np.random.default_rng(0))
+
+    factor = 1 + (inflation_rate or 0)
+    assert np.all(prices >= np.round(np.maximum(low, 0.01) * factor, 2))
+    assert np.all(prices <= np.round(high * factor, 2))
+    assert np.all(np.round(prices, 2) == prices)
+
+
+def test_charm_prices_move_back_within_bounds():
+    prices = np.array([5.00, 4.42, 12.30, 9.95, 10.00])
+    low = np.array([5.00, 4.00, 12.00, 9.95, 10.00])
+    high = np.array([6.00, 4.45, 12.50, 10.00, 20.00])
+
+    assert apply_charm_pricing(prices).tolist() == [4.99, 4.49, 12.99, 9.99, 9.99]
+    assert apply_charm_pricing(prices, low, high).tolist() == [5.09, 4.39, 12.00, 9.99, 10.99]
@@ -0,0 +1,43 @@
+import os
+
+import product_names
+from product_names import load_product_name_pool
+
+
+def stub_model(monkeypatch):
+    calls = []
+
+    def generate_names_for_pairs(pairs, names_per_pair, model_dir, quantize=False):
+        calls.append(len(pairs))
+        return {pair: [f'{pair[1]} {len(calls)}-{k}' for k in range(names_per_pair)]
+                for pair in pairs}
+
+    monkeypatch.setattr(product_names, 'generate_names_for_pairs', generate_names_for_pairs)
+    return calls
+
+
+def test_cached_names_follow_the_model(workdir, monkeypatch):
+    calls = stub_model(monkeypatch)
+    model_dir = workdir / 'model'
+    model_dir.mkdir()
+    (model_dir / 'model.safetensors').write_bytes(b'weights')
+    cache_path = workdir / 'names.parquet'
+
+    names, offsets = load_product_name_pool(2, model_dir, cache_path)
+    assert len(names) == 2 * (len(offsets) - 1)
+    assert len(calls) == 1
+
+    # Served from the cache.
+    assert (load_product_name_pool(2, model_dir, cache_path)[0] == names).all()
+    assert len(calls) == 1
+
+    # More names per pair.
+    assert len(load_product_name_pool(3, model_dir, cache_path)[0]) == 3 * (len(offsets) - 1)
+    assert len(calls) == 2
+
+    # A retrained model.
+    stat = (model_dir / 'model.safetensors').stat()
+    os.utime(model_dir / 'model.safetensors', ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    load_product_name_pool(3, model_dir, cache_path)
+    assert len(calls) == 3
+    assert not list(workdir.glob('*.tmp'))
@@ -0,0 +1,24 @@
+from datetime import date
+
+import pytest
+
+import benchmark
+from products import generate_random_product_data
+
+
+@pytest.fixture(autouse=True)
+def stubbed(workdir):
+    benchmark.stub_country_lookups()
+
+
+@pytest.mark.parametrize('value_pool_size', [None, 100])
+def test_products_only_depend_on_seed_and_reference_date(value_pool_size):
+    products = [generate_random_product_data('Denmark', 300, seed=4, numb_workers=1,
+                                             value_pool_size=value_pool_size,
+                                             reference_date=reference_date, as_arrow=True)
+                for reference_date in [date(2024, 1, 31), date(2024, 1, 31), date(2020, 6, 1)]]
+
+    assert products[0].equals(products[1])
+    expiration_dates = products[2]['expiration_date'].to_pylist()
+    assert min(expiration_dates) >= '2020-07-01'
+    assert max(expiration_dates) <= '2021-06-01'
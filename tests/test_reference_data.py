@@ -0,0 +1,39 @@
+from datetime import datetime, timezone
+
+import reference_fetch
+from reference_data import get_country_reference
+from reference_data import load_reference_data
+from reference_data import save_reference_data
+
+
+def make_reference(exchange_rate, fetched_at):
+    return {'country_name': 'Denmark', 'country_code': 'DK', 'currency_code': 'DKK',
+            'exchange_rate': exchange_rate, 'inflation_rate': 0.02, 'regions': ['Hovedstaden'],
+            'fetched_at': fetched_at}
+
+
+def stub_fetch(monkeypatch, reference):
+    monkeypatch.setattr(reference_fetch, 'fetch_references',
+                        lambda country_names: {name: reference for name in country_names})
+
+
+def test_failed_fetch_is_saved_stale(tmp_path, monkeypatch):
+    file_path = tmp_path / 'reference_data.parquet'
+    stub_fetch(monkeypatch, make_reference(None, None))
+
+    reference = get_country_reference('Denmark', offline=False, file_path=file_path)
+
+    assert reference['exchange_rate'] is None
+    assert load_reference_data(file_path)['Denmark']['fetched_at'] is None
+
+
+def test_failed_fetch_keeps_previous_entry(tmp_path, monkeypatch):
+    file_path = tmp_path / 'reference_data.parquet'
+    fetched_at = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    save_reference_data({'Denmark': make_reference(0.15, fetched_at)}, file_path)
+    stub_fetch(monkeypatch, make_reference(None, None))
+
+    reference = get_country_reference('Denmark', offline=False, file_path=file_path)
+
+    assert reference['exchange_rate'] == 0.15
+    assert load_reference_data(file_path)['Denmark']['fetched_at'] == fetched_at
@@ -0,0 +1,110 @@
+import json
+import time
+import threading
+from collections import Counter
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from reference_fetch import AsyncFetcher
+from reference_fetch import fetch_references
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Serves the exchange rates on /rates and the inflation rates on
+       /inflation/<country_code>. The first `failures[base]` requests of
+       the rate of a currency get a 503, and those of the currencies in
+       `slow` answer after `delay` seconds.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        with server.lock:
+            server.hits[url.path + '?' + url.query] += 1
+            numb_hits = server.hits[url.path + '?' + url.query]
+        # Long enough for identical requests to overlap.
+        time.sleep(0.05)
+        status, body = 200, {}
+        if url.path == '/rates':
+            base = query['base'][0]
+            if base in server.slow:
+                time.sleep(server.delay)
+            if numb_hits <= server.failures.get(base, 0):
+                status = 503
+            else:
+                body = {'rates': {'USD': server.rates[base]}}
+        elif url.path.startswith('/inflation/'):
+            body = [{}, [{'value': None}, {'value': 2.5}]]
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.lock = threading.Lock()
+    server.hits = Counter()
+    server.rates = {'EUR': 1.1, 'DKK': 0.15}
+    server.failures = {}
+    server.slow = set()
+    server.delay = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_fetcher(server, **options):
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    return AsyncFetcher(urls={'exchange_rate': f'{base_url}/rates',
+                              'inflation_rate': f'{base_url}/inflation/{{country_code}}'},
+                        backoff=0.01, **options)
+
+
+def count_hits(server, path):
+    return sum(numb_hits for url, numb_hits in server.hits.items() if url.startswith(path))
+
+
+def test_identical_requests_are_coalesced(server):
+    with make_fetcher(server) as fetcher:
+        references = fetch_references(['France', 'Germany', 'Italy', 'Denmark'], fetcher)
+
+    assert {name: reference['exchange_rate'] for name, reference in references.items()} == {
+        'France': 1.1, 'Germany': 1.1, 'Italy': 1.1, 'Denmark': 0.15}
+    assert references['France']['inflation_rate'] == 0.025
+    assert all(reference['fetched_at'] is not None for reference in references.values())
+    # One request per currency, one per country for the inflation.
+    assert count_hits(server, '/rates') == 2
+    assert count_hits(server, '/inflation/') == 4
+
+
+def test_unavailable_source_is_retried(server):
+    server.failures = {'DKK': 2}
+    with make_fetcher(server) as fetcher:
+        reference = fetch_references(['Denmark'], fetcher)['Denmark']
+
+    assert reference['exchange_rate'] == 0.15
+    assert reference['fetched_at'] is not None
+    assert count_hits(server, '/rates') == 3
+
+
+def test_timeout_leaves_the_rate_empty_and_unstamped(server):
+    server.slow, server.delay = {'DKK'}, 1.0
+    with make_fetcher(server, timeout=(1, 0.2), max_retries=1) as fetcher:
+        reference = fetch_references(['Denmark'], fetcher)['Denmark']
+
+    assert reference['exchange_rate'] is None
+    assert reference['inflation_rate'] == 0.025
+    assert reference['fetched_at'] is None
+    assert count_hits(server, '/rates') == 2
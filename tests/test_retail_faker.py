@@ -0,0 +1,58 @@
+from datetime import date
+
+import pytest
+import pyarrow.parquet as pq
+
+import benchmark
+from retail_faker import append_retail_data
+from retail_faker import generate_random_retail_data
+from retail_faker import generate_multi_country_retail_data
+
+
+@pytest.fixture
+def stubbed(workdir):
+    benchmark.stub_country_lookups()
+    return workdir
+
+
+def generate(partition_by):
+    generate_random_retail_data('Denmark', num_stores=10, num_products=200,
+                                num_transactions=5_000, num_customers=500, seed=5,
+                                reference_date=date(2024, 1, 31), partition_by=partition_by,
+                                numb_workers=1, chunk_size=2_000)
+
+
+def test_append_adds_a_day_of_transactions(stubbed):
+    generate(['date'])
+    append_retail_data(1_000, num_products=10)
+
+    transactions = pq.read_table('retail_data/transactions.parquet')
+    assert transactions.num_rows == 6_000
+    assert transactions['date'].null_count == 0
+    dates = [str(day) for day in transactions['date'].to_pylist()]
+    assert dates.count('2024-02-01') == 1_000
+    assert pq.read_table('retail_data/products.parquet').num_rows == 210
+
+
+def test_append_refuses_unpartitioned_transactions(stubbed):
+    generate(None)
+
+    with pytest.raises(ValueError, match='partitioned by date'):
+        append_retail_data(1_000, num_products=10)
+    assert pq.read_table('retail_data/transactions.parquet').num_rows == 5_000
+    assert pq.read_table('retail_data/products.parquet').num_rows == 200
+
+
+def test_append_refuses_multi_country_dataset(stubbed):
+    generate(['date'])
+    counts = {'products': 100, 'stores': 5, 'customers': 200, 'transactions': 2_000}
+    generate_multi_country_retail_data({'Denmark': counts, 'Norway': counts}, seed=5,
+                                       reference_date=date(2024, 1, 31), numb_workers=2,
+                                       partition_by_date=True)
+
+    products = pq.read_table('retail_data/products.parquet')
+    assert products.num_rows == 200
+    assert sorted(set(products['country'].to_pylist())) == ['Denmark', 'Norway']
+    assert pq.read_table('retail_data/transactions.parquet').num_rows == 4_000
+    with pytest.raises(FileNotFoundError):
+        append_retail_data(1_000)
@@ -0,0 +1,80 @@
+import multiprocessing as mp
+from typing import NamedTuple
+
+import numpy as np
+import pyarrow as pa
+import pytest
+
+from shared_arrays import attach_arrays
+from shared_arrays import load_pickle
+from shared_arrays import shared_arrays
+from shared_arrays import shared_pickle
+
+
+class Model(NamedTuple):
+    weights: np.ndarray
+    names: pa.Array
+    extra: dict
+
+
+def make_model():
+    names = pa.array(['a', None, 'ccc', 'dd', None, 'eeeee', 'f'])
+    return Model(
+        weights=np.arange(12, dtype=np.float32).reshape(3, 4)[:, 1:],
+        names=names.slice(1, 5),
+        extra={'ids': pa.array([1, None, 3, 4], pa.int64()).slice(1),
+               'flags': pa.array([True, None, False]),
+               'offsets': (np.array([0, 5, 9], dtype=np.int64), 'label')},
+    )
+
+
+def check_model(model, expected, read_only=True):
+    assert isinstance(model, Model)
+    np.testing.assert_array_equal(model.weights, expected.weights)
+    assert model.weights.flags.writeable != read_only
+    for name, array in [('names', model.names), ('ids', model.extra['ids']),
+                        ('flags', model.extra['flags'])]:
+        expected_array = expected.names if name == 'names' else expected.extra[name]
+        array.validate(full=True)
+        assert array.equals(expected_array), name
+        assert array.null_count == expected_array.null_count
+    np.testing.assert_array_equal(model.extra['offsets'][0], expected.extra['offsets'][0])
+    assert model.extra['offsets'][1] == 'label'
+
+
+def attach_and_check(args):
+    name, template = args
+    block, model = attach_arrays(name, template)
+    check_model(model, make_model())
+    del model
+    block.close()
+    return True
+
+
+def test_arrays_round_trip_with_offsets_and_nulls():
+    with shared_arrays(make_model()) as (name, template):
+        block, model = attach_arrays(name, template)
+        check_model(model, make_model())
+        del model
+        block.close()
+
+
+def test_arrays_round_trip_in_workers():
+    with shared_arrays(make_model()) as (name, template):
+        with mp.Pool(2) as pool:
+            assert all(pool.map(attach_and_check, [(name, template)] * 4))
+
+
+def test_object_arrays_are_refused():
+    with pytest.raises(ValueError):
+        with shared_arrays({'values': np.array(['a', 1], dtype=object)}):
+            pass
+
+
+def test_pickle_round_trip():
+    obj = {'model': make_model(), 'seed': 7}
+    with shared_pickle(obj) as (name, size):
+        loaded = load_pickle(name, size)
+    # Unpickling makes copies, which are writable.
+    check_model(loaded['model'], make_model(), read_only=False)
+    assert loaded['seed'] == 7
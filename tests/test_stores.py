@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+import stores
+
+
+REGIONS = ['Hovedstaden', 'Midtjylland']
+
+
+def raise_error(error):
+    def load_region_index():
+        raise error
+    return load_region_index
+
+
+def test_missing_shapefile_leaves_stores_unweighted(monkeypatch):
+    monkeypatch.setattr(stores, 'load_region_index', raise_error(FileNotFoundError('shap')))
+
+    assert stores.get_store_region_weights('Denmark', REGIONS) is None
+    latitude, longitude = stores.generate_store_coordinates('Denmark', REGIONS)
+    assert np.isnan(latitude).all() and np.isnan(longitude).all()
+
+
+def test_other_shapefile_errors_propagate(monkeypatch):
+    monkeypatch.setattr(stores, 'load_region_index', raise_error(MemoryError()))
+
+    with pytest.raises(MemoryError):
+        stores.get_store_region_weights('Denmark', REGIONS)
+    with pytest.raises(MemoryError):
+        stores.generate_store_coordinates('Denmark', REGIONS)
@@ -0,0 +1,48 @@
+from datetime import datetime
+
+import pyarrow.parquet as pq
+
+from transactions import stream_random_transaction_data
+
+
+def stream_shards(tables, num_shards, reference_date, num_transactions=10_000):
+    for shard_index in range(num_shards):
+        save_to = stream_random_transaction_data(
+            num_transactions, batch_size=1_000, seed=3, shard_index=shard_index,
+            num_shards=num_shards, reference_date=reference_date, partition_by=['date'],
+            numb_days=30, **tables)
+    return pq.read_table(save_to)
+
+
+def test_sharded_run_replaces_previous_dataset(workdir, tables):
+    stream_shards(tables, 3, datetime(2024, 1, 31))
+    # Shards running in any order, with another number of shards.
+    transactions = stream_shards(tables, 4, datetime(2024, 6, 30))
+
+    assert transactions.num_rows == 10_000
+    dates = transactions['date'].cast('string').to_pylist()
+    assert min(dates) >= '2024-06-01'
+    assert transactions['transaction_id'].null_count == 0
+
+
+def test_sharded_run_matches_serial_run(workdir, tables):
+    sharded = stream_shards(tables, 3, datetime(2024, 1, 31))
+    serial = stream_shards(tables, 1, datetime(2024, 1, 31))
+
+    sort_keys = [('timestamp', 'ascending'), ('transaction_id', 'ascending'),
+                 ('product_id', 'ascending')]
+    assert sharded.sort_by(sort_keys).equals(serial.sort_by(sort_keys))
+
+
+def test_parallel_batches_match_serial_batches(tables):
+    from transactions import load_basket_model
+    from transactions import iter_transaction_batches
+
+    basket_model = load_basket_model(**tables, seed=3, reference_date=datetime(2024, 1, 31))
+    serial = list(iter_transaction_batches(basket_model, 30_000, batch_size=4_000, seed=3))
+    parallel = list(iter_transaction_batches(basket_model, 30_000, batch_size=4_000, seed=3,
+                                             numb_workers=3))
+
+    assert sum(batch.num_rows for batch in parallel) == 30_000
+    assert len(parallel) == len(serial)
+    assert all(left.equals(right) for left, right in zip(parallel, serial))
@@ -0,0 +1,29 @@
+import uuid
+
+import numpy as np
+import pyarrow as pa
+
+import value_pools
+from value_pools import generate_uuid4_array
+
+
+def test_uuid4_array_holds_canonical_uuids():
+    uuids = generate_uuid4_array(1000, np.random.default_rng(0))
+
+    assert uuids.type == pa.string()
+    assert len(set(uuids.to_pylist())) == 1000
+    for value in uuids.to_pylist()[:50]:
+        assert str(uuid.UUID(value)) == value
+        assert uuid.UUID(value).version == 4
+
+
+def test_uuid4_array_beyond_32_bit_offsets(monkeypatch):
+    monkeypatch.setattr(value_pools, 'MAX_STRING_BYTES', 36 * 100)
+
+    small = generate_uuid4_array(100, np.random.default_rng(0))
+    large = generate_uuid4_array(101, np.random.default_rng(0))
+
+    assert small.type == pa.string()
+    assert large.type == pa.large_string()
+    assert large.buffers()[1].size == 8 * 102
+    assert large.slice(0, 100).cast(pa.string()).equals(small)
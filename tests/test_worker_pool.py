@@ -0,0 +1,36 @@
+import os
+import multiprocessing as mp
+
+import numpy as np
+
+from helper_functions import imap_chunks
+
+
+worker_offset = None
+worker_inits = 0
+
+
+def init_offset(offset, payload):
+    global worker_offset, worker_inits
+    worker_offset = offset + len(payload)
+    worker_inits += 1
+
+
+def add_offset(value):
+    return os.getpid(), worker_inits, value + worker_offset
+
+
+def test_shared_pool_sets_workers_up_once_per_call():
+    payload = np.zeros(100_000)
+    with mp.Pool(2) as pool:
+        for offset in [10, 20]:
+            results = list(imap_chunks(add_offset, list(range(50)), init_offset,
+                                       (offset, payload), pool, max_pending=4))
+
+            assert [value for _, _, value in results] == [k + offset + 100_000
+                                                          for k in range(50)]
+            inits = {}
+            for pid, numb_inits, _ in results:
+                inits.setdefault(pid, set()).add(numb_inits)
+            # Each worker ran the initializer once for this call.
+            assert all(len(numb_inits) == 1 for numb_inits in inits.values())
@@ -0,0 +1,179 @@
+import re
+import numpy as np
+from datetime import date, datetime
+from typing import NamedTuple
+
+
+MINUTES_PER_DAY = 24 * 60
+DEFAULT_OPENING_HOURS = '8:00 AM - 9:00 PM'
+
+# Relative traffic from Monday to Sunday.
+WEEKDAY_WEIGHTS = np.array([0.85, 0.85, 0.9, 0.95, 1.15, 1.35, 0.95])
+
+# Relative traffic of fixed-date holidays, as (month, day): weight.
+HOLIDAY_WEIGHTS = {
+    (1, 1): 0.0,
+    (12, 24): 1.6,
+    (12, 25): 0.0,
+    (12, 26): 0.5,
+    (12, 31): 1.3,
+}
+BLACK_FRIDAY_WEIGHT = 2.5
+DECEMBER_WEIGHT = 1.25
+
+# Intraday peaks as (minute of the day, standard deviation in minutes, weight).
+INTRADAY_PEAKS = [(12 * 60 + 30, 60, 1.0), (17 * 60 + 30, 90, 1.6)]
+INTRADAY_BASE = 0.35
+
+
+class TimestampModel(NamedTuple):
+    """The precomputed CDFs timestamps are sampled from.
+
+    `minute_cdfs` holds one intraday CDF per opening hours profile: the CDF
+    of profile `p` is `minute_cdfs[p * MINUTES_PER_DAY:(p + 1) * MINUTES_PER_DAY] - p`.
+    Shifting each profile by its index keeps the array sorted, so all the
+    profiles are sampled with a single `searchsorted`.
+    """
+    first_day: np.datetime64
+    day_cdf: np.ndarray
+    minute_cdfs: np.ndarray
+    profiles: tuple
+
+
+def parse_opening_hours(opening_hours: str) -> tuple:
+    """Parses opening hours such as '8:00 AM - 9:00 PM'.
+
+    Parameters
+    ----------
+        opening_hours: the opening hours of a store
+
+    Returns
+    -------
+        open_minute, close_minute: the opening and closing minutes of the day
+    """
+    times = re.findall(r'(\d{1,2}):(\d{2})\s*([AaPp][Mm])?', opening_hours or '')
+    if len(times) != 2:
+        return parse_opening_hours(DEFAULT_OPENING_HOURS)
+    minutes = []
+    for hour, minute, period in times:
+        hour = int(hour) % 12 + (12 if period.upper() == 'PM' else 0) if period else int(hour)
+        minutes.append(hour * 60 + int(minute))
+    return tuple(minutes)
+
+
+def build_intraday_weights(open_minute: int, close_minute: int) -> np.ndarray:
+    """Returns the relative traffic of each minute of the day for a store.
+
+    Traffic is a base level plus a lunch and an evening peak, and zero when
+    the store is closed. Opening hours past midnight wrap around.
+
+    Parameters
+    ----------
+        open_minute: the opening minute of the day
+        close_minute: the closing minute of the day
+
+    Returns
+    -------
+        weights: an array of `MINUTES_PER_DAY` weights
+    """
+    minutes = np.arange(MINUTES_PER_DAY)
+    weights = np.full(MINUTES_PER_DAY, INTRADAY_BASE)
+    for peak, width, height in INTRADAY_PEAKS:
+        weights += height * np.exp(-0.5 * ((minutes - peak) / width) ** 2)
+    if open_minute < close_minute:
+        is_open = (minutes >= open_minute) & (minutes < close_minute)
+    elif open_minute > close_minute:
+        is_open = (minutes >= open_minute) | (minutes < close_minute)
+    else:
+        is_open = np.ones(MINUTES_PER_DAY, dtype=bool)
+    return np.where(is_open, weights, 0.0)
+
+
+def build_day_weights(first_day: np.datetime64, numb_days: int) -> np.ndarray:
+    """Returns the relative traffic of each day, from the day of the week,
+       holidays, Black Friday and the December peak.
+
+    Parameters
+    ----------
+        first_day: the first day
+        numb_days: the number of days
+
+    Returns
+    -------
+        weights: an array of `numb_days` weights
+    """
+    days = first_day + np.arange(numb_days)
+    # 1970-01-01 was a Thursday, the 3rd day of a Monday-first week.
+    weekday = (days.astype(np.int64) + 3) % 7
+    month = days.astype('datetime64[M]').astype(np.int64) % 12 + 1
+    day_of_month = (days - days.astype('datetime64[M]')).astype(np.int64) + 1
+
+    weights = WEEKDAY_WEIGHTS[weekday].copy()
+    weights[(month == 12) & (day_of_month < 24)] *= DECEMBER_WEIGHT
+    # Black Friday is the day after the fourth Thursday of November.
+    black_friday = (month == 11) & (weekday == 4) & (day_of_month >= 23) & (day_of_month <= 29)
+    weights[black_friday] *= BLACK_FRIDAY_WEIGHT
+    for (holiday_month, holiday_day), weight in HOLIDAY_WEIGHTS.items():
+        weights[(month == holiday_month) & (day_of_month == holiday_day)] = weight
+    return weights
+
+
+def build_timestamp_model(reference_date=None, opening_hours: list=None,
+                          numb_days: int=366) -> TimestampModel:
+    """Precomputes the day and intraday CDFs of the timestamps.
+
+    Parameters
+    ----------
+        reference_date: the last day timestamps can fall on, defaults to today
+        opening_hours: the distinct opening hours profiles of the stores
+        numb_days: the number of days, up to `reference_date`, covered
+
+    Returns
+    -------
+        timestamp_model: the precomputed CDFs
+    """
+    if reference_date is None:
+        reference_date = date.today()
+    if isinstance(reference_date, datetime):
+        reference_date = reference_date.date()
+    if opening_hours is None or len(opening_hours) == 0:
+        opening_hours = [DEFAULT_OPENING_HOURS]
+    profiles = tuple(opening_hours)
+
+    first_day = np.datetime64(reference_date, 'D') - (numb_days - 1)
+    day_weights = build_day_weights(first_day, numb_days)
+    if not day_weights.any():
+        # Only holidays, e.g. a single day run on the 25th of December.
+        day_weights = np.ones(numb_days)
+    day_cdf = np.cumsum(day_weights)
+    minute_cdfs = []
+    for p, profile in enumerate(profiles):
+        cdf = np.cumsum(build_intraday_weights(*parse_opening_hours(profile)))
+        minute_cdfs.append(cdf / cdf[-1] + p)
+    return TimestampModel(first_day, day_cdf / day_cdf[-1], np.concatenate(minute_cdfs), profiles)
+
+
+def sample_timestamps(timestamp_model: TimestampModel, profile_idx: np.ndarray,
+                      rng: np.random.Generator) -> np.ndarray:
+    """Samples one timestamp per entry of `profile_idx`.
+
+    Parameters
+    ----------
+        timestamp_model: the precomputed CDFs
+        profile_idx: the opening hours profile of each timestamp
+        rng: the random generator to use
+
+    Returns
+    -------
+        timestamps: an array of datetime64[us]
+    """
+    numb_timestamps = len(profile_idx)
+    day = np.searchsorted(timestamp_model.day_cdf, rng.random(numb_timestamps), side='right')
+    day = day.clip(max=len(timestamp_model.day_cdf) - 1)
+    minute = np.searchsorted(timestamp_model.minute_cdfs, profile_idx + rng.random(numb_timestamps),
+                             side='right') - profile_idx * MINUTES_PER_DAY
+    minute = minute.clip(0, MINUTES_PER_DAY - 1)
+    microseconds = rng.integers(0, 60_000_000, size=numb_timestamps)
+
+    timestamps = (timestamp_model.first_day + day).astype('datetime64[us]')
+    return timestamps + (minute * 60_000_000 + microseconds).astype('timedelta64[us]')
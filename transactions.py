@@ -1,77 +1,633 @@
-import uuid
-import random
-import pandas as pd
+import os
+import numpy as np
 from tqdm import tqdm
-from faker import Faker
 import pyarrow as pa
+import pyarrow.compute as pc
 from pathlib import Path
 import pyarrow.parquet as pq
-from datetime import datetime, timedelta
-from products import generate_random_product_data
-from helper_functions import save_data
-fake = Faker()
+import multiprocessing as mp
+from typing import NamedTuple
+from datetime import datetime
+from helper_functions import save_table
+from helper_functions import table_to_pandas
+from helper_functions import save_batches
+from helper_functions import split_into_chunks
+from helper_functions import derive_chunk_seeds
+from helper_functions import get_chunk_tasks
+from helper_functions import get_shard_chunks
+from helper_functions import build_alias_table
+from helper_functions import sample_alias
+from helper_functions import imap_chunks
+from value_pools import generate_uuid4_array
+from timestamps import build_timestamp_model
+from timestamps import sample_timestamps
+from instrumentation import phase
+from pricing import convert_from_usd
+from shared_arrays import shared_arrays
+from shared_arrays import attach_arrays
+
+
+TRANSACTION_SCHEMA = pa.schema([
+    ('transaction_id', pa.string()),
+    ('customer_id', pa.string()),
+    ('store_id', pa.string()),
+    ('timestamp', pa.timestamp('us')),
+    ('product_id', pa.string()),
+    ('product_name', pa.string()),
+    ('quantity', pa.int64()),
+    ('price', pa.float64()),
+    ('exchange_rate', pa.float64()),
+    ('currency', pa.string()),
+    ('inflation_rate', pa.float64()),
+    ('total', pa.float64()),
+])
+
+# The columns the basket model reads from each table.
+BASKET_COLUMNS = {
+    'products': ['product_id', 'product_name', 'price_in_usd', 'exchange_rate', 'currency',
+                 'inflation_rate'],
+    'customers': ['customer_id', 'purchase_frequency'],
+    'stores': ['store_id', 'number_of_employees', 'opening_hours'],
+}
+
+# The key columns of the products, memory-mapped by the basket model.
+PRODUCT_LOOKUP_PATH = 'retail_data/product_lookup.arrow'
+
+# Exponent of the Zipf law of product popularity.
+ZIPF_EXPONENT = 1.1
+MEAN_BASKET_SIZE = 4.0
+# Quantities are uniform from 1 to this, as in the row by row generator.
+MAX_QUANTITY = 30
+
+
+class BasketModel(NamedTuple):
+    """The arrays and alias tables the baskets are drawn from.
+
+    The product columns are gathered by index, and the products, customers
+    and stores are drawn through their alias tables in constant time.
+    `store_profiles` is the opening hours profile of each store in the
+    timestamp model.
+    """
+    products: dict
+    product_alias: tuple
+    customer_ids: np.ndarray
+    customer_alias: tuple
+    store_ids: np.ndarray
+    store_alias: tuple
+    store_profiles: np.ndarray
+    timestamp_model: tuple
+
+
+def get_column(table, name: str) -> pa.Array:
+    """Returns a column of a pyarrow Table or a pandas DataFrame as a single
+       Arrow array, with dictionaries decoded and large strings as strings.
+    """
+    column = table.column(name) if isinstance(table, pa.Table) else pa.array(table[name])
+    if isinstance(column, pa.ChunkedArray):
+        column = column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+    if pa.types.is_dictionary(column.type):
+        column = column.dictionary_decode()
+    if pa.types.is_large_string(column.type):
+        column = column.cast(pa.string())
+    return column
+
+
+def get_numeric_column(table, name: str) -> np.ndarray:
+    """Returns a numeric column of a pyarrow Table or a pandas DataFrame as
+       a float NumPy array, with NaN for the missing values.
+    """
+    column = get_column(table, name)
+    if column.type != pa.float64():
+        column = column.cast(pa.float64())
+    return column.to_numpy(zero_copy_only=False)
+
+
+def build_basket_model(products: pa.Table,
+                       customers: pa.Table = None,
+                       stores: pa.Table = None,
+                       seed: int = None,
+                       reference_date: datetime = None,
+                       zipf_exponent: float = ZIPF_EXPONENT,
+                       numb_days: int = 366) -> BasketModel:
+    """Precomputes everything the baskets are drawn from.
+
+    Product popularity follows a Zipf law over a random ranking of the
+    products, customers are weighted by their `purchase_frequency` and
+    stores by their `number_of_employees`. Timestamps follow the opening
+    hours of the stores, see `timestamps.build_timestamp_model`.
+
+    The string columns are kept as Arrow arrays and gathered with `take`.
+
+    Parameters
+    ----------
+        products: the products to sample from, a pyarrow Table or a pandas
+                  DataFrame
+        customers: the customers to sample from, baskets have no customer if None
+        stores: the stores to sample from, baskets have no store if None
+        seed: the seed of the run, the product ranking is drawn from it
+        reference_date: the last day of the timestamps, defaults to today
+        zipf_exponent: the exponent of the product popularity
+        numb_days: the number of days, up to `reference_date`, the
+                   timestamps cover
+
+    Returns
+    -------
+        basket_model: the precomputed arrays and alias tables
+    """
+    rng = np.random.default_rng(derive_chunk_seeds(seed, 'product_popularity', 1)[0])
+    ranks = rng.permutation(len(products)) + 1
+    product_columns = {
+        'product_id': get_column(products, 'product_id'),
+        'product_name': get_column(products, 'product_name'),
+        'price_in_usd': get_numeric_column(products, 'price_in_usd'),
+        'exchange_rate': get_numeric_column(products, 'exchange_rate'),
+        'currency': get_column(products, 'currency'),
+        'inflation_rate': get_numeric_column(products, 'inflation_rate'),
+    }
+
+    if customers is not None and len(customers):
+        customer_ids = get_column(customers, 'customer_id')
+        customer_alias = build_alias_table(get_numeric_column(customers, 'purchase_frequency'))
+    else:
+        customer_ids, customer_alias = pa.nulls(1, pa.string()), build_alias_table([1.0])
+
+    if stores is not None and len(stores):
+        store_ids = get_column(stores, 'store_id')
+        store_alias = build_alias_table(get_numeric_column(stores, 'number_of_employees'))
+        opening_hours = get_column(stores, 'opening_hours').to_numpy(zero_copy_only=False)
+        profiles, store_profiles = np.unique(opening_hours.astype(str), return_inverse=True)
+    else:
+        store_ids, store_alias = pa.nulls(1, pa.string()), build_alias_table([1.0])
+        profiles, store_profiles = None, np.zeros(1, dtype=np.int64)
+
+    return BasketModel(product_columns, build_alias_table(ranks ** -zipf_exponent),
+                       customer_ids, customer_alias, store_ids, store_alias, store_profiles,
+                       build_timestamp_model(reference_date, profiles, numb_days))
+
+
+def draw_basket_sizes(num_transactions: int, rng: np.random.Generator,
+                      mean_basket_size: float = MEAN_BASKET_SIZE) -> np.ndarray:
+    """Draws basket sizes adding up to exactly `num_transactions` lines.
+
+    Sizes are 1 plus a Poisson draw, and the last basket is cut so the
+    total matches.
+
+    Parameters
+    ----------
+        num_transactions: the total number of transaction lines
+        rng: the random generator to use
+        mean_basket_size: the mean number of lines per basket
+
+    Returns
+    -------
+        sizes: the number of lines of each basket
+    """
+    sizes = 1 + rng.poisson(mean_basket_size - 1, size=int(num_transactions / mean_basket_size) + 16)
+    while sizes.sum() < num_transactions:
+        sizes = np.concatenate([sizes, 1 + rng.poisson(mean_basket_size - 1, size=len(sizes))])
+    ends = np.cumsum(sizes)
+    numb_baskets = np.searchsorted(ends, num_transactions) + 1
+    sizes = sizes[:numb_baskets]
+    sizes[-1] -= ends[numb_baskets - 1] - num_transactions
+    return sizes
+
+
+def generate_transaction_batch(basket_model: BasketModel,
+                               num_transactions: int,
+                               rng: np.random.Generator = None,
+                               mean_basket_size: float = MEAN_BASKET_SIZE) -> pa.RecordBatch:
+    """Generates a batch of transaction lines, grouped in baskets, in a
+       single vectorized pass.
+
+    Each basket gets a unique transaction id, a customer, a store and a
+    timestamp shared by its lines, and each line a product drawn by
+    popularity. The product attributes are gathered by index.
+
+    Parameters
+    ----------
+        basket_model: the arrays and alias tables to draw from
+        num_transactions: the number of transaction lines to generate
+        rng: the random generator to use, a new one is created if None
+        mean_basket_size: the mean number of lines per basket
+
+    Returns
+    -------
+        batch: the transactions as a pyarrow RecordBatch following
+               `TRANSACTION_SCHEMA`
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    sizes = draw_basket_sizes(num_transactions, rng, mean_basket_size)
+    numb_baskets = len(sizes)
+    basket = np.repeat(np.arange(numb_baskets), sizes)
+    basket_ids = generate_uuid4_array(numb_baskets, rng)
+    customer_idx = sample_alias(*basket_model.customer_alias, numb_baskets, rng)
+    store_idx = sample_alias(*basket_model.store_alias, numb_baskets, rng)
+    timestamps = sample_timestamps(basket_model.timestamp_model,
+                                   basket_model.store_profiles[store_idx], rng)
+
+    product_idx = sample_alias(*basket_model.product_alias, num_transactions, rng)
+    quantity = rng.integers(1, MAX_QUANTITY + 1, size=num_transactions)
+
+    products = basket_model.products
+    exchange_rate = products['exchange_rate'][product_idx]
+
+    # Products without an exchange rate are kept in USD.
+    price, has_rate = convert_from_usd(products['price_in_usd'][product_idx], exchange_rate)
+    price = np.round(price, 2)
+    currency = pc.if_else(pa.array(has_rate), products['currency'].take(product_idx), 'USD')
+
+    return pa.RecordBatch.from_arrays([
+        basket_ids.take(basket),
+        basket_model.customer_ids.take(customer_idx[basket]),
+        basket_model.store_ids.take(store_idx[basket]),
+        pa.array(timestamps[basket], pa.timestamp('us')),
+        products['product_id'].take(product_idx),
+        products['product_name'].take(product_idx),
+        pa.array(quantity, pa.int64()),
+        pa.array(price, pa.float64()),
+        pa.array(exchange_rate, pa.float64(), from_pandas=True),
+        currency,
+        pa.array(products['inflation_rate'][product_idx], pa.float64(), from_pandas=True),
+        pa.array(np.round(quantity * price, 2), pa.float64()),
+    ], schema=TRANSACTION_SCHEMA)
+
+
+worker_block = None
+worker_basket_model = None
+
+
+def init_transaction_worker(name: str, template) -> None:
+    """Attaches a worker to the basket model shared by the parent process,
+       see `shared_arrays.shared_arrays`.
+    """
+    global worker_block, worker_basket_model
+    worker_basket_model = None
+    if worker_block is not None:
+        try:
+            worker_block.close()
+        except BufferError:
+            # Arrays of the previous model are still referenced, the block
+            # is closed with them.
+            pass
+    worker_block, worker_basket_model = attach_arrays(name, template)
+
+
+def generate_transaction_chunk(args) -> pa.RecordBatch:
+    """Generates the transactions of one batch on a worker.
+
+    Parameters
+    ----------
+        args: a tuple of (num_transactions, seed)
+
+    Returns
+    -------
+        batch: the transactions as a pyarrow RecordBatch
+    """
+    num_transactions, seed = args
+    return generate_transaction_batch(worker_basket_model, num_transactions,
+                                      np.random.default_rng(seed))
+
+
+def iter_transaction_batches(basket_model: BasketModel,
+                             num_transactions: int,
+                             batch_size: int = 1_000_000,
+                             seed: int = None,
+                             shard_index: int = 0,
+                             num_shards: int = 1,
+                             first_chunk: int = 0,
+                             numb_workers: int = None,
+                             pool: mp.Pool = None):
+    """Yields transactions as fixed-size Arrow record batches.
+
+    Each batch has its own random stream derived from `seed` and the index
+    of the batch, so the batches of a shard are the same as the
+    corresponding batches of a serial run. Baskets never span two batches.
+
+    With several workers, the basket model is copied once into shared
+    memory and every worker attaches to it without copying. The workers
+    generate disjoint batches, at most two each ahead of the consumer,
+    and the batches are yielded in order, the same as a serial run.
+
+    Parameters
+    ----------
+        basket_model: the arrays and alias tables to draw from
+        num_transactions: the total number of transactions to generate
+        batch_size: the number of transactions per batch
+        seed: the seed of the run, a random one is used if None
+        shard_index: the index of the shard to generate
+        num_shards: the number of shards the transactions are split into
+        first_chunk: the index of the first batch, to continue the
+                     transactions of a previous run with new seeds
+        numb_workers: the number of worker processes, the batches are
+                      generated in this process if None or 1
+        pool: a process pool to run on, e.g. shared by several countries,
+              a pool of `numb_workers` is created if None
+
+    Yields
+    ------
+        batch: a pyarrow RecordBatch following `TRANSACTION_SCHEMA`
+    """
+    chunk_tasks = get_chunk_tasks(num_transactions, batch_size, seed, 'transactions',
+                                  shard_index, num_shards, first_chunk)
+    if pool is None and (numb_workers or 1) <= 1:
+        for start, stop, chunk_seed, _ in chunk_tasks:
+            rng = np.random.default_rng(chunk_seed)
+            with phase('generate_rows', stop - start):
+                batch = generate_transaction_batch(basket_model, stop - start, rng)
+            yield batch
+        return
+
+    tasks = [(stop - start, chunk_seed) for start, stop, chunk_seed, _ in chunk_tasks]
+    with shared_arrays(basket_model) as (name, template):
+        results = imap_chunks(generate_transaction_chunk, tasks, init_transaction_worker,
+                              (name, template), pool, numb_workers,
+                              max_pending=2 * (numb_workers or mp.cpu_count()))
+        for start, stop, _, _ in chunk_tasks:
+            # Only the wait for the workers is timed in this process.
+            with phase('generate_rows', stop - start):
+                batch = next(results)
+            yield batch
+        results.close()
+
+
+def add_date_column(batch: pa.RecordBatch) -> pa.RecordBatch:
+    """Adds the `date` of the timestamps to a batch, to partition by day.
+    """
+    date = batch.column(batch.schema.get_field_index('timestamp')).cast(pa.date32())
+    return pa.RecordBatch.from_arrays(batch.columns + [date], names=batch.schema.names + ['date'])
+
+
+def add_constant_columns(batch: pa.RecordBatch, columns: dict) -> pa.RecordBatch:
+    """Adds string columns with the same value on every row to a batch,
+       e.g. the country of a multi-country dataset.
+    """
+    arrays = [pa.repeat(pa.scalar(value, pa.string()), batch.num_rows) for value in columns.values()]
+    return pa.RecordBatch.from_arrays(batch.columns + arrays,
+                                      names=batch.schema.names + list(columns))
+
+
+def load_table(file_name: str, columns: list = None) -> pa.Table:
+    """Loads a table saved in `retail_data`, or returns None if it was
+       not generated.
+
+    Parameters
+    ----------
+        file_name: the name of the parquet file or directory in `retail_data`
+        columns: the columns to read, all of them if None
+
+    Returns
+    -------
+        table: the table as a pyarrow Table, or None
+    """
+    file_path = Path('retail_data') / file_name
+    if not file_path.exists():
+        return None
+    return pq.read_table(file_path, columns=columns)
+
+
+def write_product_lookup(products: pa.Table, file_path: str = PRODUCT_LOOKUP_PATH) -> Path:
+    """Writes the columns of the products the baskets need as a single
+       uncompressed record batch in an Arrow IPC file.
+
+    Parameters
+    ----------
+        products: the products, a pyarrow Table or a pandas DataFrame
+        file_path: the path of the lookup file
+
+    Returns
+    -------
+        file_path: the path of the written lookup file
+    """
+    arrays = [get_column(products, name) for name in BASKET_COLUMNS['products']]
+    arrays = [array.cast(pa.float64()) if pa.types.is_integer(array.type) else array
+              for array in arrays]
+    batch = pa.RecordBatch.from_arrays(arrays, names=BASKET_COLUMNS['products'])
+
+    file_path = Path(file_path)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = file_path.with_name(f'{file_path.name}.{os.getpid()}.tmp')
+    with pa.OSFile(str(tmp_path), 'wb') as sink:
+        with pa.ipc.new_file(sink, batch.schema) as writer:
+            writer.write_batch(batch)
+    os.replace(tmp_path, file_path)
+    return file_path
+
+
+def load_product_lookup(file_path: str = PRODUCT_LOOKUP_PATH,
+                        products_path: str = 'retail_data/products.parquet') -> pa.Table:
+    """Memory-maps the product lookup file, writing it first from
+       `products_path` if it is missing or older than the products.
+
+    The arrays point into the mapped file, so every process using the
+    lookup shares the same pages of the OS page cache instead of holding
+    its own copy of the products.
+
+    Parameters
+    ----------
+        file_path: the path of the lookup file
+        products_path: the products the lookup is built from
+
+    Returns
+    -------
+        products: the key columns of the products, or None if there are no
+                  products
+    """
+    file_path, products_path = Path(file_path), Path(products_path)
+    if products_path.exists():
+        if not file_path.exists() or file_path.stat().st_mtime_ns < products_path.stat().st_mtime_ns:
+            write_product_lookup(pq.read_table(products_path, columns=BASKET_COLUMNS['products']),
+                                 file_path)
+    elif not file_path.exists():
+        return None
+    return pa.ipc.open_file(pa.memory_map(str(file_path), 'r')).read_all()
+
+
+def load_basket_model(products: pa.Table = None,
+                      customers: pa.Table = None,
+                      stores: pa.Table = None,
+                      seed: int = None,
+                      reference_date: datetime = None,
+                      numb_days: int = 366) -> BasketModel:
+    """Builds the basket model from the given tables, reading the columns
+       it needs of the missing ones from `retail_data`. The products are
+       memory-mapped, see `load_product_lookup`.
+    """
+    if products is None:
+        products = load_product_lookup()
+    if customers is None:
+        customers = load_table('customers.parquet', BASKET_COLUMNS['customers'])
+    if stores is None:
+        stores = load_table('stores.parquet', BASKET_COLUMNS['stores'])
+    return build_basket_model(products, customers, stores, seed, reference_date,
+                              numb_days=numb_days)
+
+
+def stream_random_transaction_data(num_transactions: int,
+                                   batch_size: int = 1_000_000,
+                                   row_group_size: int = 1_000_000,
+                                   seed: int = None,
+                                   shard_index: int = 0,
+                                   num_shards: int = 1,
+                                   reference_date: datetime = None,
+                                   products: pa.Table = None,
+                                   customers: pa.Table = None,
+                                   stores: pa.Table = None,
+                                   file_name: str = 'transactions.parquet',
+                                   partition_by: list = None,
+                                   numb_days: int = 366,
+                                   first_chunk: int = 0,
+                                   append: bool = False,
+                                   constant_columns: dict = None,
+                                   numb_workers: int = None,
+                                   pool: mp.Pool = None) -> Path:
+    """Generates transactions batch by batch and streams them to
+       `retail_data/file_name`.
+
+    Only one batch and one row group are held in memory at a time, so
+    the peak memory does not depend on `num_transactions`.
+
+    With `partition_by`, e.g. ['date'], the transactions are written as a
+    Hive partitioned dataset folder `retail_data/file_name`, `date` being
+    the day of the timestamp. Sharded and appending runs then add their
+    own files to the dataset, named after their first batch. Each shard of
+    a sharded run removes the files it replaces from every partition
+    before writing its own, see `helper_functions.remove_stale_parts`, so
+    no file of a previous run is left whatever order the shards run in.
+
+    Parameters
+    ----------
+        num_transactions : the number of transaction lines to generate
+        batch_size: the number of transactions generated per batch
+        row_group_size: the number of rows per parquet row group
+        seed: the seed of the run, a random one is used if None
+        shard_index: the index of the shard to generate
+        num_shards: the number of shards the transactions are split into
+        reference_date: the last day of the timestamps, defaults to today.
+                        Shards of the same dataset must share it
+        products, customers, stores: the tables to draw from, pyarrow Tables
+                                     or pandas DataFrames, read from
+                                     `retail_data` if None
+        file_name: the name of the file to write in `retail_data`, a `.csv`
+                   extension writes csv instead of parquet
+        partition_by: the columns to partition the dataset by, if any
+        numb_days: the number of days, up to `reference_date`, the
+                   timestamps cover
+        first_chunk: the index of the first batch, to continue the
+                     transactions of a previous run with new seeds
+        append: whether to add the transactions to the existing dataset,
+                which requires `partition_by`, instead of replacing it
+        constant_columns: columns with the same value on every row added to
+                          the batches, e.g. {'country': 'Denmark'} to
+                          partition a multi-country dataset by country
+        numb_workers: the number of worker processes generating the
+                      batches, in this process if None or 1
+        pool: a process pool to run on, e.g. shared by several countries
+
+    Returns
+    -------
+        the path of the written file or dataset
+    """
+    if append and not partition_by:
+        raise ValueError('Appending transactions requires a partitioned dataset')
+    basket_model = load_basket_model(products, customers, stores, seed, reference_date,
+                                     numb_days)
+    numb = f'{num_transactions:,}'.replace(',', ' ')
+
+    batches = iter_transaction_batches(basket_model, num_transactions, batch_size,
+                                       seed, shard_index, num_shards, first_chunk,
+                                       numb_workers, pool)
+    shard_chunks = get_shard_chunks(split_into_chunks(num_transactions, batch_size),
+                                    shard_index, num_shards)
+    batches = tqdm(batches, desc=f"Streaming {numb} transactions", total=len(shard_chunks),
+                   unit='batch')
+    schema = TRANSACTION_SCHEMA
+    if constant_columns:
+        for name in constant_columns:
+            schema = schema.append(pa.field(name, pa.string()))
+        batches = (add_constant_columns(batch, constant_columns) for batch in batches)
+    if not partition_by:
+        return save_batches(batches, file_name, schema, row_group_size)
+
+    if 'date' in partition_by:
+        schema = schema.append(pa.field('date', pa.date32()))
+        batches = (add_date_column(batch) for batch in batches)
+    basename_template, shard_prefixes = None, None
+    if num_shards > 1 or append:
+        chunks = split_into_chunks(num_transactions, batch_size)
+        if not shard_chunks:
+            # More shards than batches, this one has nothing to write.
+            return Path('retail_data') / file_name
+        first_batch = first_chunk + shard_chunks[0][0]
+        basename_template = f'part-{first_batch:08d}-{{i}}{Path(file_name).suffix}'
+        if not append:
+            shard_prefixes = [f'part-{first_chunk + k:08d}-' for k in
+                              sorted({len(chunks) * shard // num_shards
+                                      for shard in range(num_shards)})]
+    return save_batches(batches, file_name, schema, row_group_size,
+                        partition_cols=partition_by, basename_template=basename_template,
+                        shard_prefixes=shard_prefixes)
 
 
 def generate_random_transaction_data(num_transactions: int,
-                                     numb_unique_ids: int,
-                                     is_saved: bool = False):
+                                     is_saved: bool = False,
+                                     batch_size: int = 1_000_000,
+                                     seed: int = None,
+                                     shard_index: int = 0,
+                                     num_shards: int = 1,
+                                     reference_date: datetime = None,
+                                     products: pa.Table = None,
+                                     customers: pa.Table = None,
+                                     stores: pa.Table = None,
+                                     as_arrow: bool = False,
+                                     numb_workers: int = None):
     """Generate a list of transactions for customers.
 
+    Transactions are baskets of lines: a basket has one transaction id,
+    customer, store and timestamp, and one product per line.
+
     Parameters
     ----------
-        products : a list of product as a dictionaries
-        num_transactions : the number of transactions to generate
+        num_transactions : the number of transaction lines to generate
+        is_saved: whether to save the generated data or not.
+                  if True, the data will be saved as `transactions.parquet`
+        batch_size: the number of transactions generated per batch. The same
+                    seed and batch size always give the same transactions
+        seed: the seed of the run, a random one is used if None
+        shard_index: the index of the shard to generate
+        num_shards: the number of shards the transactions are split into
+        reference_date: the last day of the timestamps, defaults to today.
+                        Shards of the same dataset must share it
+        products, customers, stores: the tables to draw from, pyarrow Tables
+                                     or pandas DataFrames, read from
+                                     `retail_data` if None
+        as_arrow: whether to return a pyarrow Table instead of a pandas
+                  DataFrame
+        numb_workers: the number of worker processes generating the
+                      batches, in this process if None or 1
 
     Returns
     -------
-        a list of transactions as dictionaries
+        the transactions as a pandas DataFrame or a pyarrow Table
     """
-    file_path = Path('retail_data/products.parquet')
-    products = pd.read_parquet(file_path)
-    m = len(products)
-    transactions = []
+    basket_model = load_basket_model(products, customers, stores, seed, reference_date)
     numb = f'{num_transactions:,}'.replace(',', ' ')
 
-    unique_ids = [str(uuid.uuid4()) for _ in range(numb_unique_ids)]
-    for k in tqdm(range(num_transactions), desc=f"Generating {numb} transactions"):
-        transaction_id = random.choice(unique_ids)
-        timestamp = datetime.now() - timedelta(days=random.randint(0, 365))
-        quantity = random.randint(1, 30)
-        random_product_row = products.sample(n=1)
+    batches = iter_transaction_batches(basket_model, num_transactions, batch_size,
+                                       seed, shard_index, num_shards,
+                                       numb_workers=numb_workers)
+    total = len(get_shard_chunks(split_into_chunks(num_transactions, batch_size),
+                                 shard_index, num_shards))
+    batches = list(tqdm(batches, desc=f"Generating {numb} transactions", total=total,
+                        unit='batch'))
+    transactions = pa.Table.from_batches(batches, TRANSACTION_SCHEMA)
 
-        try:
-            price = (random_product_row.iloc[0]['price_in_usd'])/(random_product_row.iloc[0]['exchange_rate'])
-            total = round(quantity * random_product_row.iloc[0]['price_in_usd']/random_product_row.iloc[0]['exchange_rate'], 2)
-            currency = random_product_row.iloc[0]['currency']
-            exchange_rate = random_product_row.iloc[0]['exchange_rate']
-        except TypeError:
-            price = random_product_row.iloc[0]['price_in_usd']
-            exchange_rate = None
-            total = round(quantity * random_product_row.iloc[0]['price_in_usd'], 2)
-            currency = 'USD'
-
-        transaction = {
-            'transaction_id': transaction_id,
-            'timestamp': timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-            'product_id': random_product_row.iloc[0]['product_id'],
-            'product_name': random_product_row.iloc[0]['product_name'],
-            'quantity': quantity,
-            'price': price,
-            'exchange_rate': exchange_rate,
-            'currency': currency,
-            'inflation_rate': random_product_row.iloc[0]['inflation_rate'],
-            'total': total
-        }
-        transactions.append(transaction)
-
-    df_transactions = pd.DataFrame(transactions)
     if is_saved:
-        save_data(df_transactions, 'transactions.parquet')
-    return df_transactions
+        save_table(transactions, 'transactions.parquet')
+    return transactions if as_arrow else table_to_pandas(transactions)
 
 
 
 if __name__ == "__main__":
     generate_random_transaction_data(10, is_saved=True)
-
-
@@ -0,0 +1,170 @@
+import numpy as np
+import pyarrow as pa
+from pathlib import Path
+import pyarrow.parquet as pq
+
+from instrumentation import instrumented
+
+
+VALUE_POOLS_DIR = '.cache/value_pools'
+# The most bytes of text a string array, with 32 bit offsets, can hold.
+MAX_STRING_BYTES = 2 ** 31 - 1
+
+_value_pool_cache = {}
+_faker_cache = {}
+_hex_digits = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
+
+
+def get_faker(locale: str='en_US'):
+    """Returns the Faker instance of a locale, created on first use so
+       importing the generators doesn't load Faker.
+    """
+    if locale not in _faker_cache:
+        from faker import Faker
+
+        _faker_cache[locale] = Faker(locale)
+    return _faker_cache[locale]
+
+
+def build_value_pool(provider: str, size: int, locale: str='en_US', seed: int=0) -> np.ndarray:
+    """Generates up to `size` unique values with a Faker provider.
+
+    Providers with a small number of possible values, e.g. cities, may
+    return fewer than `size` values.
+
+    Parameters
+    ----------
+        provider: the name of the Faker provider, e.g. 'company'
+        size: the number of values to generate
+        locale: the Faker locale
+        seed: the seed of the Faker instance
+
+    Returns
+    -------
+        values: an array of unique strings
+    """
+    fake = get_faker(locale)
+    fake.seed_instance(seed)
+    generate = getattr(fake, provider)
+    values = set()
+    for _ in range(10 * size):
+        values.add(str(generate()))
+        if len(values) == size:
+            break
+    return np.array(sorted(values), dtype=object)
+
+
+def load_value_pool(provider: str, size: int, locale: str='en_US', seed: int=0,
+                    cache_dir: str=VALUE_POOLS_DIR) -> np.ndarray:
+    """Returns a pool of values for a Faker provider.
+
+    Pools are cached in memory and on disk in
+    `cache_dir/<locale>/<provider>-<size>-<seed>.parquet`, so they are only
+    generated once per provider, locale, size and seed.
+
+    Parameters
+    ----------
+        provider: the name of the Faker provider, e.g. 'company'
+        size: the number of values in the pool
+        locale: the Faker locale
+        seed: the seed of the Faker instance
+        cache_dir: the folder the pools are cached in
+
+    Returns
+    -------
+        values: an Arrow array of unique strings
+    """
+    file_path = Path(cache_dir) / locale / f'{provider}-{size}-{seed}.parquet'
+    if file_path in _value_pool_cache:
+        return _value_pool_cache[file_path]
+
+    if file_path.exists():
+        values = pq.read_table(file_path).column('value').combine_chunks()
+    else:
+        values = pa.array(build_value_pool(provider, size, locale, seed), pa.string())
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        pq.write_table(pa.table({'value': values}), file_path)
+    _value_pool_cache[file_path] = values
+    return values
+
+
+@instrumented('config_load')
+def load_value_pools(providers: list, size: int, locale: str='en_US', seed: int=0,
+                     cache_dir: str=VALUE_POOLS_DIR) -> dict:
+    """Returns the pools of several Faker providers.
+
+    Parameters
+    ----------
+        providers: the names of the Faker providers
+        size: the number of values per pool
+        locale: the Faker locale
+        seed: the seed of the Faker instances
+        cache_dir: the folder the pools are cached in
+
+    Returns
+    -------
+        value_pools: a dict mapping each provider to its pool
+    """
+    return {provider: load_value_pool(provider, size, locale, seed, cache_dir)
+            for provider in providers}
+
+
+def draw_from_pool(values: pa.Array, numb_values: int, rng: np.random.Generator,
+                   weights: np.ndarray = None) -> pa.Array:
+    """Draws values, with replacement, from a pool.
+
+    The values are gathered by Arrow, so strings are copied buffer to
+    buffer without going through Python objects.
+
+    Parameters
+    ----------
+        values: the pool to draw from, an Arrow array or a sequence
+        numb_values: the number of values to draw
+        rng: the random generator to use
+        weights: the probability of each value, uniform if None
+
+    Returns
+    -------
+        values: the drawn values as an Arrow array
+    """
+    if not isinstance(values, pa.Array):
+        values = pa.array(values)
+    if weights is not None:
+        return values.take(rng.choice(len(values), size=numb_values, p=weights))
+    return values.take(rng.integers(0, len(values), size=numb_values))
+
+
+def generate_uuid4_array(numb_values: int, rng: np.random.Generator) -> pa.Array:
+    """Generates random uuid4 strings in bulk from random bytes.
+
+    The hex digits are written into one buffer that backs the Arrow
+    array directly, no Python string is created. Beyond
+    `MAX_STRING_BYTES` of text, about 59.6M uuids, the 32 bit offsets of a
+    string array would overflow and a large string array is returned.
+
+    Parameters
+    ----------
+        numb_values: the number of uuids to generate
+        rng: the random generator to use
+
+    Returns
+    -------
+        uuids: an Arrow string or large string array of canonical uuid4
+               strings
+    """
+    raw = np.frombuffer(rng.bytes(16 * numb_values), dtype=np.uint8).reshape(numb_values, 16).copy()
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40  # version 4
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80  # RFC 4122 variant
+
+    digits = np.empty((numb_values, 32), dtype=np.uint8)
+    digits[:, 0::2] = _hex_digits[raw >> 4]
+    digits[:, 1::2] = _hex_digits[raw & 0x0F]
+    text = np.full((numb_values, 36), ord('-'), dtype=np.uint8)
+    for start, stop, offset in ((0, 8, 0), (9, 13, 8), (14, 18, 12), (19, 23, 16), (24, 36, 20)):
+        text[:, start:stop] = digits[:, offset:offset + stop - start]
+    if 36 * numb_values > MAX_STRING_BYTES:
+        offsets = np.arange(0, 36 * (numb_values + 1), 36, dtype=np.int64)
+        return pa.LargeStringArray.from_buffers(numb_values, pa.py_buffer(offsets),
+                                                pa.py_buffer(text))
+    offsets = np.arange(0, 36 * (numb_values + 1), 36, dtype=np.int32)
+    return pa.StringArray.from_buffers(numb_values, pa.py_buffer(offsets), pa.py_buffer(text))